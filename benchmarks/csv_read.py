@@ -0,0 +1,31 @@
+"""
+Measures the time it takes to read a large instrument export with Csv, as returned by
+`local_shared_file(..., is_csv=True)`, compared to CsvTable.
+
+Run with clarity-ext installed (e.g. `pip install -e .`):
+    python benchmarks/csv_read.py
+"""
+from __future__ import print_function
+import timeit
+from StringIO import StringIO
+from clarity_ext.service.file_service import Csv, CsvTable
+
+HEADER = ["Well", "Sample", "Conc", "Volume"] + ["Extra {}".format(i) for i in range(10)]
+ROWS = [["A{}".format(i), "Sample {}".format(i), str(i * 0.5), "20"] + ["x"] * 10 for i in range(50000)]
+CONTENT = "\r\n".join(",".join(row) for row in [HEADER] + ROWS)
+
+
+def read_csv():
+    csv = Csv(StringIO(CONTENT))
+    return [float(line["Conc"]) for line in csv]
+
+
+def read_csv_table():
+    return CsvTable.read(StringIO(CONTENT), columns=["Well", "Conc"], types={"Conc": float}).column("Conc")
+
+
+assert read_csv() == read_csv_table()
+number = 5
+for caption, fn in [("Csv", read_csv), ("CsvTable", read_csv_table)]:
+    elapsed = timeit.Timer(fn).timeit(number)
+    print("{:<10} {:.0f} ms per file of {} rows".format(caption, elapsed / number * 1e3, len(ROWS)))
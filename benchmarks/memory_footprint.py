@@ -0,0 +1,58 @@
+"""
+Reports the memory footprint of the domain objects that are created in large numbers,
+e.g. one Well per position in each container and one SingleTransfer per pair and robot.
+
+Run with clarity-ext installed (e.g. `pip install -e .`):
+    python benchmarks/memory_footprint.py
+
+The size of an instance is the size of the object itself plus its __dict__, if it has one.
+Objects referenced by the instance (e.g. the artifact in a well) are not included. For comparison,
+the size of an equivalent object that keeps its attributes in a __dict__ is shown too.
+"""
+from __future__ import print_function
+import sys
+from clarity_ext.domain.container import Container, ContainerPosition
+from clarity_ext.domain.udf import UdfInfo
+from clarity_ext.service.dilution.service import SingleTransfer
+
+
+def instance_size(obj):
+    size = sys.getsizeof(obj)
+    if hasattr(obj, "__dict__"):
+        size += sys.getsizeof(obj.__dict__)
+    return size
+
+
+def dict_based_size(obj):
+    """The size of an object with the same attributes, stored in a __dict__"""
+    class DictBased(object):
+        pass
+    ret = DictBased()
+    for cls in type(obj).__mro__:
+        for slot in cls.__dict__.get("__slots__", ()):
+            setattr(ret, slot, getattr(obj, slot, None))
+    return instance_size(ret)
+
+
+def report(name, obj):
+    size = instance_size(obj)
+    dict_size = dict_based_size(obj)
+    print("{:<20} {:>6} bytes (with __dict__: {:>6} bytes, {:.0%} saved)".format(
+        name, size, dict_size, 1 - float(size) / dict_size))
+    return size
+
+
+def main():
+    container = Container(container_type=Container.CONTAINER_TYPE_96_WELLS_PLATE)
+    well = container.wells[ContainerPosition(1, 1)]
+    transfer = SingleTransfer(10, 20, 5, 40, well, well)
+
+    well_size = report("Well", well)
+    report("SingleTransfer", transfer)
+    report("UdfInfo", UdfInfo("Conc. Current (ng/ul)", 10.0))
+    print()
+    print("Wells in a 384 well plate: {:.1f} KiB".format(384 * well_size / 1024.0))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,23 @@
+"""
+Measures the time it takes to read UDFs as attributes on domain objects, as is done in the
+per-transfer loops in the dilution code, compared to reading a regular attribute.
+
+Run with clarity-ext installed (e.g. `pip install -e .`):
+    python benchmarks/udf_access.py
+"""
+from __future__ import print_function
+import timeit
+from clarity_ext.domain import Analyte
+from clarity_ext.domain.udf import UdfMapping
+
+UDFS = {"Conc. Current (ng/ul)": 10.0, "Current sample volume (ul)": 20.0}
+UDFS.update(("Custom UDF #{}".format(i), i) for i in range(30))
+
+analyte = Analyte(None, True, id="art-1", name="analyte", udf_map=UdfMapping(UDFS))
+number = 1000000
+
+for caption, statement in [("regular attribute", "analyte.name"),
+                           ("UDF attribute", "analyte.udf_conc_current_ngul"),
+                           ("UDF through the map", "analyte.udf_map['udf_conc_current_ngul'].value")]:
+    elapsed = timeit.Timer(statement, setup="from __main__ import analyte").timeit(number)
+    print("{:<22} {:.0f} ns per read".format(caption, elapsed / number * 1e9))
@@ -0,0 +1,62 @@
+"""
+Compares reading a handful of repeated elements from a large XML file with parse_xml, as returned
+by `local_shared_file(..., is_xml=True)`, and with iterparse_xml.
+
+Run with clarity-ext installed (e.g. `pip install -e .`):
+    python benchmarks/xml_read.py
+
+Each method runs in its own process, so the peak memory (max RSS) of one doesn't affect the other.
+"""
+from __future__ import print_function
+import os
+import time
+import resource
+import tempfile
+from multiprocessing import Pool
+from mock import MagicMock
+from clarity_ext.service.file_service import FileService
+
+PLATES = 200
+WELLS = 384
+
+
+def write_file(path):
+    with open(path, "w") as f:
+        f.write('<?xml version="1.0"?><Run><Parameters>')
+        for plate in range(PLATES):
+            f.write('<Plate id="{}">'.format(plate))
+            for well in range(WELLS):
+                f.write('<Well pos="{}"><Value>{}</Value><Raw>{}</Raw></Well>'.format(
+                    well, well * 0.5, " ".join(str(i) for i in range(20))))
+            f.write('</Plate>')
+        f.write('</Parameters></Run>')
+
+
+def with_parse_xml(path):
+    root = FileService(MagicMock(), MagicMock(), False, MagicMock()).parse_xml(open(path, "rb"))
+    return sum(float(well.Value) for plate in root.Parameters.Plate for well in plate.Well)
+
+
+def with_iterparse_xml(path):
+    wells = FileService(MagicMock(), MagicMock(), False, MagicMock()).iterparse_xml(open(path, "rb"), "Plate/Well")
+    return sum(float(well.Value) for well in wells)
+
+
+def measure(args):
+    fn, path = args
+    start = time.time()
+    result = fn(path)
+    elapsed = time.time() - start
+    return result, elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+if __name__ == "__main__":
+    path = os.path.join(tempfile.mkdtemp(), "run.xml")
+    write_file(path)
+    print("File size: {:.0f} MB".format(os.path.getsize(path) / 1e6))
+    for caption, fn in [("parse_xml", with_parse_xml), ("iterparse_xml", with_iterparse_xml)]:
+        pool = Pool(1)
+        result, elapsed, max_rss = pool.map(measure, [(fn, path)])[0]
+        pool.close()
+        print("{:<14} {:.2f} s, max RSS {:.0f} MB (sum {})".format(caption, elapsed, max_rss / 1024.0, result))
+    os.remove(path)
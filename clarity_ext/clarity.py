@@ -12,9 +12,10 @@ class ClaritySession(object):
     :param api: A proxy for the REST API, looking like Lims from the genologics package.
     :param current_step_id: The step we're currently in.
     """
-    def __init__(self, api, current_step_id):
+    def __init__(self, api, current_step_id, check_version=True):
         self.api = api
-        api.check_version()
+        if check_version:
+            api.check_version()
         self.current_step_id = current_step_id
         if current_step_id:
             process_api_resource = genologics.entities.Process(self.api, id=current_step_id)
@@ -24,6 +25,13 @@ class ClaritySession(object):
     def create(current_step_id):
         return ClaritySession(Lims(BASEURI, USERNAME, PASSWORD), current_step_id)
 
+    def create_for_step(self, step_id):
+        """
+        Returns a session for another step that shares the connection, and therefore the
+        resources that have already been fetched, with this session.
+        """
+        return ClaritySession(self.api, step_id, check_version=False)
+
     def get(self, endpoint):
         """
         Executes a GET via the REST interface. One should rather use the api attribute instead.
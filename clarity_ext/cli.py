@@ -105,7 +105,8 @@ def extension(module, mode, args, cache):
             except ResultsDifferFromFrozenData as ex:
                 print("Results differ from frozen data: " + ex.message)
         elif mode == ExtensionService.RUN_MODE_EXEC:
-            extension_svc.set_log_strategy(log_level, True, True, True, "/opt/clarity-ext/logs", "extensions.log")
+            extension_svc.set_log_strategy(log_level, True, True, True, "/opt/clarity-ext/logs", "extensions.log",
+                                          use_queue=True)
             extension_svc.run_exec(config, args, module)
         else:
             raise NotImplementedError("Mode '{}' is not implemented".format(mode))
@@ -121,6 +122,20 @@ def extension(module, mode, args, cache):
         raise Exception(msg)
 
 
+@main.command()
+@click.argument("pid")
+@click.option("--path", help="The snapshot file. Defaults to {} in the current directory".format(
+    ExtensionService.SNAPSHOT_FILE))
+def snapshot(pid, path):
+    """
+    Saves everything an extension reads from the step to one file. Tests that run from the snapshot
+    make no requests to the LIMS. Place the file in a frozen test directory to use it.
+    """
+    default_logging()
+    extension_svc = ExtensionService(lambda msg: print(msg))
+    extension_svc.create_snapshot(pid, path or ExtensionService.SNAPSHOT_FILE)
+
+
 @main.command()
 def templates():
     """
@@ -4,11 +4,13 @@ from clarity_ext.repository import ClarityRepository, FileRepository
 from clarity_ext.utils import lazyprop
 from clarity_ext import ClaritySession
 from clarity_ext.service import (ArtifactService, FileService, StepLoggerService, ClarityService,
-                                 ProcessService, UploadFileService, ValidationService)
-from clarity_ext.repository import StepRepository
+                                 ProcessService, UploadFileService, ValidationService, PrefetchService)
+from clarity_ext.repository import StepRepository, StepSnapshot, SnapshotStepRepository, SnapshotFileRepository
 from clarity_ext import utils
 from clarity_ext.service.file_service import OSService
 from clarity_ext.mappers.clarity_mapper import ClarityMapper
+from clarity_ext.domain.udf import DirtyRegistry
+from clarity_ext.domain.common import DomainObjectMixin
 
 
 class ExtensionContext(object):
@@ -25,7 +27,7 @@ class ExtensionContext(object):
     def __init__(self, session, artifact_service, file_service, current_user,
                  step_logger_service, step_repo, clarity_service, dilution_service, process_service,
                  upload_file_service, validation_service, test_mode=False,
-                 disable_commits=False):
+                 disable_commits=False, dirty_registry=None):
         """
         Initializes the context.
 
@@ -42,11 +44,14 @@ class ExtensionContext(object):
                           returning a constant time.
         :param disable_commits: True if commits should be ignored, e.g. when uploading files or updating UDFs.
         Useful when testing.
+        :param dirty_registry: Keeps track of domain objects with changed UDFs.
+                               Required for `commit(include_dirty=True)`
         """
         self.session = session
         self.logger = step_logger_service
         self.units = UnitConversion()
-        self._update_queue = set()
+        # Keyed by the object's identity rather than its LIMS id, so copies of the same object are all committed
+        self._update_queue = dict()
         self.current_step = step_repo.get_process()
         self.artifact_service = artifact_service
         self.file_service = file_service
@@ -62,20 +67,35 @@ class ExtensionContext(object):
         self.validation_service = validation_service
 
         self.disable_commits = disable_commits
+        self.dirty_registry = dirty_registry
 
     @staticmethod
-    def create(step_id, test_mode=False, uploaded_to_stdout=False, disable_commits=False, upload_files=True):
+    def create(step_id, test_mode=False, uploaded_to_stdout=False, disable_commits=False, upload_files=True,
+               snapshot_path=None):
         """
         Creates a context with all required services set up. This is the way
         a context is meant to be created in production and integration tests,
         use the constructor for custom use and unit tests.
+
+        If snapshot_path is set, all data is read from a snapshot created with `clarity-ext snapshot`
+        instead of from the LIMS.
         """
-        session = ClaritySession.create(step_id)
-        clarity_mapper = ClarityMapper()
-        step_repo = StepRepository(session, clarity_mapper)
+        dirty_registry = DirtyRegistry()
+        clarity_mapper = ClarityMapper(dirty_registry)
+        if snapshot_path:
+            snapshot = StepSnapshot.load(snapshot_path)
+            if step_id != snapshot.step_id:
+                raise ValueError("The snapshot '{}' was captured from {}, not {}".format(
+                    snapshot_path, snapshot.step_id, step_id))
+            session = snapshot.create_session()
+            step_repo = SnapshotStepRepository(snapshot, session, clarity_mapper)
+            file_repository = SnapshotFileRepository(snapshot, session)
+        else:
+            session = ClaritySession.create(step_id)
+            step_repo = StepRepository(session, clarity_mapper)
+            file_repository = FileRepository(session)
         artifact_service = ArtifactService(step_repo)
         current_user = step_repo.current_user()
-        file_repository = FileRepository(session)
         file_service = FileService(
             artifact_service, file_repository, False, OSService())
         step_logger_service = StepLoggerService("Step log", file_service)
@@ -91,7 +111,8 @@ class ExtensionContext(object):
                                 step_logger_service, step_repo, clarity_service,
                                 dilution_service, process_service, upload_file_service,
                                 validation_service,
-                                test_mode=test_mode, disable_commits=disable_commits)
+                                test_mode=test_mode, disable_commits=disable_commits,
+                                dirty_registry=dirty_registry)
 
     @staticmethod
     def create_mocked(session, step_repo, os_service, file_repository, clarity_service,
@@ -189,6 +210,7 @@ class ExtensionContext(object):
         """Cleans up any downloaded resources. This method will be automatically
         called by the framework and does not need to be called by extensions"""
         # Clean up:
+        self.logger.close()
         self.file_service.cleanup()
 
     def local_shared_file(self, name, mode="r", is_xml=False, is_csv=False):
@@ -210,6 +232,30 @@ class ExtensionContext(object):
         else:
             return f
 
+    def local_shared_xml_elements(self, name, path):
+        """
+        Downloads the XML file from the current step and yields the elements matching the path, e.g.
+        "Plate/Well", without reading the whole file into memory. See FileService.iterparse_xml.
+        """
+        f = self.file_service.local_shared_file(name, mode="rb")
+        return self.file_service.iterparse_xml(f, path)
+
+    def local_shared_csv_table(self, name, columns=None, types=None, **fmtparams):
+        """
+        Downloads the csv file from the current step and reads it as a CsvTable, with one list of values
+        per column. This is faster and uses less memory than is_csv for large files.
+
+        :param columns: The names of the columns to read. Defaults to all columns
+        :param types: A dictionary from column name to a function that converts its values, e.g. float
+        :param fmtparams: Dialect and formatting parameters for the csv module, e.g. delimiter=";"
+        """
+        f = self.file_service.local_shared_file(name, mode="rb")
+        return self.file_service.parse_csv_table(f, columns=columns, types=types, **fmtparams)
+
+    def prefetch(self, plan):
+        """Fetches all data declared in the PrefetchPlan, using as few requests as possible"""
+        PrefetchService(self.session, self.artifact_service, self.file_service).execute(plan)
+
     def output_result_file_by_id(self, file_id):
         """Returns the output result file by id"""
         return self.artifact_service.output_file_by_id(file_id)
@@ -218,17 +264,56 @@ class ExtensionContext(object):
     def output_result_files(self):
         return self.artifact_service.all_output_files()
 
+    def udf_table(self, udfs, artifacts=None):
+        """
+        Returns the UDFs of the artifacts as a table, which can be exported to numpy arrays. Results can
+        be written back with `UdfTable.write` and are committed like any other change to the artifacts.
+
+        :param udfs: The UDFs to include
+        :param artifacts: The artifacts, one per row. Defaults to all output analytes and result files.
+        """
+        return self.artifact_service.udf_table(udfs, artifacts)
+
     @property
     def pid(self):
         return self.current_step.id
 
     def update(self, obj):
         """Add an object that has a commit method to the list of objects to update"""
-        self._update_queue.add(obj)
+        self._update_queue.setdefault(id(obj), obj)
+
+    def commit(self, include_dirty=False):
+        """
+        Commits all objects that have been added via the update method, using batch processing if possible
 
-    def commit(self):
-        """Commits all objects that have been added via the update method, using batch processing if possible"""
-        self.clarity_service.update(self._update_queue, self.disable_commits)
+        :param include_dirty: Also commit all objects whose UDFs have been changed, even if they were not added
+        """
+        objects = dict(self._update_queue)
+        if include_dirty:
+            if self.dirty_registry is None:
+                raise ValueError("Changed objects are not tracked in this context")
+            for obj in self.dirty_registry.enumerate_dirty():
+                objects.setdefault(id(obj), obj)
+        objects = objects.values()
+        self._check_no_conflicting_changes(objects)
+        self.clarity_service.update(objects, self.disable_commits)
+
+    @staticmethod
+    def _check_no_conflicting_changes(objects):
+        """
+        Raises a ValueError if more than one instance of the same LIMS object (e.g. a sample fetched twice)
+        has its own changed UDFs, since only one of them could be saved. Instances that share the UdfMapping,
+        e.g. shallow copies, hold the same changes, so they don't conflict.
+        """
+        dirty_udf_map_by_identity = dict()
+        for obj in objects:
+            identity = obj._identity() if isinstance(obj, DomainObjectMixin) else None
+            udf_map = getattr(obj, "udf_map", None)
+            if identity is None or udf_map is None or not udf_map.is_dirty():
+                continue
+            if dirty_udf_map_by_identity.setdefault(identity, udf_map) is not udf_map:
+                raise ValueError("The UDFs of '{}' have been changed in more than one instance of it. "
+                                 "Make the changes to one instance only.".format(obj))
 
     @lazyprop
     def current_process_type(self):
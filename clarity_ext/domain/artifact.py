@@ -19,6 +19,8 @@ class Artifact(DomainObjectWithUdfMixin):
         self.is_input = None  # Set to true if this is an input artifact
         self.generation_type = None  # Set to PER_INPUT or PER_ALL_INPUTS if applicable
         self.name = name
+        # The name as it was fetched from the LIMS, used to find out if the artifact has been renamed
+        self.original_name = name
 
 
 class ArtifactPair(object):
@@ -3,52 +3,97 @@ import copy
 
 
 class DomainObjectMixin(object):
+    # Subclasses with many instances (e.g. Well) can define __slots__ to save memory
+    __slots__ = ()
+
+    def _identity(self):
+        """
+        Returns the key that equality and hashing are based on: the type and the LIMS id.
+        Returns None if the object has no id, in which case it's only equal to itself.
+        """
+        lims_id = getattr(self, "id", None)
+        if lims_id is None:
+            return None
+        return type(self), lims_id
 
     def __eq__(self, other):
+        if self is other:
+            return True
+        if not isinstance(other, DomainObjectMixin):
+            return False
+        key = self._identity()
+        return key is not None and key == other._identity()
+
+    def __hash__(self):
+        # NOTE: An object that gets an id after it has been added to a set or dict will not be found again
+        key = self._identity()
+        return hash(key) if key is not None else object.__hash__(self)
+
+    def deep_equals(self, other):
+        """
+        Compares all fields of the objects, recursively. Slow, but useful in tests that
+        need to verify that two different instances are equivalent.
+        """
         if isinstance(other, self.__class__):
-            return self._eq_rec(self, other)
+            return self._eq_rec(self, other, set())
         else:
             return False
 
-    def _eq_rec(self, a, b, cache=[]):
+    def _eq_rec(self, a, b, visited):
         """
-        Replaces the == operator because of circulating references (e.g. analyte <-> well)
+        Compares the objects field by field, visiting each object only once because of
+        circulating references (e.g. analyte <-> well)
         Adapted solution taken from
         http://stackoverflow.com/questions/31415844/using-the-operator-on-circularly-defined-dictionaries
         """
-        cache = cache + [a, b]
-        if isinstance(a, DomainObjectMixin):
-            a = a.__dict__
-        if isinstance(b, DomainObjectMixin):
-            b = b.__dict__
-        if not isinstance(a, dict) or not isinstance(b, dict):
-            return a == b
-
-        set_keys = set(a.keys())
-        if set_keys != set(b.keys()):
-            return False
+        # `visited` holds the objects on the current path. It's shared by all levels of the recursion,
+        # so the objects are added here and removed when this level is done
+        added = [obj_id for obj_id in (id(a), id(b)) if obj_id not in visited]
+        visited.update(added)
+        try:
+            if isinstance(a, DomainObjectMixin):
+                a = a._fields()
+            if isinstance(b, DomainObjectMixin):
+                b = b._fields()
+            if not isinstance(a, dict) or not isinstance(b, dict):
+                return a == b
 
-        for key in set_keys:
-            if any(a[key] is i for i in cache):
-                continue
-            elif any(b[key] is i for i in cache):
-                continue
-            elif a[key].__class__.__name__ == "MagicMock" and a[key].__class__.__name__ == "MagicMock":
-                # TODO: Move this to the tests. The domain objects shouldn't have to directly know about this
-                # filter out mocked fields
-                continue
-            elif not self._eq_rec(a[key], b[key], cache):
+            set_keys = set(a.keys())
+            if set_keys != set(b.keys()):
                 return False
-        return True
+
+            for key in set_keys:
+                if id(a[key]) in visited or id(b[key]) in visited:
+                    continue
+                elif a[key].__class__.__name__ == "MagicMock" and a[key].__class__.__name__ == "MagicMock":
+                    # TODO: Move this to the tests. The domain objects shouldn't have to directly know about this
+                    # filter out mocked fields
+                    continue
+                elif not self._eq_rec(a[key], b[key], visited):
+                    return False
+            return True
+        finally:
+            visited.difference_update(added)
 
     def __ne__(self, other):
         return not self.__eq__(other)
 
+    def _fields(self):
+        """Returns a dictionary of all attributes, whether they are stored in __slots__ or __dict__"""
+        ret = dict(getattr(self, "__dict__", {}))
+        for cls in type(self).__mro__:
+            for slot in cls.__dict__.get("__slots__", ()):
+                if slot != "__dict__" and hasattr(self, slot):
+                    ret[slot] = getattr(self, slot)
+        return ret
+
     def differing_fields(self, other):
         if isinstance(other, self.__class__):
             ret = []
-            for key in self.__dict__:
-                if self.__dict__.get(key, None) != other.__dict__.get(key, None):
+            fields = self._fields()
+            other_fields = other._fields()
+            for key in fields:
+                if fields.get(key, None) != other_fields.get(key, None):
                     ret.append(key)
             return ret
         else:
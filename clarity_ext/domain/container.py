@@ -1,5 +1,5 @@
+import collections
 from collections import namedtuple
-from clarity_ext.utils import lazyprop
 from clarity_ext.domain.common import DomainObjectMixin
 
 
@@ -13,12 +13,37 @@ class Well(DomainObjectMixin):
     Consider renaming this class to Location. The exact coordinates (e.g. A:1) are called "position".
     A better name for that might have been "coordinates" or "index" to avoid a potential confusion, as
     location and position can have the same meaning.
+
+    Wells fetched from a container are views into the container's storage, so setting the
+    artifact of such a well updates the container. A well created directly holds its own artifact.
     """
+    __slots__ = ("position", "container", "_artifact", "_index")
 
     def __init__(self, position, container, artifact=None):
         self.position = position
         self.container = container
-        self.artifact = artifact
+        self._index = None
+        self._artifact = artifact
+
+    @property
+    def artifact(self):
+        if self._index is not None:
+            return self.container._artifacts[self._index]
+        return self._artifact
+
+    @artifact.setter
+    def artifact(self, value):
+        if self._index is not None:
+            self.container._artifacts[self._index] = value
+        else:
+            self._artifact = value
+
+    def _fields(self):
+        return {"position": self.position, "container": self.container, "artifact": self.artifact}
+
+    def _identity(self):
+        # A well is identified by its position in a container
+        return Well, self.container, self.position
 
     @property
     def is_empty(self):
@@ -49,6 +74,8 @@ class ContainerPosition(namedtuple("ContainerPosition", ["row", "col"])):
 
     Default representation is `<row as letter>:<column as number>`, e.g. `A:1`
     """
+    __slots__ = ()
+
     def __repr__(self):
         return "{}:{}".format(self.row_letter, self.col)
 
@@ -64,7 +91,7 @@ class ContainerPosition(namedtuple("ContainerPosition", ["row", "col"])):
         if isinstance(repr, basestring):
             row, col = repr.split(":")
             if row.isalpha():
-                row = ord(row.upper()) - 64
+                row = ContainerPosition.letter_to_index(row)
             else:
                 row = int(row)
             col = int(col)
@@ -81,25 +108,54 @@ class ContainerPosition(namedtuple("ContainerPosition", ["row", "col"])):
 
     @staticmethod
     def index_to_letter(index):
-        return chr(65 + index - 1)
+        """Returns the letters for the row index. Rows after Z are AA, AB etc. as in 1536 well plates"""
+        letters = ""
+        while index > 0:
+            index, remainder = divmod(index - 1, 26)
+            letters = chr(65 + remainder) + letters
+        return letters
 
     @staticmethod
     def letter_to_index(letter):
-        return ord(letter.upper()) - 64
+        index = 0
+        for char in letter.upper():
+            index = index * 26 + ord(char) - 64
+        return index
 
 
 class PlateSize(namedtuple("PlateSize", ["height", "width"])):
     """Defines the size of a plate"""
-    pass
+    __slots__ = ()
 
 
 class Container(DomainObjectMixin):
-    """Encapsulates a Container"""
+    """
+    Encapsulates a Container
+
+    The artifacts are stored in a flat list, indexed by position in row-major order. Well objects
+    are only created for positions that are accessed.
+    """
 
     DOWN_FIRST = 1
     RIGHT_FIRST = 2
 
     CONTAINER_TYPE_96_WELLS_PLATE = "96 well plate"
+    CONTAINER_TYPE_384_WELLS_PLATE = "384 well plate"
+    CONTAINER_TYPE_1536_WELLS_PLATE = "1536 well plate"
+    CONTAINER_TYPE_TUBE = "Tube"
+    CONTAINER_TYPE_24_TUBE_RACK = "24 tube rack"
+    CONTAINER_TYPE_48_TUBE_RACK = "48 tube rack"
+    CONTAINER_TYPE_96_TUBE_RACK = "96 tube rack"
+
+    SIZE_BY_CONTAINER_TYPE = {
+        CONTAINER_TYPE_96_WELLS_PLATE: PlateSize(height=8, width=12),
+        CONTAINER_TYPE_384_WELLS_PLATE: PlateSize(height=16, width=24),
+        CONTAINER_TYPE_1536_WELLS_PLATE: PlateSize(height=32, width=48),
+        CONTAINER_TYPE_TUBE: PlateSize(height=1, width=1),
+        CONTAINER_TYPE_24_TUBE_RACK: PlateSize(height=4, width=6),
+        CONTAINER_TYPE_48_TUBE_RACK: PlateSize(height=6, width=8),
+        CONTAINER_TYPE_96_TUBE_RACK: PlateSize(height=8, width=12),
+    }
 
     def __init__(self, mapping=None, size=None, container_type=None,
                  container_id=None, name=None, is_source=None, append_order=DOWN_FIRST):
@@ -129,6 +185,51 @@ class Container(DomainObjectMixin):
         self._append_iterator = None
         self.append_order = append_order
 
+        if mapping:
+            for key, content in mapping.items():
+                self._artifacts[self._index(ContainerPosition.create(key))] = content
+
+    @property
+    def size(self):
+        return self._size
+
+    @size.setter
+    def size(self, value):
+        # Changing the size removes all content
+        self._size = value
+        self._artifacts = [None] * (value.height * value.width)
+        self._wells = dict()
+
+    def __copy__(self):
+        # The copy gets its own storage, so wells in it can be changed without affecting the original
+        ret = self.__class__.__new__(self.__class__)
+        ret.__dict__.update(self.__dict__)
+        ret._artifacts = list(self._artifacts)
+        ret._wells = dict()
+        ret._append_iterator = None
+        return ret
+
+    def _fields(self):
+        ret = super(Container, self)._fields()
+        # The wells are views into the storage, created on demand
+        del ret["_wells"]
+        return ret
+
+    def _index(self, well_pos):
+        """Returns the index of the position in the storage. Raises a KeyError if it's not in the container"""
+        row, col = well_pos
+        if not (1 <= row <= self._size.height and 1 <= col <= self._size.width):
+            raise KeyError(well_pos)
+        return (row - 1) * self._size.width + col - 1
+
+    def _well_at(self, index):
+        well = self._wells.get(index)
+        if well is None:
+            well = Well(_positions(self._size)[index], self)
+            well._index = index
+            self._wells[index] = well
+        return well
+
     def append(self, artifact):
         """Adds this artifact to the next free position"""
         if self._append_iterator is None:
@@ -155,8 +256,8 @@ class Container(DomainObjectMixin):
         """
         rows = list()
         if compressed:
-            rows = [str(well) for well in self if well.artifact is not None]
-            empty_count = sum(1 for well in self if well.artifact is None)
+            rows = [str(well) for well in self.occupied]
+            empty_count = sum(1 for artifact in self._artifacts if artifact is None)
             rows.append("... {} empty wells".format(empty_count))
         else:
             well_to_string = (lambda w: "X" if w.artifact else "_") if short else str
@@ -170,9 +271,9 @@ class Container(DomainObjectMixin):
         return "\n".join(rows)
 
     def size_from_container_type(self, container_type):
-        if container_type == self.CONTAINER_TYPE_96_WELLS_PLATE:
-            return PlateSize(height=8, width=12)
-        else:
+        try:
+            return self.SIZE_BY_CONTAINER_TYPE[container_type]
+        except KeyError:
             raise ValueError("Can't initialize container size from plate name {}".format(container_type))
 
     @property
@@ -205,39 +306,26 @@ class Container(DomainObjectMixin):
         ret = Container(size=size, container_type=resource.type.name, is_source=is_source)
         ret.id = resource.id
         ret.name = resource.name
-        ret.size = size
         for artifact in api_artifacts:
             ret.set_well(artifact.location[1], artifact)
         ret.api_resource = resource
         return ret
 
-    @lazyprop
+    @property
     def wells(self):
-        ret = dict()
-        for row, col in self._traverse():
-            key = "{}:{}".format(row, col)
-            content = self.mapping[key] if self.mapping and key in self.mapping else None
-            pos = ContainerPosition(row=row, col=col)
-            ret[(row, col)] = Well(pos, content)
-            ret[(row, col)].container = self
-        return ret
+        """A dictionary-like object of all wells, indexed by position, e.g. (1, 1) or ContainerPosition(1, 1)"""
+        return WellMapping(self)
 
     def _traverse(self, order=DOWN_FIRST):
         """Traverses the container, visiting wells in a certain order, yielding keys as (row,col) tuples, 1-indexed"""
         if not self.size:
             raise ValueError("Not able to traverse the container without a plate size")
-
-        rows = range(1, self.size.height + 1)
-        cols = range(1, self.size.width + 1)
-        if order == self.RIGHT_FIRST:
-            return ((row, col) for row in rows for col in cols)
-        else:
-            return ((row, col) for col in cols for row in rows)
+        return iter(_traversal(self.size, order))
 
     # Lists the wells in a certain order:
     def enumerate_wells(self, order=DOWN_FIRST):
-        for key in self._traverse(order):
-            yield self.wells[key]
+        for index in _traversal_indexes(self.size, order):
+            yield self._well_at(index)
 
     def list_wells(self, order=DOWN_FIRST):
         return list(self.enumerate_wells(order))
@@ -247,21 +335,24 @@ class Container(DomainObjectMixin):
         if not isinstance(well_pos, ContainerPosition):
             well_pos = ContainerPosition.create(well_pos)
 
-        if well_pos not in self.wells:
+        try:
+            index = self._index(well_pos)
+        except KeyError:
             raise KeyError(
                 "Well id {} is not available in this container (type={})".format(well_pos, self))
 
-        self.wells[well_pos].artifact = artifact
+        self._artifacts[index] = artifact
+        well = self._well_at(index)
         if artifact:
             artifact.container = self
-
-        artifact.well = self.wells[well_pos]
-        return self.wells[well_pos]
+            artifact.well = well
+        return well
 
     @property
     def occupied(self):
         """Returns non-empty wells as a list"""
-        return [well for well in self if well.artifact]
+        return [self._well_at(index) for index in _traversal_indexes(self.size, self.DOWN_FIRST)
+                if self._artifacts[index]]
 
     def __iter__(self):
         return self.enumerate_wells(order=self.DOWN_FIRST)
@@ -280,3 +371,77 @@ class Container(DomainObjectMixin):
     def __repr__(self):
         return "Container(id={})".format(self.id)
 
+
+class WellMapping(collections.Mapping):
+    """
+    A read-only view of the wells in a container, indexed by (row, col), with the methods of a read-only dict.
+    Well objects are created when they are accessed.
+    """
+
+    def __init__(self, container):
+        self.container = container
+
+    def __getitem__(self, key):
+        try:
+            index = self.container._index(key)
+        except (TypeError, ValueError):
+            raise KeyError(key)
+        return self.container._well_at(index)
+
+    def __contains__(self, key):
+        try:
+            self.container._index(key)
+            return True
+        except (KeyError, TypeError, ValueError):
+            return False
+
+    def __len__(self):
+        return len(self.container._artifacts)
+
+    def __iter__(self):
+        return self.container._traverse()
+
+    def keys(self):
+        return list(self)
+
+    def values(self):
+        return list(self.container.enumerate_wells())
+
+    def items(self):
+        return [(well.position, well) for well in self.container.enumerate_wells()]
+
+    def has_key(self, key):
+        return key in self
+
+
+# The traversal orders are the same for all containers of a size, so they're computed once per size
+_positions_by_size = dict()
+_traversal_by_size = dict()
+
+
+def _positions(size):
+    """Returns the positions in a container of this size in storage (row-major) order"""
+    if size not in _positions_by_size:
+        _positions_by_size[size] = tuple(ContainerPosition(row=row, col=col)
+                                         for row in range(1, size.height + 1)
+                                         for col in range(1, size.width + 1))
+    return _positions_by_size[size]
+
+
+def _traversal_indexes(size, order):
+    """Returns the storage indexes in the traversal order"""
+    key = (size, order)
+    if key not in _traversal_by_size:
+        if order == Container.RIGHT_FIRST:
+            indexes = range(size.height * size.width)
+        else:
+            indexes = [(row - 1) * size.width + col - 1
+                       for col in range(1, size.width + 1)
+                       for row in range(1, size.height + 1)]
+        _traversal_by_size[key] = tuple(indexes)
+    return _traversal_by_size[key]
+
+
+def _traversal(size, order):
+    positions = _positions(size)
+    return tuple((positions[index].row, positions[index].col) for index in _traversal_indexes(size, order))
@@ -0,0 +1,122 @@
+class StepGraph(object):
+    """
+    An index over the input/output artifact pairs in a step.
+
+    The graph is built once from the pairs and is not changed after that. Lookups by id, name,
+    type, container and sample don't need to scan the pairs. Lists returned are copies, so callers
+    can modify them without affecting the graph.
+    """
+
+    def __init__(self, pairs):
+        self._pairs = tuple(pairs)
+        self._inputs = self._unique(input for input, _ in self._pairs)
+        self._outputs = self._unique(output for _, output in self._pairs)
+
+        self._inputs_by_id = {input.id: input for input in self._inputs}
+        self._outputs_by_id = {output.id: output for output in self._outputs}
+        self._outputs_by_name = dict()
+        for output in self._outputs:
+            self._outputs_by_name.setdefault(output.name, list()).append(output)
+
+        self._artifacts_by_container_id = dict()
+        self._artifacts_by_sample_id = dict()
+        for artifact in self._inputs + self._outputs:
+            container = getattr(artifact, "container", None)
+            if container is not None:
+                self._artifacts_by_container_id.setdefault(container.id, list()).append(artifact)
+            for sample in getattr(artifact, "samples", None) or ():
+                self._artifacts_by_sample_id.setdefault(sample.id, list()).append(artifact)
+
+        self._input_containers = self._unique_containers(self._inputs)
+        self._output_containers = self._unique_containers(self._outputs)
+
+        # Results of queries by type, filled on demand
+        self._inputs_by_type = dict()
+        self._outputs_by_type = dict()
+        self._pairs_by_type = dict()
+
+    @staticmethod
+    def _unique(artifacts):
+        ret = list()
+        seen = set()
+        for artifact in artifacts:
+            if artifact.id not in seen:
+                seen.add(artifact.id)
+                ret.append(artifact)
+        return tuple(ret)
+
+    @staticmethod
+    def _unique_containers(artifacts):
+        ret = list()
+        seen = set()
+        for artifact in artifacts:
+            container = getattr(artifact, "container", None)
+            if container is not None and container.id not in seen:
+                seen.add(container.id)
+                ret.append(container)
+        return tuple(ret)
+
+    def __len__(self):
+        return len(self._pairs)
+
+    @property
+    def pairs(self):
+        """All (input, output) pairs in the order they were returned from the step"""
+        return list(self._pairs)
+
+    @property
+    def inputs(self):
+        """A unique list of input artifacts"""
+        return list(self._inputs)
+
+    @property
+    def outputs(self):
+        """A unique list of output artifacts"""
+        return list(self._outputs)
+
+    @property
+    def input_containers(self):
+        return list(self._input_containers)
+
+    @property
+    def output_containers(self):
+        return list(self._output_containers)
+
+    def inputs_of_type(self, artifact_type):
+        if artifact_type not in self._inputs_by_type:
+            self._inputs_by_type[artifact_type] = tuple(input for input in self._inputs
+                                                        if isinstance(input, artifact_type))
+        return list(self._inputs_by_type[artifact_type])
+
+    def outputs_of_type(self, artifact_type):
+        if artifact_type not in self._outputs_by_type:
+            self._outputs_by_type[artifact_type] = tuple(output for output in self._outputs
+                                                         if isinstance(output, artifact_type))
+        return list(self._outputs_by_type[artifact_type])
+
+    def pairs_of_type(self, artifact_type):
+        """Returns the pairs where both the input and the output are of the type"""
+        if artifact_type not in self._pairs_by_type:
+            self._pairs_by_type[artifact_type] = tuple(
+                (input, output) for input, output in self._pairs
+                if isinstance(input, artifact_type) and isinstance(output, artifact_type))
+        return list(self._pairs_by_type[artifact_type])
+
+    def input_by_id(self, artifact_id):
+        """Returns the input artifact with the id. Raises a KeyError if there is none"""
+        return self._inputs_by_id[artifact_id]
+
+    def output_by_id(self, artifact_id):
+        """Returns the output artifact with the id. Raises a KeyError if there is none"""
+        return self._outputs_by_id[artifact_id]
+
+    def outputs_by_name(self, name):
+        return list(self._outputs_by_name.get(name, ()))
+
+    def artifacts_in_container(self, container_id):
+        """Returns all input and output artifacts in the container"""
+        return list(self._artifacts_by_container_id.get(container_id, ()))
+
+    def artifacts_by_sample(self, sample_id):
+        """Returns all input and output artifacts that contain the sample"""
+        return list(self._artifacts_by_sample_id.get(sample_id, ()))
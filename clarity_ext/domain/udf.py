@@ -1,4 +1,5 @@
 import re
+import threading
 from clarity_ext.domain.common import DomainObjectMixin
 import logging
 
@@ -8,6 +9,14 @@ logger = logging.getLogger(__name__)
 # TODO: Ensure that this overrides the equality check too, to take into account the UDF
 # map (since we're not adding the udfs to the object, or add them to the object)
 class DomainObjectWithUdfMixin(DomainObjectMixin):
+    """
+    A domain object with UDFs, which can be accessed as attributes named by the python name
+    of the UDF, e.g. `udf_conc_current_ngul`.
+
+    When the udf_map is set, an accessor is added to the domain class for each UDF in the schema
+    of the map (see `_UdfAccessor`), so reading a UDF costs about as much as reading a property.
+    """
+
     def __init__(self, api_resource=None, id=None, udf_map=None):
         # NOTE: The udf_map must be the first object set,
         # since it's used in __getattr__ and __setattr__
@@ -38,6 +47,13 @@ class DomainObjectWithUdfMixin(DomainObjectMixin):
                 raise self._create_udf_exception(key)
         else:
             super(DomainObjectWithUdfMixin, self).__setattr__(key, value)
+            if key == "udf_map":
+                self._bind_udf_accessors()
+
+    def _bind_udf_accessors(self):
+        udf_map = self.__dict__.get("udf_map")
+        if udf_map is not None:
+            _add_udf_accessors(type(self), udf_map.schema)
 
     def _create_udf_exception(self, key):
         return AttributeError("The udf '{}' does not exist in the udf_map. Available values are: '{}'"
@@ -53,37 +69,53 @@ class DomainObjectWithUdfMixin(DomainObjectMixin):
 
     def is_dirty(self):
         """Returns True if the Artifact was updated since it was originally fetched"""
-        return sum(1 for _ in self.udf_map.enumerate_updated())
+        return self.udf_map.is_dirty()
 
-    def get_updated_api_resource(self):
-        """
-        Creates an updated api resource object based on changed values
-        Returns None if the api resource has not updated
-        """
-        assert self.api_resource is not None
-
-        # TODO: It would be preferable to copy the object, but that didn't work out of the box.
-        # The problem now is that if the update doesn't work out,
-        # the api resource will not be in sync, which could lead to subtle errors.
-        # new_api_resource = copy.deepcopy(self.api_resource)
-        new_api_resource = self.api_resource
-        updated_fields = list(self.udf_map.enumerate_updated())
-        # TODO: This is a patch to allow renaming artifacts. The whole approach to updating needs
-        # to be overhauled. Go through the mapper in all cases (as with Sample)
-        # and be able to ask the entire domain object if any of its attributes
-        # have changed since loading the object from the backend.
-        attrib_updates = False
-
-        if self.name != self.api_resource.name:
-            attrib_updates = True
-
-        if len(updated_fields) == 0 and not attrib_updates:
-            return None
-        else:
-            for udf_info in updated_fields:
-                new_api_resource.udf[udf_info.key] = udf_info.value
-            new_api_resource.name = self.name
-            return new_api_resource
+
+
+# The domain classes and UdfSchemas that accessors have been added for
+_udf_accessors_added = set()
+
+
+def _add_udf_accessors(domain_class, schema):
+    """Adds a _UdfAccessor to the domain class for each python name in the schema it doesn't have yet"""
+    key = (domain_class, schema)
+    if key in _udf_accessors_added:
+        return
+    for py_name in schema.py_names:
+        # Names that are already taken, by an accessor in a base class or anything else, are left as they are
+        if py_name != "udf_map" and not hasattr(domain_class, py_name):
+            setattr(domain_class, py_name, _UdfAccessor(py_name))
+    _udf_accessors_added.add(key)
+
+
+class _UdfAccessor(object):
+    """
+    Reads a UDF by its python name, directly from the UdfMapping of the object by the index of the
+    UDF in the mapping's schema. The index is looked up once per schema.
+
+    If the object's UDFs don't include the name, or it maps to more than one UDF, an AttributeError
+    is raised, so DomainObjectWithUdfMixin.__getattr__ reports it as usual.
+    """
+
+    def __init__(self, py_name):
+        self.py_name = py_name
+        self._index_by_schema = dict()
+
+    def __get__(self, obj, owner):
+        if obj is None:
+            return self
+        udf_map = obj.__dict__.get("udf_map")
+        if udf_map is not None:
+            schema = udf_map.schema
+            try:
+                index = self._index_by_schema[schema]
+            except KeyError:
+                indexes = schema.indexes(self.py_name) if self.py_name in schema else ()
+                index = self._index_by_schema.setdefault(schema, indexes[0] if len(indexes) == 1 else None)
+            if index is not None:
+                return udf_map._udf_infos[index]._value
+        raise AttributeError(self.py_name)
 
 
 class UdfMapping(object):
@@ -96,42 +128,78 @@ class UdfMapping(object):
     if the key does not uniquely map to a Clarity UDF. If that happens, the user
     can instead either rename the UDF in Clarity or refer to the UDF by its original
     name.
+
+    The names are resolved by a UdfSchema, which is shared by all mappings with the same UDFs
+    (e.g. all outputs of a process output), while the mapping itself only holds the values.
+
+    Values that are written are recorded, so finding the updated values doesn't require
+    looking at all of them.
     """
     def __init__(self, original_udf_map=None):
         """
         :param original_udf_map: The original key/value mapping in Clarity, may have
         to be extended for some domain objects to contain all available UDFs
         """
-        self.raw_map = dict()  # Mapping from names (both Clarity style and Python style) to UdfInfo
-        self.values = set()  # List of unique values
-        self.py_names = set()  # A list of the python names for the UDFs
+        self.schema = UdfSchema.get(())
+        self._udf_infos = list()  # One UdfInfo for each key in the schema, in the same order
+        self._written = dict()  # The UdfInfos that have been written to since they were clean, by key
+        self._owner = None
+        self._registry = None
         if original_udf_map:
             self.create_from_dict(original_udf_map)
 
     def __eq__(self, other):
         return self.values == other.values
 
-    def add(self, key, value):
-        if key in self.raw_map:
-            raise ValueError("Key already in dictionary {}".format(key))
+    @property
+    def values(self):
+        """The unique values"""
+        return set(self._udf_infos)
 
-        # We add a mapping directly from the original key to the (wrapped) value:
-        # It should be in a list, since those mapped by pyname will potentially be more
-        # than one:
-        udf_info = UdfInfo(key, value)
-        self.values.add(udf_info)
-        self.raw_map[key] = [udf_info]
+    @property
+    def py_names(self):
+        """The python names for the UDFs"""
+        return self.schema.py_names
 
-        # Then, we also fetch the py name, and add that to the raw map too
-        py_name = self._automap_name(key)
-        self.raw_map.setdefault(py_name, list())
-        self.raw_map[py_name].append(udf_info)
-        self.py_names.add(py_name)
+    def add(self, key, value):
+        if key in self.schema:
+            raise ValueError("Key already in dictionary {}".format(key))
+        udf_infos = {udf_info.key: udf_info for udf_info in self._udf_infos}
+        udf_infos[key] = UdfInfo(key, value)
+        self._set_udf_infos(udf_infos)
 
-        # Post: The raw_map will contain a new key that corresponds to the original
+        # Post: The mapping will contain a new key that corresponds to the original
         # UDF. It will also contain a mapping from a python name to that exact same
         # value, so fetching by either name will lead to the same results.
 
+    def _set_udf_infos(self, udf_infos):
+        self.schema = UdfSchema.get(udf_infos.keys())
+        self._udf_infos = [udf_infos[key] for key in self.schema.keys]
+        for udf_info in self._udf_infos:
+            udf_info._mapping = self
+
+    def track(self, owner, registry):
+        """Registers the owner of the mapping in the DirtyRegistry when a value is changed"""
+        self._owner = owner
+        self._registry = registry
+        if self.is_dirty():
+            registry.register(owner)
+
+    def _on_write(self, udf_info):
+        self._written[udf_info.key] = udf_info
+        if self._registry is not None:
+            self._registry.register(self._owner)
+
+    def _on_clean(self, udf_info):
+        self._written.pop(udf_info.key, None)
+
+    def __getstate__(self):
+        # Copies are not tracked
+        state = self.__dict__.copy()
+        state["_owner"] = None
+        state["_registry"] = None
+        return state
+
     def __getitem__(self, key):
         return self.unwrap(key)
 
@@ -145,24 +213,30 @@ class UdfMapping(object):
 
         Raises a KeyError if the key is not available in the UDF map
         """
-        udf_info = self.raw_map[key]
-        if len(udf_info) > 1:
+        indexes = self.schema.indexes(key)
+        if len(indexes) > 1:
             raise UdfMappingNotUniqueException(key)
-        return udf_info[0]
+        return self._udf_infos[indexes[0]]
 
     def create_from_dict(self, udf_dict):
-        for key, value in udf_dict.items():
-            self.add(key, value)
+        if self._udf_infos:
+            for key, value in udf_dict.items():
+                self.add(key, value)
+        else:
+            self._set_udf_infos({key: UdfInfo(key, value) for key, value in udf_dict.items()})
 
     def usage(self):
         """Returns a string showing which UDFs are available, using Python names"""
         return ", ".join(self.py_names)
 
     def enumerate_updated(self):
-        return (value for value in self.values if value.is_dirty())
+        return (value for value in self._written.values() if value.is_dirty())
+
+    def is_dirty(self):
+        return any(value.is_dirty() for value in self._written.values())
 
     def __contains__(self, item):
-        return item in self.raw_map
+        return item in self.schema
 
     @staticmethod
     def _automap_name(original_udf_name):
@@ -176,12 +250,17 @@ class UdfMapping(object):
           'Fragment Lower (bp)' => 'udf_fragment_lower_bp'
           '% Total' => 'udf_total'
         """
+        try:
+            return _py_name_by_udf_name[original_udf_name]
+        except KeyError:
+            pass
         new_name = original_udf_name.lower().replace(" ", "_")
         # Get rid of all non-alphanumeric characters
         new_name = re.sub("\W+", "", new_name)
         new_name = "udf_{}".format(new_name)
         # Now ensure that we don't have repeated undercores:
         new_name = re.sub("_{2,}", "_", new_name)
+        _py_name_by_udf_name[original_udf_name] = new_name
         return new_name
 
     @staticmethod
@@ -200,21 +279,130 @@ class UdfMapping(object):
         return str({key: self[key].value for key in self.py_names})
 
 
+# The python names of UDFs. The same names are used in all steps, so they're only mapped once
+_py_name_by_udf_name = dict()
+
+
+class UdfSchema(object):
+    """
+    The names of a set of UDFs: the original Clarity names and the python names they map to.
+
+    Schemas are shared between all UdfMappings with the same UDFs, so they must not be changed.
+    Use `UdfSchema.get` rather than creating them directly.
+    """
+    _schemas = dict()
+
+    def __init__(self, keys):
+        """
+        :param keys: The original UDF names, in the order the values are stored
+        """
+        self.keys = tuple(keys)
+        # Maps both the original and the python names to the indexes of the values:
+        self._indexes = dict()
+        py_names = list()
+        for ix, key in enumerate(self.keys):
+            if key in self._indexes:
+                raise ValueError("Key already in dictionary {}".format(key))
+            self._indexes[key] = (ix,)
+            py_name = UdfMapping._automap_name(key)
+            self._indexes[py_name] = self._indexes.get(py_name, ()) + (ix,)
+            if py_name not in py_names:
+                py_names.append(py_name)
+        self.py_names = tuple(py_names)
+
+    @classmethod
+    def get(cls, keys):
+        """Returns the shared schema for the UDF names"""
+        keys = tuple(sorted(keys))
+        try:
+            return cls._schemas[keys]
+        except KeyError:
+            return cls._schemas.setdefault(keys, cls(keys))
+
+    def indexes(self, key):
+        """Returns the indexes of the values the key refers to. Raises a KeyError if there are none"""
+        return self._indexes[key]
+
+    def __contains__(self, key):
+        return key in self._indexes
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __reduce__(self):
+        # Unpickled schemas are shared too
+        return _get_schema, (self.keys,)
+
+    def __repr__(self):
+        return "UdfSchema({})".format(", ".join(self.keys))
+
+
+def _get_schema(keys):
+    return UdfSchema.get(keys)
+
+
+class DirtyRegistry(object):
+    """
+    Keeps track of the domain objects whose UDFs have been changed, so they can be committed
+    without having to look through all objects.
+    """
+
+    def __init__(self):
+        self._objects = dict()
+        self._lock = threading.Lock()
+
+    def register(self, domain_object):
+        with self._lock:
+            self._objects.setdefault(id(domain_object), domain_object)
+
+    def enumerate_dirty(self):
+        """Returns the registered objects that still have changes that have not been committed"""
+        with self._lock:
+            objects = self._objects.values()
+        return [domain_object for domain_object in objects if domain_object.is_dirty()]
+
+    def clear(self):
+        with self._lock:
+            self._objects.clear()
+
+
 class UdfInfo(object):
     """
     Represents a Udf. Contains the original value as well as the current value.
+
+    Writing the value notifies the UdfMapping the UdfInfo belongs to, if any.
     """
+    __slots__ = ("key", "_value", "_original_value", "_mapping")
+
     def __init__(self, key, value):
         self.key = key
-        self.value = value
-        self._original_value = self.value
+        self._mapping = None
+        self._value = value
+        self._original_value = value
+
+    @property
+    def value(self):
+        return self._value
+
+    @value.setter
+    def value(self, value):
+        self._value = value
+        if self._mapping is not None:
+            self._mapping._on_write(self)
 
     def is_dirty(self):
         """Returns True if the value has changed since the object was created"""
         return self.value != self._original_value
 
+    def set_clean(self):
+        """Marks the current value as the original value, e.g. after it has been saved"""
+        self._original_value = self.value
+        if self._mapping is not None:
+            self._mapping._on_clean(self)
+
     def __eq__(self, other):
-        return self.__dict__ == other.__dict__
+        return (self.key, self.value, self._original_value) == \
+            (other.key, other.value, other._original_value)
 
     def __hash__(self):
         return hash(self.__repr__())
@@ -0,0 +1,107 @@
+import math
+from clarity_ext import utils
+
+
+class UdfTable(object):
+    """
+    A columnar view of UDFs over a list of artifacts, with one row per artifact.
+
+    The columns are the artifact id, the id of its container, the index of its well (down first,
+    1-indexed, or 0 if the artifact is not in a well) and one column per selected UDF. Values of
+    UDFs the artifact doesn't have are None.
+
+    The table can be exported to numpy arrays, so calculations over all artifacts can be
+    vectorized. The results are written back to the artifacts with `write`.
+    """
+
+    def __init__(self, artifacts, udfs):
+        """
+        :param artifacts: The artifacts, one per row
+        :param udfs: The UDFs to include, by either the Clarity or the python name
+        """
+        self.artifacts = list(artifacts)
+        self.udfs = list(udfs)
+        self.ids = [artifact.id for artifact in self.artifacts]
+        self.container_ids = [artifact.container.id if getattr(artifact, "container", None) else None
+                              for artifact in self.artifacts]
+        self.well_indexes = [artifact.well.index_down_first if getattr(artifact, "well", None) else 0
+                             for artifact in self.artifacts]
+        self._columns = {udf: [self._read(artifact, udf) for artifact in self.artifacts] for udf in self.udfs}
+
+    @staticmethod
+    def _read(artifact, udf):
+        if artifact.udf_map is None or udf not in artifact.udf_map:
+            return None
+        return artifact.udf_map[udf].value
+
+    def __len__(self):
+        return len(self.artifacts)
+
+    def column(self, udf):
+        """Returns the values of the UDF as a list"""
+        return list(self._columns[udf])
+
+    def to_array(self, udf, dtype=float):
+        """Returns the values of the UDF as a numpy array. Missing values are NaN"""
+        numpy = utils.import_numpy("to export a UdfTable to arrays")
+        return numpy.array([_nan_if_none(value) for value in self._columns[udf]], dtype=dtype)
+
+    def to_arrays(self, dtype=float):
+        """Returns a dictionary from UDF to a numpy array of its values"""
+        return {udf: self.to_array(udf, dtype) for udf in self.udfs}
+
+    def to_structured_array(self):
+        """
+        Returns the table as a numpy structured array, with the fields id, container_id,
+        well_index and one float field per UDF
+        """
+        numpy = utils.import_numpy("to export a UdfTable to arrays")
+        dtype = [("id", object), ("container_id", object), ("well_index", int)]
+        dtype.extend((str(udf), float) for udf in self.udfs)
+        rows = zip(self.ids, self.container_ids, self.well_indexes,
+                   *[[_nan_if_none(value) for value in self._columns[udf]] for udf in self.udfs])
+        return numpy.array(rows, dtype=dtype)
+
+    def write(self, udf, values):
+        """
+        Writes the values to the UDF of the artifacts, in the order of the rows. Only values that
+        differ from the artifacts' current ones are written, so only those UDFs are updated on commit.
+        The column is updated to the artifacts' values. NaN is written as None.
+
+        Raises an AttributeError, without updating any artifact, if a value would be written to an
+        artifact that doesn't have the UDF.
+
+        Returns the number of artifacts that were updated.
+        """
+        values = list(values)
+        if len(values) != len(self.artifacts):
+            raise ValueError("Expected {} values for '{}', got {}".format(len(self.artifacts), udf, len(values)))
+        # Compared with the artifacts rather than the column, since the UDFs may have been changed since the
+        # table was created
+        column = [self._read(artifact, udf) for artifact in self.artifacts]
+        self._columns[udf] = column
+        changed = [(ix, value) for ix, value in enumerate(_none_if_nan(_to_python(value)) for value in values)
+                   if value != column[ix]]
+        # Checked before writing anything, so the artifacts are not left partially updated
+        missing = [self.artifacts[ix] for ix, _ in changed
+                   if self.artifacts[ix].udf_map is None or udf not in self.artifacts[ix].udf_map]
+        if missing:
+            raise AttributeError("The udf '{}' does not exist on {} artifact(s): {}".format(
+                udf, len(missing), ", ".join(str(artifact.id) for artifact in missing)))
+        for ix, value in changed:
+            self.artifacts[ix].udf_map[udf].value = value
+            column[ix] = value
+        return len(changed)
+
+
+def _to_python(value):
+    # Converts numpy scalars, so only python types are set on the UDFs
+    return value.item() if hasattr(value, "item") else value
+
+
+def _nan_if_none(value):
+    return float("nan") if value is None else value
+
+
+def _none_if_nan(value):
+    return None if isinstance(value, float) and math.isnan(value) else value
@@ -1,4 +1,5 @@
 from __future__ import print_function
+import atexit
 import importlib
 import os
 import sys
@@ -11,9 +12,10 @@ import logging
 import difflib
 from clarity_ext.utils import lazyprop
 from clarity_ext import ClaritySession
-from clarity_ext.repository import StepRepository
-from clarity_ext.service import ArtifactService
+from clarity_ext.repository import StepRepository, StepSnapshot
+from clarity_ext.service import ArtifactService, PrefetchPlan
 from clarity_ext.utility.integration_test_service import IntegrationTest
+from clarity_ext.utility.replay_cache import ReplayCache
 from jinja2 import Template
 import time
 import random
@@ -32,6 +34,8 @@ class ExtensionService(object):
     # TODO: It would be preferable to have all cached data in a subdirectory, needs a patch in requests-cache
     CACHE_NAME = ".http_cache"
     CACHE_ARTIFACTS_DIR = ".cache"
+    REPLAY_CACHE_FILE = ".http_cache.replay"
+    SNAPSHOT_FILE = ".step.snapshot"
 
     def __init__(self, msg_handler):
         """
@@ -40,20 +44,32 @@ class ExtensionService(object):
         self.logger = logging.getLogger(__name__)
         self.msg = msg_handler
         self.rotating_file_path = None
+        self.use_cache = False
+        self.log_listener = None
 
     def set_log_strategy(self, level, log_to_stdout, log_to_file, use_timestamp,
-                         rotating_log_dir=None, rotating_log_name=None):
+                         rotating_log_dir=None, rotating_log_name=None, use_queue=False):
+        """
+        Sets up the handlers of the root logger.
 
+        :param use_queue: Format and write the log records on a background thread, so logging doesn't
+                          block the extension. Records that are still queued are written when the
+                          process exits.
+        """
         root_logger = logging.getLogger('')
-        for handler in root_logger.handlers:
+        for handler in list(root_logger.handlers):
             root_logger.removeHandler(handler)
+        if self.log_listener:
+            self.log_listener.stop()
+            self.log_listener = None
         root_logger.setLevel(level)
 
+        handlers = list()
         formatter = utils.get_default_log_formatter(use_timestamp)
         if log_to_stdout:
             console_handler = logging.StreamHandler()
             console_handler.setFormatter(formatter)
-            root_logger.addHandler(console_handler)
+            handlers.append(console_handler)
 
         # Log to the current directory if the rotating directory doesn't exist.
         if log_to_file:
@@ -65,10 +81,18 @@ class ExtensionService(object):
             rotating_handler = logging.handlers.RotatingFileHandler(
                 self.rotating_file_path, maxBytes=10 * (2**20), backupCount=5)
             rotating_handler.setFormatter(formatter)
-            root_logger.addHandler(rotating_handler)
+            handlers.append(rotating_handler)
+
+        if use_queue and handlers:
+            queue_handler, self.log_listener = utils.create_queue_logging(*handlers)
+            atexit.register(self.log_listener.stop)
+            root_logger.addHandler(queue_handler)
+        else:
+            for handler in handlers:
+                root_logger.addHandler(handler)
 
-            if warn_dir_missing:
-                logging.warn("The rotating log directory {} doesn't exist. Logging to ./ instead".format(rotating_log_dir))
+        if log_to_file and warn_dir_missing:
+            logging.warn("The rotating log directory {} doesn't exist. Logging to ./ instead".format(rotating_log_dir))
 
     def _get_run_path(self, pid, module, mode, config):
         """Fetches the run path based on different modes of execution"""
@@ -151,22 +175,25 @@ class ExtensionService(object):
 
     def _prepare_frozen_test(self, path, frozen_path):
         self.logger.info("Preparing frozen test at '{}'".format(frozen_path))
-        http_cache_file = '{}.sqlite'.format(self.CACHE_NAME)
+        http_cache_files = ['{}.sqlite'.format(self.CACHE_NAME), self.REPLAY_CACHE_FILE, self.SNAPSHOT_FILE]
 
         # Remove everything but the cache files
         if os.path.exists(path):
             self.logger.info("Cleaning run directory '{}' of everything but the cache file".format(path))
-            utils.clean_directory(path, [http_cache_file, self.CACHE_ARTIFACTS_DIR])
+            utils.clean_directory(path, http_cache_files + [self.CACHE_ARTIFACTS_DIR])
         else:
             self.logger.info("Creating an empty run directory at {}".format(path))
             os.makedirs(path)
 
-        # Copy the cache file from the frozen path if available:
-        frozen_http_cache_file = os.path.join(frozen_path, http_cache_file)
+        # Copy the cache files from the frozen path if available:
+        for http_cache_file in http_cache_files:
+            frozen_http_cache_file = os.path.join(frozen_path, http_cache_file)
+            if os.path.exists(frozen_http_cache_file):
+                self.logger.info("Frozen http cache file {} exists and will be copied to run location".format(
+                    http_cache_file))
+                shutil.copy(frozen_http_cache_file, path)
+
         frozen_cache_dir = os.path.join(frozen_path, self.CACHE_ARTIFACTS_DIR)
-        if os.path.exists(frozen_http_cache_file):
-            self.logger.info("Frozen http cache file exists and will be copied to run location")
-            shutil.copy(frozen_http_cache_file, path)
 
         if os.path.exists(frozen_cache_dir):
             if os.path.exists(os.path.join(path, self.CACHE_ARTIFACTS_DIR)):
@@ -178,6 +205,14 @@ class ExtensionService(object):
             self.logger.debug(utils.dir_tree(path))
             self.logger.debug(utils.dir_tree(frozen_path))
 
+    def create_snapshot(self, pid, path):
+        """Captures everything an extension reads from the step to a snapshot file"""
+        self.logger.info("Capturing a snapshot of {}".format(pid))
+        snapshot = StepSnapshot.create(pid)
+        snapshot.save(path)
+        self.msg("Saved a snapshot of {} ({} resources, {} files) to {}".format(
+            pid, len(snapshot.resources), len(snapshot.files), path))
+
     def run_freeze(self, config, run_arguments_list, module):
         """
         Freezes the results of running an extension so it can be validated later
@@ -233,8 +268,24 @@ class ExtensionService(object):
 
     def _set_cache(self, use_cache):
         if use_cache:
-            self.logger.info("Using cache {}".format(self.CACHE_NAME))
+            self.logger.info("Using cache {}".format(self.REPLAY_CACHE_FILE))
+        self.use_cache = use_cache
+
+    def _install_cache(self):
+        """Installs the http cache in the current directory, i.e. the run directory"""
+        legacy_cache_file = "{}.sqlite".format(self.CACHE_NAME)
+        if os.path.exists(legacy_cache_file) and not os.path.exists(self.REPLAY_CACHE_FILE):
+            # The test was frozen before the replay cache was introduced. Refreeze to upgrade.
+            self.logger.info("Using the legacy cache {}".format(legacy_cache_file))
             utils.use_requests_cache(self.CACHE_NAME)
+        else:
+            ReplayCache(os.path.abspath(self.REPLAY_CACHE_FILE)).install()
+
+    @staticmethod
+    def _uninstall_cache():
+        """Removes the http cache installed by _install_cache, whichever kind it was"""
+        ReplayCache.uninstall()
+        utils.stop_requests_cache()
 
     def _get_extension(self, module):
         module_obj = importlib.import_module(module)
@@ -248,19 +299,38 @@ class ExtensionService(object):
         extension = self._get_extension(module)
         old_dir = os.getcwd()
         os.chdir(path)
-        self.logger.info("Executing at {}".format(path))
-        context = ExtensionContext.create(pid, test_mode=test_mode, upload_files=upload_files,
-                                          disable_commits=disable_context_commit,
-                                          uploaded_to_stdout=artifacts_to_stdout)
-        instance = extension(context)
-        if issubclass(extension, DriverFileExtension):
-            context.upload_file_service.upload(instance.shared_file(), instance.filename(), instance.to_string())
-        elif issubclass(extension, GeneralExtension):
-            instance.execute()
-        else:
-            raise NotImplementedError("Unknown extension type")
-        context.cleanup()
-        os.chdir(old_dir)
+        # The cache and the working directory are restored even if the extension fails, so they don't
+        # affect what runs next in the process
+        try:
+            self.logger.info("Executing at {}".format(path))
+            snapshot_path = None
+            if test_mode and os.path.exists(self.SNAPSHOT_FILE):
+                # All data is available in the snapshot, so no requests will be made. Updates can't be
+                # made from a snapshot, so commits are always disabled.
+                self.logger.info("Using the snapshot {}".format(self.SNAPSHOT_FILE))
+                snapshot_path = os.path.abspath(self.SNAPSHOT_FILE)
+                disable_context_commit = True
+            elif self.use_cache:
+                self._install_cache()
+            context = ExtensionContext.create(pid, test_mode=test_mode, upload_files=upload_files,
+                                              disable_commits=disable_context_commit,
+                                              uploaded_to_stdout=artifacts_to_stdout,
+                                              snapshot_path=snapshot_path)
+            instance = extension(context)
+            plan = instance.prefetch()
+            if plan and not snapshot_path:
+                context.prefetch(plan)
+            if issubclass(extension, DriverFileExtension):
+                context.upload_file_service.upload(instance.shared_file(), instance.filename(),
+                                                   instance.to_string())
+            elif issubclass(extension, GeneralExtension):
+                instance.execute()
+            else:
+                raise NotImplementedError("Unknown extension type")
+            context.cleanup()
+        finally:
+            self._uninstall_cache()
+            os.chdir(old_dir)
 
         self.notify(instance.notifications, context.validation_service.error_count,
                     context.validation_service.warning_count)
@@ -422,6 +492,14 @@ class GeneralExtension(object):
         else:
             return random.Random()
 
+    def prefetch(self):
+        """
+        Override to return a PrefetchPlan declaring the data the extension needs. The data is then fetched
+        with batched requests before the extension runs. If None is returned, data is fetched when it's
+        first accessed.
+        """
+        return None
+
     def handle_validation(self, validation_results):
         return self.validation_service.handle_validation(validation_results)
 
@@ -22,8 +22,13 @@ class ClarityMapper(object):
     Temporary: Doesn't support all domain objects. Port the factory methods on the domain objects here.
     """
 
-    def __init__(self):
+    def __init__(self, dirty_registry=None):
+        """
+        :param dirty_registry: A DirtyRegistry in which objects created by the mapper are registered
+                               when their UDFs are changed
+        """
         self.map = dict()
+        self.dirty_registry = dirty_registry
 
         # Cache of all domain objects, indexed by the ID in the LIMS
         # TODO: Currently just caching analytes 
@@ -39,6 +44,11 @@ class ClarityMapper(object):
         # See NOTE above. This mapping is only required while we're still not building the rest resources
         # directly from the domain objects.
         self.map[domain_object] = resource
+        self._track(domain_object)
+
+    def _track(self, domain_object):
+        if self.dirty_registry is not None and domain_object.udf_map is not None:
+            domain_object.udf_map.track(domain_object, self.dirty_registry)
 
     def _get_from_cache(self, domain_object):
         if domain_object not in self.map:
@@ -46,6 +56,10 @@ class ClarityMapper(object):
                             "resources can only be fetched from the mapper if the object was created via the mapper.")
         return self.map[domain_object]
 
+    def get_resource(self, domain_object):
+        """Returns the api resource the domain object was created from"""
+        return self._get_from_cache(domain_object)
+
     def sample_create_object(self, resource):
         project = Project(resource.project.name) if resource.project else None
         udf_map = UdfMapping(resource.udf)
@@ -175,4 +189,5 @@ class ClarityMapper(object):
         ret = ResultFile(api_resource=resource, is_input=is_input,
                          id=resource.id, samples=samples, name=resource.name, well=well,
                          udf_map=udf_map)
+        self._track(ret)
         return ret
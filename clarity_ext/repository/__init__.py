@@ -1,4 +1,5 @@
 from step_repository import StepRepository
 from file_repository import FileRepository
 from container_repository import ContainerRepository
-from clarity_repository import ClarityRepository
\ No newline at end of file
+from clarity_repository import ClarityRepository
+from snapshot_repository import StepSnapshot, SnapshotStepRepository, SnapshotFileRepository, SnapshotError
@@ -1,3 +1,7 @@
 class ClarityRepository(object):
     def update(self, resource):
         resource.put()
+
+    def update_batch(self, resources):
+        """Updates resources of the same type (e.g. samples or containers) with one batch request"""
+        resources[0].lims.put_batch(resources)
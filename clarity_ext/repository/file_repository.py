@@ -15,6 +15,10 @@ class FileRepository:
             for chunk in response.iter_content():
                 fd.write(chunk)
 
+    def get_remote_file_content(self, remote_file_id):
+        response = self.session.get("files/{}/download".format(remote_file_id))
+        return response.content
+
     def open_local_file(self, local_path, mode):
         """
         Reads the local file.
@@ -0,0 +1,210 @@
+import zlib
+import logging
+import importlib
+import cPickle as pickle
+from cStringIO import StringIO
+from xml.etree import ElementTree
+from genologics.lims import Lims
+from genologics.entities import Entity
+from clarity_ext.domain.shared_result_file import SharedResultFile
+from clarity_ext.repository.step_repository import StepRepository
+from clarity_ext.repository.file_repository import FileRepository
+
+
+class StepSnapshot(object):
+    """
+    A snapshot of everything an extension reads from the current step: the process, process type,
+    the wrapped artifacts (with UDF maps, containers and samples) and the content of all shared files.
+
+    The snapshot is saved to one compressed file. An extension context created from it makes no
+    HTTP requests, which makes it suitable for running tests offline.
+
+    All REST resources that were fetched while capturing are saved as XML, so resources
+    that are lazily accessed from the domain objects are available in the snapshot too.
+    """
+
+    VERSION = 2
+    PICKLE_PROTOCOL = 2
+
+    def __init__(self, step_id, baseuri, resources, artifacts, files):
+        """
+        :param step_id: The id of the captured step
+        :param baseuri: The base uri of the LIMS the snapshot was captured from
+        :param resources: A list of (module, class name, uri, xml) for every captured REST resource.
+                          The xml is None if the resource was referenced but never fetched.
+        :param artifacts: The artifact pairs, pickled with references to the resources
+        :param files: A dictionary from file ids to the content of the file
+        """
+        self.step_id = step_id
+        self.baseuri = baseuri
+        self.resources = resources
+        self.artifacts = artifacts
+        self.files = files
+
+    @staticmethod
+    def capture(session, step_repo, file_repo):
+        """Fetches all data for the current step and creates a snapshot of it"""
+        logger = logging.getLogger(__name__)
+        artifacts = step_repo.all_artifacts()
+        # Access the process type and the current user so they are available in the snapshot
+        step_repo.get_process_type()
+        step_repo.current_user()
+
+        referenced = dict()
+
+        def persistent_id(obj):
+            if isinstance(obj, Entity):
+                referenced[obj.uri] = obj
+                return obj.uri
+            return None
+
+        stream = StringIO()
+        pickler = pickle.Pickler(stream, StepSnapshot.PICKLE_PROTOCOL)
+        pickler.persistent_id = persistent_id
+        pickler.dump(artifacts)
+
+        entities = dict(referenced)
+        entities.update(session.api.cache)
+        resources = [(type(entity).__module__, type(entity).__name__, uri,
+                      ElementTree.tostring(entity.root) if entity.root is not None else None)
+                     for uri, entity in entities.items()]
+
+        files = dict()
+        shared_files = set(output for _, output in artifacts if isinstance(output, SharedResultFile))
+        for shared_file in shared_files:
+            for f in shared_file.files:
+                logger.info("Adding file {} (artifact={} '{}') to the snapshot".format(
+                    f.id, shared_file.id, shared_file.name))
+                files[f.id] = file_repo.get_remote_file_content(f.id)
+
+        return StepSnapshot(session.current_step_id, session.api.baseuri, resources, stream.getvalue(), files)
+
+    @staticmethod
+    def create(step_id):
+        """Captures a snapshot of the step, connecting to the LIMS as configured in genologics"""
+        from clarity_ext import ClaritySession
+        from clarity_ext.mappers.clarity_mapper import ClarityMapper
+        session = ClaritySession.create(step_id)
+        return StepSnapshot.capture(session, StepRepository(session, ClarityMapper()), FileRepository(session))
+
+    def save(self, path):
+        content = {
+            "version": self.VERSION,
+            "step_id": self.step_id,
+            "baseuri": self.baseuri,
+            "resources": self.resources,
+            "artifacts": self.artifacts,
+            "files": self.files,
+        }
+        with open(path, "wb") as fs:
+            fs.write(zlib.compress(pickle.dumps(content, self.PICKLE_PROTOCOL)))
+
+    @staticmethod
+    def load(path):
+        with open(path, "rb") as fs:
+            try:
+                content = pickle.loads(zlib.decompress(fs.read()))
+            except (zlib.error, pickle.UnpicklingError) as e:
+                raise SnapshotError("'{}' is not a step snapshot: {}".format(path, e))
+        if content["version"] != StepSnapshot.VERSION:
+            raise SnapshotError("The snapshot '{}' has version {}, expected {}. Capture it again.".format(
+                path, content["version"], StepSnapshot.VERSION))
+        return StepSnapshot(content["step_id"], content["baseuri"], content["resources"],
+                            content["artifacts"], content["files"])
+
+    def create_api(self):
+        """Creates a Lims object where all resources in the snapshot have been loaded"""
+        api = SnapshotLims(self.baseuri)
+        for module, class_name, uri, xml in self.resources:
+            cls = getattr(importlib.import_module(module), class_name)
+            entity = cls(api, uri=uri)
+            if xml is not None:
+                entity.root = ElementTree.fromstring(xml)
+        return api
+
+    def create_session(self):
+        from clarity_ext import ClaritySession
+        return ClaritySession(self.create_api(), self.step_id)
+
+    def load_artifacts(self, api):
+        """Returns new domain objects for the artifact pairs, referring to resources in `api`"""
+        unpickler = pickle.Unpickler(StringIO(self.artifacts))
+        unpickler.persistent_load = lambda uri: api.cache[uri]
+        return unpickler.load()
+
+
+class SnapshotLims(Lims):
+    """
+    Looks like the Lims object in the genologics package, but only provides the resources
+    that have been loaded from a snapshot. Any request to the server raises a SnapshotError.
+    """
+
+    def __init__(self, baseuri):
+        super(SnapshotLims, self).__init__(baseuri, None, None)
+
+    def _not_available(self, action, uri):
+        raise SnapshotError("Can't {} '{}' when running from a snapshot".format(action, uri))
+
+    def check_version(self):
+        pass
+
+    def get(self, uri, params=dict()):
+        self._not_available("get", uri)
+
+    def get_batch(self, instances, force=False):
+        instances = list(instances)
+        for instance in instances:
+            if instance.root is None:
+                self._not_available("get", instance.uri)
+        return instances
+
+    def get_file_contents(self, id=None, uri=None):
+        self._not_available("download", id or uri)
+
+    def put(self, uri, data, params=dict()):
+        self._not_available("update", uri)
+
+    def put_batch(self, instances):
+        for instance in instances:
+            self._not_available("update", instance.uri)
+
+    def post(self, uri, data, params=dict()):
+        self._not_available("create", uri)
+
+    def delete(self, uri, params=dict()):
+        self._not_available("delete", uri)
+
+    def upload_new_file(self, entity, file_to_upload):
+        self._not_available("upload a file to", entity.uri)
+
+
+class SnapshotStepRepository(StepRepository):
+    """A StepRepository that reads all data from a StepSnapshot"""
+
+    def __init__(self, snapshot, session, clarity_mapper):
+        super(SnapshotStepRepository, self).__init__(session, clarity_mapper)
+        self.snapshot = snapshot
+
+    def all_artifacts(self):
+        return self.snapshot.load_artifacts(self.session.api)
+
+
+class SnapshotFileRepository(FileRepository):
+    """A FileRepository that reads remote files from a StepSnapshot"""
+
+    def __init__(self, snapshot, session):
+        FileRepository.__init__(self, session)
+        self.snapshot = snapshot
+
+    def copy_remote_file(self, remote_file_id, local_path):
+        if remote_file_id not in self.snapshot.files:
+            raise SnapshotError("The file {} is not available in the snapshot".format(remote_file_id))
+        with open(local_path, 'wb') as fd:
+            fd.write(self.snapshot.files[remote_file_id])
+
+    def get_remote_file_content(self, remote_file_id):
+        return self.snapshot.files[remote_file_id]
+
+
+class SnapshotError(Exception):
+    pass
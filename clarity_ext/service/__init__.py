@@ -4,3 +4,4 @@ from step_logger_service import StepLoggerService
 from process_service import ProcessService
 from clarity_service import ClarityService
 from validation_service import ValidationService
+from prefetch_service import PrefetchService, PrefetchPlan
@@ -1,8 +1,9 @@
 import logging
 from clarity_ext.domain import *
 from clarity_ext.domain.shared_result_file import SharedResultFile
+from clarity_ext.domain.step_graph import StepGraph
+from clarity_ext.domain.udf_table import UdfTable
 from clarity_ext.repository import StepRepository
-from clarity_ext import ClaritySession
 
 
 class ArtifactService:
@@ -11,109 +12,96 @@ class ArtifactService:
 
     Artifacts are fetched through the step_repository, provided in the constructor.
 
-    All objects fetched from the step repository are cached.
+    All objects fetched from the step repository are cached in a StepGraph, which is
+    built once and used by all accessors.
     """
 
     def __init__(self, step_repository, logger=None):
         self.step_repository = step_repository
         self.logger = logger or logging.getLogger(__name__)
-        self._artifacts = None
+        self._graph = None
         self._parent_input_artifacts_by_sample_id = None
 
-    def all_artifacts(self):
+    @property
+    def graph(self):
+        """The StepGraph of all artifacts in the step"""
         # NOTE: The underlying REST library does also do some caching, but since this library wraps
         # objects, some benefit may be achieved by caching on this level too.
-        if not self._artifacts:
-            self._artifacts = self.step_repository.all_artifacts()
-        return self._artifacts
+        # An empty graph is not cached, as artifacts may still be added to the step in tests.
+        if not self._graph:
+            self._graph = StepGraph(self.step_repository.all_artifacts())
+        return self._graph
+
+    def all_artifacts(self):
+        return self.graph.pairs
 
     def shared_files(self):
         """
         Returns all shared files for the current step
         """
-        outputs = (outp for inp, outp in self.all_artifacts())
-        shared_files = (
-            outp for outp in outputs if isinstance(outp, SharedResultFile))
-        ret = list(utils.unique(shared_files, lambda f: f.id))
-        assert len(ret) == 0 or isinstance(ret[0], SharedResultFile)
-        return ret
+        return self.graph.outputs_of_type(SharedResultFile)
+
+    def shared_files_by_name(self, name):
+        """Returns all shared files for the current step with this name"""
+        return [shared_file for shared_file in self.graph.outputs_by_name(name)
+                if isinstance(shared_file, SharedResultFile)]
 
     def all_aliquot_pairs(self):
         """
         Returns all aliquots in a step as an artifact pair (input/output)
         """
-        pairs = self.step_repository.all_artifacts()
-        aliquots_only = filter(lambda pair: isinstance(pair[0], Aliquot) and
-                               isinstance(pair[1], Aliquot), pairs)
-        return [ArtifactPair(i, o) for i, o in aliquots_only]
+        return [ArtifactPair(i, o) for i, o in self.graph.pairs_of_type(Aliquot)]
 
     def all_analyte_pairs(self):
         """
         Returns all analytes in a step as an artifact pair (input/output)
         """
-        pairs = self.all_artifacts()
-        analytes_only = filter(lambda pair: isinstance(pair[0], Analyte) and
-                               isinstance(pair[1], Analyte), pairs)
-        return [ArtifactPair(i, o) for i, o in analytes_only]
+        return [ArtifactPair(i, o) for i, o in self.graph.pairs_of_type(Analyte)]
 
     def all_input_artifacts(self):
         """Returns a unique list of input artifacts"""
-        return utils.unique(self._filter_artifact(True, Artifact), lambda item: item.id)
+        return self.graph.inputs
 
     def all_output_artifacts(self):
         """Returns a unique list of output artifacts"""
-        return utils.unique(self._filter_artifact(False, Artifact), lambda item: item.id)
-
-    def _filter_artifact(self, input, type):
-        # Fetches all input analytes in the step, unique
-        pair_index = 0 if input else 1
-        for pair in self.all_artifacts():
-            if isinstance(pair[pair_index], type):
-                yield pair[pair_index]
+        return self.graph.outputs
 
     def all_input_analytes(self):
         """Returns a unique list of input analytes"""
-        return filter(lambda x: isinstance(x, Analyte), self.all_input_artifacts())
+        return self.graph.inputs_of_type(Analyte)
 
     def all_output_analytes(self):
         """Returns a unique list of output analytes"""
-        return filter(lambda x: isinstance(x, Analyte), self.all_output_artifacts())
+        return self.graph.outputs_of_type(Analyte)
+
+    def udf_table(self, udfs, artifacts=None):
+        """
+        Returns a UdfTable with the UDFs of the artifacts. Defaults to all output analytes and result files.
+        """
+        if artifacts is None:
+            artifacts = self.graph.outputs_of_type(Aliquot)
+        return UdfTable(artifacts, udfs)
 
     def all_output_containers(self):
-        containers_non_unique = (artifact.container
-                                 for artifact in self.all_output_artifacts()
-                                 if isinstance(artifact, Aliquot) and artifact.container is not None)
-        containers = utils.unique(
-            containers_non_unique, lambda item: item.id)
-        return list(containers)
+        return self.graph.output_containers
 
     def all_input_containers(self):
-        artifacts_having_container = (artifact.container
-                                      for artifact in self.all_input_artifacts()
-                                      if artifact.container is not None)
-        containers = utils.unique(
-            artifacts_having_container, lambda item: item.id)
-        return list(containers)
+        return self.graph.input_containers
 
     def all_output_files(self):
-        outputs = (outp for inp, outp in self.all_artifacts())
-        files = (outp for outp in outputs
-                 if outp.output_type == Artifact.OUTPUT_TYPE_RESULT_FILE)
-        ret = list(utils.unique(files, lambda f: f.id))
-        return ret
+        return self.graph.outputs_of_type(ResultFile)
 
     def output_file_by_id(self, file_id):
-        ret = utils.single(
-            [outp for outp in self.all_output_files() if outp.id == file_id])
-        return ret
+        try:
+            output = self.graph.output_by_id(file_id)
+        except KeyError:
+            raise ValueError("There is no output with the id {}".format(file_id))
+        if not isinstance(output, ResultFile):
+            raise ValueError("The output {} is not a result file".format(file_id))
+        return output
 
     def all_shared_result_files(self):
-        outputs = (outp for inp, outp in self.all_artifacts())
-        files = (outp for outp in outputs
-                 if outp.output_type == Artifact.OUTPUT_TYPE_SHARED_RESULT_FILE)
-        ret = list(utils.unique(files, lambda f: f.id))
-        assert len(ret) == 0 or isinstance(ret[0], ResultFile)
-        return ret
+        return self.shared_files()
 
     def parent_input_artifacts(self):
         """
@@ -139,7 +127,7 @@ class ArtifactService:
         for process in parent_processes:
             # This might seem roundabout, but for simplicity, we create another artifact service for
             # fetching the parent items:
-            parent_step_repo = StepRepository(ClaritySession.create(process.id),
+            parent_step_repo = StepRepository(self.step_repository.session.create_for_step(process.id),
                                               self.step_repository.clarity_mapper)
             parent_artifact_service = ArtifactService(parent_step_repo)
             for input in parent_artifact_service.all_input_artifacts():
@@ -163,5 +151,5 @@ class ArtifactService:
         """
         Returns all individual output `ResultFile`s. These are generated "per input".
         """
-        return [output for _, output in self.all_artifacts()
+        return [output for output in self.graph.outputs
                 if output.generation_type == output.PER_INPUT]
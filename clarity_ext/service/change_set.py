@@ -0,0 +1,102 @@
+_MISSING = object()
+
+
+class ResourceChange(object):
+    """
+    The changes to one domain object that should be sent to the LIMS, i.e. the UDFs and the
+    name if they have changed since the object was fetched.
+
+    The changes are applied to the api resource just before it's submitted. If the submission
+    fails, they are reverted, so the api resource stays in sync with the LIMS.
+    """
+
+    def __init__(self, domain_object, resource, udfs, name=None):
+        """
+        :param domain_object: The changed domain object
+        :param resource: The api resource that should be updated
+        :param udfs: A list of UdfInfo objects whose values have changed
+        :param name: The new name of the object, or None if it has not changed
+        """
+        self.domain_object = domain_object
+        self.resource = resource
+        self.udfs = udfs
+        self.name = name
+        self._previous_udfs = None
+        self._previous_name = None
+
+    @staticmethod
+    def create(domain_object, resource=None, original_name=_MISSING):
+        """
+        Returns the changes made to the domain object, or None if there are none.
+
+        :param resource: The api resource to update. Defaults to the domain object's api_resource
+        :param original_name: The name the object had when it was fetched. Defaults to the resource's name.
+        """
+        resource = resource if resource is not None else domain_object.api_resource
+        if original_name is _MISSING:
+            original_name = resource.name
+        udf_map = getattr(domain_object, "udf_map", None)
+        udfs = list(udf_map.enumerate_updated()) if udf_map else list()
+        name = domain_object.name if domain_object.name != original_name else None
+        if not udfs and name is None:
+            return None
+        return ResourceChange(domain_object, resource, udfs, name)
+
+    def apply(self):
+        """Writes the changes to the api resource"""
+        self._previous_udfs = [(udf_info.key, self.resource.udf.get(udf_info.key, _MISSING))
+                               for udf_info in self.udfs]
+        for udf_info in self.udfs:
+            self.resource.udf[udf_info.key] = udf_info.value
+        if self.name is not None:
+            self._previous_name = self.resource.name
+            self.resource.name = self.name
+
+    def revert(self):
+        """Restores the values the api resource had before the changes were applied"""
+        for key, value in self._previous_udfs:
+            if value is _MISSING:
+                del self.resource.udf[key]
+            else:
+                self.resource.udf[key] = value
+        if self.name is not None:
+            self.resource.name = self._previous_name
+
+    def commit(self):
+        """Marks the changes as saved in the LIMS, so they will not be sent again"""
+        for udf_info in self.udfs:
+            udf_info.set_clean()
+        if self.name is not None and hasattr(self.domain_object, "original_name"):
+            self.domain_object.original_name = self.name
+
+    def describe(self):
+        changes = ["{}={}".format(udf_info.key, udf_info.value) for udf_info in self.udfs]
+        if self.name is not None:
+            changes.insert(0, "name={}".format(self.name))
+        return "{}: {}".format(self.domain_object, ", ".join(changes))
+
+    def __repr__(self):
+        return "ResourceChange<{}>".format(self.describe())
+
+
+class ChangeSet(object):
+    """The changes to a list of domain objects that have been modified"""
+
+    def __init__(self, changes):
+        self.changes = changes
+
+    @staticmethod
+    def create(domain_objects, create_change=ResourceChange.create):
+        """Creates a change set, leaving out domain objects that have not changed"""
+        changes = (create_change(domain_object) for domain_object in domain_objects)
+        return ChangeSet([change for change in changes if change is not None])
+
+    def chunks(self, chunk_size):
+        for ix in range(0, len(self.changes), chunk_size):
+            yield self.changes[ix:ix + chunk_size]
+
+    def __len__(self):
+        return len(self.changes)
+
+    def __iter__(self):
+        return iter(self.changes)
@@ -1,5 +1,9 @@
+import time
 import logging
+import requests
+from multiprocessing.pool import ThreadPool
 from clarity_ext.domain import Container, Artifact, Sample
+from clarity_ext.service.change_set import ChangeSet, ResourceChange
 
 
 class ClarityService(object):
@@ -7,74 +11,116 @@ class ClarityService(object):
     General service for handling objects in Clarity.
 
     Note that artifacts (e.g. Analytes) are still handled in the ArtifactService
+
+    Updates are sent in batches of at most `chunk_size` objects. A batch that fails with a connection
+    error or a server error is retried `retries` times.
+
+    The batches are sent one at a time by default, since the repositories share one genologics Lims
+    and its requests session, which is not documented to be thread safe. Up to `max_workers` batches
+    are sent concurrently if it's set higher, which requires repositories that can be used from
+    several threads.
     """
 
-    def __init__(self, clarity_repo, step_repo, clarity_mapper, logger=None):
+    CHUNK_SIZE = 100
+    MAX_WORKERS = 1
+    RETRIES = 2
+    RETRY_DELAY = 1
+
+    def __init__(self, clarity_repo, step_repo, clarity_mapper, logger=None,
+                 chunk_size=CHUNK_SIZE, max_workers=MAX_WORKERS, retries=RETRIES):
         self.logger = logger or logging.getLogger(__name__)
         self.clarity_repository = clarity_repo
         self.step_repository = step_repo
         self.clarity_mapper = clarity_mapper
+        self.chunk_size = chunk_size
+        self.max_workers = max_workers
+        self.retries = retries
 
     def update(self, domain_objects, ignore_commit=False):
-        """Updates the domain object"""
+        """
+        Updates the domain objects that have changed, using batch updates for each type.
+
+        If ignore_commit is set, the changes that would have been made are logged instead.
+        """
         artifacts = list()
-        other_domain_objects = list()
+        containers = list()
+        samples = list()
         for item in domain_objects:
             if isinstance(item, Artifact):
                 artifacts.append(item)
-            elif isinstance(item, Container) or isinstance(item, Sample):
-                # TODO: This is temporarily limited to Sample and Container. LIMS-1057
-                other_domain_objects.append(item)
+            elif isinstance(item, Container):
+                containers.append(item)
+            elif isinstance(item, Sample):
+                samples.append(item)
             else:
                 raise NotImplementedError("No update method available for {}".format(type(item)))
 
-        for domain_object in other_domain_objects:
-            self.update_single(domain_object, ignore_commit)
+        change_sets = [
+            (ChangeSet.create(samples, self._create_sample_change), self.clarity_repository.update_batch),
+            (ChangeSet.create(containers, ResourceChange.create), self.clarity_repository.update_batch),
+            (ChangeSet.create(artifacts, self._create_artifact_change), self.step_repository.update_artifacts),
+        ]
 
         if ignore_commit:
-            # TODO: When ignoring commits, the changes that would have been committed are not logged anymore
-            # Ignoring commits should only skip writing to the backend, but should log the changes that should have
-            # happened. Recommended fix is to update all domain objects through the repository and use a repo that logs
-            # only when called.
-            self.logger.info("A request for updating artifacts was ignored. "
-                             "View log to see which properties have changed.")
+            for change_set, _ in change_sets:
+                for change in change_set:
+                    self.logger.info("Ignoring commit, would have updated {}".format(change.describe()))
             return
 
-        if len(artifacts) > 0:
-            self._update_artifacts(artifacts)
-
-    def _update_artifacts(self, artifacts):
-        # Filter out artifacts that don't have any updated fields:
-        map_artifact_to_resource = {artifact: artifact.get_updated_api_resource()
-                                    for artifact in artifacts}
-        if sum(1 for value in map_artifact_to_resource.values()
-               if value is not None) == 0:
-            return 0
-        ret = self.step_repository.update_artifacts([res for res in map_artifact_to_resource.values()
-                                                     if res is not None])
-
-        # Now update all the artifacts so they have the latest version of the api resource.
-        # This is a bit strange, it would be cleaner to create a new API resource from the domain
-        # object, but for simplicity we currently keep the original API resource.
-        for artifact, resource in map_artifact_to_resource.items():
-            if resource:
-                artifact.api_resource = resource
-        return ret
-
-    def update_single(self, domain_object, ignore_commit):
-        # TODO: This is a quick-fix to support changing container names
-        if isinstance(domain_object, Container):
-            api_resource = domain_object.api_resource
-            if api_resource.name != domain_object.name:
-                self.logger.info("Updating name of {} from {} to {}".format(domain_object,
-                                                                            api_resource.name, domain_object.name))
-                api_resource.name = domain_object.name
-                if not ignore_commit:
-                    self.clarity_repository.update(api_resource)
-        elif isinstance(domain_object, Sample):
-            # TODO: Update in a consistent way. LIMS-1057
-            api_resource = self.clarity_mapper.create_resource(domain_object)
-            if not ignore_commit:
-                self.clarity_repository.update(api_resource)
+        for change_set, update in change_sets:
+            if len(change_set) > 0:
+                self._submit(change_set, update)
+
+    @staticmethod
+    def _create_artifact_change(artifact):
+        return ResourceChange.create(artifact, original_name=artifact.original_name)
+
+    def _create_sample_change(self, sample):
+        return ResourceChange.create(sample, resource=self.clarity_mapper.get_resource(sample))
+
+    def _submit(self, change_set, update):
+        """Submits the changes in chunks, calling `update` with the api resources in each chunk"""
+        chunks = list(change_set.chunks(self.chunk_size))
+        self.logger.info("Updating {} objects in {} batches".format(len(change_set), len(chunks)))
+        if len(chunks) == 1 or self.max_workers <= 1:
+            for chunk in chunks:
+                self._submit_chunk(chunk, update)
         else:
-            raise NotImplementedError("The type '{}' isn't implemented".format(type(domain_object)))
+            pool = ThreadPool(min(len(chunks), self.max_workers))
+            try:
+                # Raises the first exception after all chunks have been submitted
+                pool.map(lambda chunk: self._submit_chunk(chunk, update), chunks)
+            finally:
+                pool.close()
+                pool.join()
+
+    def _submit_chunk(self, chunk, update):
+        for change in chunk:
+            change.apply()
+        resources = [change.resource for change in chunk]
+        attempt = 0
+        while True:
+            try:
+                update(resources)
+                break
+            except Exception as ex:
+                attempt += 1
+                if attempt > self.retries or not self._is_transient(ex):
+                    self.logger.error("Updating a batch of {} objects failed: {}".format(len(chunk), ex))
+                    for change in chunk:
+                        change.revert()
+                    raise
+                self.logger.warning("Updating a batch of {} objects failed, retrying ({}/{}): {}".format(
+                    len(chunk), attempt, self.retries, ex))
+                time.sleep(self.RETRY_DELAY * attempt)
+        for change in chunk:
+            change.commit()
+
+    @staticmethod
+    def _is_transient(ex):
+        """Returns True if the error might not happen if the request is sent again"""
+        if isinstance(ex, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+            return True
+        if isinstance(ex, requests.exceptions.HTTPError):
+            return ex.response is not None and ex.response.status_code >= 500
+        return False
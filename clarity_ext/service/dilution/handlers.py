@@ -40,16 +40,22 @@ class TransferSplitHandlerBase(TransferHandlerBase):
         pass
 
     def handle_batch(self, transfer_batch, dilution_settings, robot_settings):
-        require_row_split = [t for t in transfer_batch.transfers
-                             if self.needs_row_split(t, dilution_settings, robot_settings)]
-        for transfer in require_row_split:
+        # The transfers that are split are replaced by the transfers they were split into, which are
+        # added after the other transfers
+        transfers = list()
+        all_split_transfers = list()
+        for transfer in transfer_batch.transfers:
+            if not self.needs_row_split(transfer, dilution_settings, robot_settings):
+                transfers.append(transfer)
+                continue
             split_transfers = self.split_single_transfer(transfer, robot_settings)
             if sum(t.pipette_sample_volume + t.pipette_buffer_volume for t in split_transfers) > \
                     robot_settings.max_pipette_vol_for_row_split:
                 raise UsageError("Total volume has reached the max well volume ({})".format(
                     robot_settings.max_pipette_vol_for_row_split))
-            transfer_batch.transfers.remove(transfer)
-            transfer_batch.transfers.extend(split_transfers)
+            all_split_transfers.extend(split_transfers)
+        if all_split_transfers:
+            transfer_batch.replace_transfers(transfers + all_split_transfers, robot_settings)
 
 
 class TransferBatchHandlerBase(TransferHandlerBase):
@@ -70,8 +76,13 @@ class TransferBatchHandlerBase(TransferHandlerBase):
                 raise UsageError("Evaporation needed for '{}' - not implemented yet".format(
                     transfer.target_location.artifact.name))
 
-        split = [t for t in transfer_batch.transfers if self.needs_split(t, dilution_settings, robot_settings)]
-        no_split = [t for t in transfer_batch.transfers if t not in split]
+        split = list()
+        no_split = list()
+        for transfer in transfer_batch.transfers:
+            if self.needs_split(transfer, dilution_settings, robot_settings):
+                split.append(transfer)
+            else:
+                no_split.append(transfer)
 
         if len(split) > 0:
             return self.split_transfer_batch(split, no_split, dilution_settings, robot_settings)
@@ -82,9 +93,9 @@ class TransferBatchHandlerBase(TransferHandlerBase):
     def split_transfer_batch(self, split, no_split, dilution_settings, robot_settings):
         first_transfers = list(self.calculate_split_transfers(split))
         temp_transfer_batch = TransferBatch(first_transfers, robot_settings, depth=1, is_temporary=True)
-        self.dilution_session.dilution_service.execute_handlers(self.dilution_session.transfer_calc_handlers,
-                                                                temp_transfer_batch,
-                                                                dilution_settings, robot_settings)
+        self.dilution_session.execute_calc_handlers(self.dilution_session.transfer_calc_handlers,
+                                                    temp_transfer_batch,
+                                                    dilution_settings, robot_settings)
         second_transfers = list()
 
         # We need to create a new transfers list with:
@@ -108,8 +119,8 @@ class TransferBatchHandlerBase(TransferHandlerBase):
         temp_transfer_batch.split = True
         final_transfer_batch.split = True
 
-        self.dilution_session.dilution_service.execute_handlers(self.dilution_session.transfer_calc_handlers,
-                                                                final_transfer_batch, dilution_settings, robot_settings)
+        self.dilution_session.execute_calc_handlers(self.dilution_session.transfer_calc_handlers,
+                                                    final_transfer_batch, dilution_settings, robot_settings)
         # For the analytes requiring splits
         return TransferBatchCollection(temp_transfer_batch, final_transfer_batch)
 
@@ -166,6 +177,15 @@ class TransferCalcHandlerBase(TransferHandlerBase):
     """
     __metaclass__ = abc.ABCMeta
 
+    @property
+    def is_per_transfer(self):
+        """
+        True if the handler calculates each transfer independently of the other transfers in the batch, so earlier
+        results can be reused for transfers that haven't changed (see TransferCalcCache). That's the case for
+        handlers that implement handle_transfer, rather than handle_batch.
+        """
+        return type(self).handle_batch.__func__ is TransferCalcHandlerBase.handle_batch.__func__
+
     def handle_batch(self, transfer_batch, dilution_settings, robot_settings):
         """By default, run through the entire batch and call calc."""
         # TODO: Shouldn't transfer_batch be an iterator?
@@ -223,11 +243,11 @@ class OneToOneConcentrationCalcHandler(TransferCalcHandlerBase):
         # then apply rules in an order specified by the user (in the DilutionSettings).
         if transfer.transfer_batch.split and transfer.pipette_sample_volume < robot_settings.pipette_min_volume:
             scale_factor = robot_settings.pipette_min_volume / float(transfer.pipette_sample_volume)
-            logging.debug("Before applying scale_factor '{}': {}".format(scale_factor, transfer))
+            logging.debug("Before applying scale_factor '%s': %s", scale_factor, transfer)
             transfer.pipette_sample_volume *= scale_factor
             transfer.pipette_buffer_volume *= scale_factor
             transfer.scaled_up = True
-            logging.debug("After applying scale_factor: {}".format(transfer))
+            logging.debug("After applying scale_factor: %s", transfer)
 
         transfer.source_vol_delta = -round(transfer.pipette_sample_volume +
                                            robot_settings.dilution_waste_volume, 1)
@@ -239,7 +259,7 @@ class PoolTransferCalcHandler(TransferCalcHandlerBase):
     def handle_batch(self, batch, dilution_settings, robot_settings):
         # Since we need the average in this handler, we override handle_batch rather than handle_transfer
         for target, transfers in batch.transfers_by_output.items():
-            self.logger.debug("Grouped target={}, transfers={}".format(target, transfers))
+            self.logger.debug("Grouped target=%s, transfers=%s", target, transfers)
             regular_transfers = [t for t in transfers if not t.source_location.artifact.is_control]
             sample_size = len(regular_transfers)
 
@@ -255,10 +275,131 @@ class PoolTransferCalcHandler(TransferCalcHandlerBase):
                 target_conc = concs[0]
 
             for transfer in regular_transfers:
-                self.logger.debug("Transfer before transform: {}".format(transfer))
+                self.logger.debug("Transfer before transform: %s", transfer)
                 transfer.pipette_sample_volume = float(transfer.target_vol) / sample_size
                 transfer.source_vol_delta = -round(transfer.pipette_sample_volume +
                                                    robot_settings.dilution_waste_volume, 1)
                 if target_conc:
                     transfer.target_conc = target_conc
-                self.logger.debug("Transfer after transform:  {}".format(transfer))
+                self.logger.debug("Transfer after transform:  %s", transfer)
+
+
+class VectorizedTransferCalcHandlerBase(TransferCalcHandlerBase):
+    """
+    Base class for handlers that calculate the values of all transfers in a batch at once, on
+    numpy arrays, rather than one transfer at a time.
+
+    Subclasses implement `calculate`, which gets the values of the transfers as arrays and returns
+    the calculated arrays. The results are written back to the transfers, rounded with the builtin
+    round as in the handlers that calculate one transfer at a time, so the results are exactly the same.
+
+    Requires numpy.
+    """
+    __metaclass__ = abc.ABCMeta
+
+    # The number of decimals the results are rounded to when they're written back, by attribute
+    ROUNDING = {
+        "source_vol_delta": 1,
+        "pipette_sample_volume": 1,
+        "pipette_buffer_volume": 1,
+    }
+
+    # The calculation is done element-wise, so each transfer is still calculated independently
+    is_per_transfer = True
+
+    def handle_batch(self, transfer_batch, dilution_settings, robot_settings):
+        self.handle_transfers(transfer_batch.transfers, dilution_settings, robot_settings)
+
+    def handle_transfers(self, transfers, dilution_settings, robot_settings):
+        if not transfers:
+            return
+        results = self.calculate(TransferColumns(transfers), dilution_settings, robot_settings)
+        for attribute, values in results.items():
+            digits = self.ROUNDING.get(attribute)
+            for transfer, value in zip(transfers, values.tolist()):
+                setattr(transfer, attribute, round(value, digits) if digits is not None else value)
+
+    @abc.abstractmethod
+    def calculate(self, columns, dilution_settings, robot_settings):
+        """
+        Returns a dictionary from SingleTransfer attribute to a numpy array with the new values
+
+        :param columns: The values of the transfers (TransferColumns)
+        """
+        pass
+
+
+class TransferColumns(object):
+    """The values of a list of transfers as numpy arrays, by SingleTransfer attribute"""
+
+    def __init__(self, transfers):
+        self.numpy = utils.import_numpy("by the vectorized dilution handlers")
+        self.transfers = transfers
+        self._columns = dict()
+
+    def __getitem__(self, attribute):
+        if attribute not in self._columns:
+            values = [getattr(transfer, attribute) for transfer in self.transfers]
+            # numpy would turn a missing value into NaN. Raise the TypeError the handlers that calculate
+            # one transfer at a time raise instead
+            missing = [transfer for transfer, value in zip(self.transfers, values) if value is None]
+            if missing:
+                raise TypeError("'{}' is missing for {} transfer(s), e.g. {}".format(
+                    attribute, len(missing), missing[0]))
+            self._columns[attribute] = self.numpy.array(values, dtype=float)
+        return self._columns[attribute]
+
+    def of(self, fn, dtype=bool):
+        """Returns an array with the result of calling fn on each transfer"""
+        return self.numpy.array([fn(transfer) for transfer in self.transfers], dtype=dtype)
+
+    def __len__(self):
+        return len(self.transfers)
+
+
+class VectorizedFixedVolumeCalcHandler(VectorizedTransferCalcHandlerBase):
+    """Calculates the same values as FixedVolumeCalcHandler, for the whole batch at once"""
+
+    def calculate(self, columns, dilution_settings, robot_settings):
+        return {"source_vol_delta": -(columns["pipette_sample_volume"] + robot_settings.dilution_waste_volume)}
+
+
+class VectorizedOneToOneConcentrationCalcHandler(VectorizedTransferCalcHandlerBase):
+    """Calculates the same values as OneToOneConcentrationCalcHandler, for the whole batch at once"""
+
+    def handle_batch(self, transfer_batch, dilution_settings, robot_settings):
+        regular_transfers = list()
+        for transfer in transfer_batch.transfers:
+            if transfer.source_location.artifact.is_control:
+                transfer.pipette_buffer_volume = transfer.target_vol
+            else:
+                regular_transfers.append(transfer)
+        self.handle_transfers(regular_transfers, dilution_settings, robot_settings)
+
+    def calculate(self, columns, dilution_settings, robot_settings):
+        numpy = columns.numpy
+        source_conc = columns["source_conc"]
+        target_vol = columns["target_vol"]
+        if (source_conc == 0).any():
+            raise ZeroDivisionError("float division by zero")
+        sample_volume = columns["target_conc"] * target_vol / source_conc
+        buffer_volume = numpy.maximum(target_vol - sample_volume, 0)
+        has_to_evaporate = (target_vol - sample_volume) < 0
+
+        # In the case of looped dilutions, we scale up on the temporary plate only
+        scale_up = columns.of(lambda transfer: transfer.transfer_batch.split) & \
+            (sample_volume < robot_settings.pipette_min_volume)
+        if scale_up.any():
+            if (sample_volume[scale_up] == 0).any():
+                raise ZeroDivisionError("float division by zero")
+            scale_factor = robot_settings.pipette_min_volume / sample_volume[scale_up]
+            sample_volume[scale_up] *= scale_factor
+            buffer_volume[scale_up] *= scale_factor
+
+        return {
+            "pipette_sample_volume": sample_volume,
+            "pipette_buffer_volume": buffer_volume,
+            "has_to_evaporate": has_to_evaporate,
+            "scaled_up": scale_up | columns.of(lambda transfer: transfer.scaled_up),
+            "source_vol_delta": -(sample_volume + robot_settings.dilution_waste_volume),
+        }
@@ -1,6 +1,12 @@
 import abc
 import copy
+import hashlib
+import inspect
 import logging
+import os
+import sys
+import cPickle as pickle
+from array import array
 from itertools import groupby
 from collections import namedtuple
 from clarity_ext.service.file_service import Csv
@@ -39,8 +45,7 @@ class DilutionService(object):
             handler.handle_batch(transfer_batch, dilution_settings, robot_settings)
 
     def _log_handler(self, handler, transfer_batch):
-        self.logger.debug("Executing handler '{}' for transfer_batch '{}'".format(
-            type(handler).__name__, transfer_batch.name))
+        self.logger.debug("Executing handler '%s' for transfer_batch '%s'", type(handler).__name__, transfer_batch.name)
 
     """
     @staticmethod
@@ -95,15 +100,45 @@ class DilutionSession(object):
         self.transfer_batch_handler = transfer_batch_handler_type(self) if transfer_batch_handler_type else None
         self.transfer_split_handler = transfer_split_handler_type(self) if transfer_split_handler_type else None
         self.transfer_calc_handlers = [t(self) for t in transfer_calc_handler_types]
+        self._transfer_plan = None
+        self.calc_cache = None
+        # The directory where the values calculated when evaluating incrementally are kept between runs,
+        # in one file per step. If None, they are only kept by this session
+        self.calc_cache_dir = ".cache"
+        # If set, the rows in the driver files are created from the transfers when the files are written
+        # or their rows are accessed, rather than when the session is evaluated
+        self.stream_driver_files = False
+
+    def evaluate(self, pairs, incremental=False):
+        """
+        Refreshes all calculations for all registered robots and runs registered handlers and validators.
 
-    def evaluate(self, pairs):
-        """Refreshes all calculations for all registered robots and runs registered handlers and validators."""
+        :param incremental: Keep the values calculated for each transfer, so evaluating the session again
+                            (e.g. after UDFs have been edited) only calculates the transfers whose values have
+                            changed. The values are saved in calc_cache_dir, so they're reused when the
+                            extension runs again in the same step. See TransferCalcCache.
+        """
+        if incremental and self.calc_cache is None:
+            self.calc_cache = TransferCalcCache.load(self._calc_cache_path(), self.logger)
+        elif not incremental:
+            self.calc_cache = None
         self.pairs = pairs
         self.transfer_batches_by_robot = dict()
+        self._transfer_plan = None
+        # The plan is shared by all robots, so it's created before they're evaluated
+        self.transfer_plan(pairs, self.dilution_settings)
         for robot_settings in self.robot_settings_by_name.values():
             self.transfer_batches_by_robot[robot_settings.name] = self.create_batches(
                 self.pairs, self.dilution_settings, robot_settings, self.transfer_batch_handler,
                 self.transfer_split_handler, self.transfer_validator, self.transfer_calc_handlers)
+        if self.calc_cache is not None:
+            self.calc_cache.save()
+
+    def _calc_cache_path(self):
+        if self.calc_cache_dir is None:
+            return None
+        return os.path.join(os.path.abspath(self.calc_cache_dir),
+                            "dilution_calc_{}.pickle".format(self.context.current_step.id))
 
     def create_batches(self, pairs, dilution_settings, robot_settings, transfer_batch_handler, transfer_split_handler,
                        transfer_validator, transfer_calc_handlers):
@@ -131,38 +166,87 @@ class DilutionSession(object):
             csv = Csv(delim=robot_settings.delimiter, newline=robot_settings.newline)
             csv.file_name = robot_settings.get_filename(csv, self.context, ix)
             csv.set_header(robot_settings.header)
-            sorted_transfers = sorted(transfer_batch.transfers, key=robot_settings.transfer_sort_key)
-            for transfer in sorted_transfers:
-                if robot_settings.include_transfer_in_output(transfer):
-                    csv.append(robot_settings.map_transfer_to_row(transfer), transfer)
+            rows = self._driver_file_rows(transfer_batch.sorted_transfers(robot_settings), robot_settings)
+            if self.stream_driver_files:
+                csv.set_row_source(rows)
+            else:
+                for values, transfer in rows():
+                    csv.append(values, transfer)
             transfer_batch.driver_file = csv
 
         return transfer_batches
 
+    @staticmethod
+    def _driver_file_rows(sorted_transfers, robot_settings):
+        def rows():
+            for transfer in sorted_transfers:
+                if robot_settings.include_transfer_in_output(transfer):
+                    yield robot_settings.map_transfer_to_row(transfer), transfer
+        return rows
+
     def create_batch(self, pairs, robot_settings, dilution_settings, transfer_calc_handlers):
         """
         Creates one batch (one-to-one relationship with a robot driver file) based on the input arguments.
 
         NOTE: The batch has not been validated in this call. Caller should validate.
         """
+        transfers = self._copy_transfers(self.transfer_plan(pairs, dilution_settings))
+
+        # Wrap the transfers in a TransferBatch object, it will do a basic validation on itself:
+        # and raise a UsageError if it can't be used.
+        batch = TransferBatch(transfers, robot_settings, name=robot_settings.name)
+        if self.transfer_validator:
+            pre_results = self.transfer_validator.pre_validate(batch, dilution_settings, robot_settings)
+            self.validation_service.handle_validation(pre_results)
+        self.execute_calc_handlers(transfer_calc_handlers, batch, dilution_settings, robot_settings)
+        return batch
+
+    def execute_calc_handlers(self, handlers, transfer_batch, dilution_settings, robot_settings):
+        """Executes the calculation handlers on the batch, reusing earlier results if evaluating incrementally"""
+        if self.calc_cache is not None:
+            self.calc_cache.execute(self.dilution_service, handlers, transfer_batch, dilution_settings, robot_settings)
+        else:
+            self.dilution_service.execute_handlers(handlers, transfer_batch, dilution_settings, robot_settings)
+
+    @staticmethod
+    def _copy_transfers(plan_transfers):
+        """
+        Returns copies of the transfers in the plan for one robot, since the handlers modify them. The wells
+        and containers are copied too, so the handlers can move artifacts around in them without affecting
+        the plan or the other robots.
+        """
         # NOTE: The original containers are copied, so the containers in the transfer batch can be modified at will
         containers = dict()
-        # First ensure that we've taken copies of the original containers, since we want to be able to move
-        # the artifacts to different wells, it's cleaner to do that in a copied container:
-        original_containers = set()
-        original_containers.update([pair.input_artifact.container for pair in pairs])
-        original_containers.update([pair.output_artifact.container for pair in pairs])
-        for original_container in original_containers:
-            containers[original_container.id] = copy.copy(original_container)
 
-        def create_well(artifact):
-            return Well(artifact.well.position,
-                        containers[artifact.container.id],
-                        artifact)
+        def copy_well(well):
+            if well.container.id not in containers:
+                containers[well.container.id] = copy.copy(well.container)
+            return Well(well.position, containers[well.container.id], well.artifact)
 
         transfers = list()
+        for plan_transfer in plan_transfers:
+            transfer = copy.copy(plan_transfer)
+            transfer.source_location = copy_well(plan_transfer.source_location)
+            transfer.target_location = copy_well(plan_transfer.target_location)
+            transfers.append(transfer)
+        return transfers
+
+    def transfer_plan(self, pairs, dilution_settings):
+        """
+        Returns the transfers for the pairs, with the values that don't depend on the robot, i.e. the
+        concentrations and volumes read from the UDFs and the wells they transfer between. The plan is created
+        once and shared by all robots. It must not be changed: the wells point to the original containers,
+        and each robot gets its own copies of the transfers, wells and containers in create_batch.
+        """
+        if self._transfer_plan is not None:
+            plan_pairs, plan_settings, transfers = self._transfer_plan
+            if plan_pairs is pairs and plan_settings is dilution_settings:
+                return transfers
 
-        # First, get a list of SingleTransfer objects, pointing to Well objects in copies of the original
+        def create_well(artifact):
+            return Well(artifact.well.position, artifact.container, artifact)
+
+        transfers = list()
         for pair in pairs:
             source_well = create_well(pair.input_artifact)
             target_well = create_well(pair.output_artifact)
@@ -171,14 +255,8 @@ class DilutionSession(object):
         for transfer in transfers:
             self.initialize_transfer_from_settings(transfer, dilution_settings)
 
-        # Wrap the transfers in a TransferBatch object, it will do a basic validation on itself:
-        # and raise a UsageError if it can't be used.
-        batch = TransferBatch(transfers, robot_settings, name=robot_settings.name)
-        if self.transfer_validator:
-            pre_results = self.transfer_validator.pre_validate(batch, dilution_settings, robot_settings)
-            self.validation_service.handle_validation(pre_results)
-        self.dilution_service.execute_handlers(transfer_calc_handlers, batch, dilution_settings, robot_settings)
-        return batch
+        self._transfer_plan = (pairs, dilution_settings, tuple(transfers))
+        return self._transfer_plan[2]
 
     def initialize_transfer_from_settings(self, transfer, dilution_settings):
         # TODO: Handler
@@ -286,6 +364,156 @@ class DilutionSession(object):
         return "\n".join(report)
 
 
+class TransferCalcCache(object):
+    """
+    Keeps the values calculated by the calculation handlers for each transfer, keyed by a fingerprint of
+    everything the calculation is based on: the transfer's values (concentrations, volumes etc.), its source and
+    target, whether its batch was split, the robot settings, the dilution settings and the source code of the
+    handlers and settings.
+
+    When a batch is calculated again, only the transfers whose fingerprint has no calculated values are passed
+    to the handlers. The others get the values that were calculated before. Only the calculations are cached,
+    the batches are always split and validated again.
+
+    If the cache has a path, the values are saved to it and loaded from it, so they're available when the
+    extension runs again in the same step.
+
+    This requires that the handlers calculate each transfer independently of the other transfers in the batch.
+    If any handler doesn't (e.g. when calculating pools), the whole batch is calculated.
+    """
+
+    VERSION = 2
+    PICKLE_PROTOCOL = pickle.HIGHEST_PROTOCOL
+
+    # The values of a transfer that the calculation is based on and that handlers may change
+    VALUES = ("source_conc", "source_vol", "target_conc", "target_vol", "pipette_sample_volume",
+              "pipette_buffer_volume", "has_to_evaporate", "scaled_up", "source_vol_delta", "is_primary",
+              "should_update_source_vol", "should_update_target_vol", "should_update_target_conc", "split_type")
+
+    def __init__(self, path=None, calculated=None):
+        self.path = path
+        self._calculated = calculated or dict()
+        self._has_changes = False
+
+    @staticmethod
+    def load(path, logger=None):
+        """
+        Loads the values saved to the path. Starts with no values if there is no such file, or if it
+        can't be read, e.g. because it was saved by an earlier version.
+        """
+        if path is None or not os.path.exists(path):
+            return TransferCalcCache(path)
+        logger = logger or logging.getLogger(__name__)
+        try:
+            with open(path, "rb") as fs:
+                content = pickle.load(fs)
+        except Exception as e:
+            logger.warning("Not reusing the calculated values in '{}', they can't be read: {}".format(path, e))
+            return TransferCalcCache(path)
+        if not isinstance(content, dict) or content.get("version") != TransferCalcCache.VERSION:
+            logger.info("Not reusing the calculated values in '{}', they were saved by another version".format(path))
+            return TransferCalcCache(path)
+        logger.info("Reusing {} calculated values from '{}'".format(len(content["calculated"]), path))
+        return TransferCalcCache(path, content["calculated"])
+
+    def save(self):
+        """Saves the values to the path, if there is one and values have been calculated since they were loaded"""
+        if self.path is None or not self._has_changes:
+            return
+        directory = os.path.dirname(self.path)
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        # Written to another file first, so an interrupted write doesn't leave a broken file behind
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "wb") as fs:
+            pickle.dump({"version": self.VERSION, "calculated": self._calculated}, fs, self.PICKLE_PROTOCOL)
+        os.rename(temp_path, self.path)
+        self._has_changes = False
+
+    # Hashes of the source of the modules the calculation code is in, by module name
+    _source_hashes = dict()
+
+    @classmethod
+    def _source_hash(cls, module_name):
+        try:
+            return cls._source_hashes[module_name]
+        except KeyError:
+            pass
+        module = sys.modules.get(module_name)
+        path = getattr(module, "__file__", None)
+        if path is None:
+            source_hash = None
+        else:
+            path = inspect.getsourcefile(module) or path
+            with open(path, "rb") as fs:
+                source_hash = hashlib.sha1(fs.read()).hexdigest()
+        return cls._source_hashes.setdefault(module_name, source_hash)
+
+    @classmethod
+    def _type_fingerprint(cls, t):
+        """
+        The name of the type and a hash of the source of the modules it and its base classes are defined in,
+        so values calculated before the code was changed are not reused
+        """
+        modules = sorted(set(base.__module__ for base in t.__mro__ if base.__module__ != "__builtin__"))
+        return "{}.{}".format(t.__module__, t.__name__), tuple(cls._source_hash(module) for module in modules)
+
+    @classmethod
+    def _settings_fingerprint(cls, settings):
+        return cls._type_fingerprint(type(settings)), repr(sorted(vars(settings).items()))
+
+    @staticmethod
+    def _location_fingerprint(location):
+        if location is None:
+            return None
+        artifact = location.artifact
+        return (location.container.id if location.container else None, tuple(location.position),
+                artifact.id if artifact else None, artifact.is_control if artifact else None)
+
+    def _fingerprint(self, transfer, settings):
+        return (settings, tuple(getattr(transfer, value) for value in self.VALUES),
+                self._location_fingerprint(transfer.source_location),
+                self._location_fingerprint(transfer.target_location),
+                transfer.transfer_batch.split if transfer.transfer_batch else None)
+
+    def execute(self, dilution_service, handlers, transfer_batch, dilution_settings, robot_settings):
+        if not all(getattr(handler, "is_per_transfer", False) for handler in handlers if handler):
+            dilution_service.execute_handlers(handlers, transfer_batch, dilution_settings, robot_settings)
+            return
+
+        # The transfers are calculated with code in this module too, e.g. SingleTransfer
+        settings = (self._source_hash(__name__), tuple(self._type_fingerprint(type(handler)) for handler in handlers),
+                    self._settings_fingerprint(robot_settings), self._settings_fingerprint(dilution_settings))
+        changed = list()
+        for transfer in transfer_batch.transfers:
+            fingerprint = self._fingerprint(transfer, settings)
+            calculated = self._calculated.get(fingerprint)
+            if calculated is None:
+                changed.append((fingerprint, transfer))
+            else:
+                for value, calculated_value in zip(self.VALUES, calculated):
+                    setattr(transfer, value, calculated_value)
+        if not changed:
+            return
+
+        dilution_service.execute_handlers(handlers, TransferSubset(transfer_batch, [t for _, t in changed]),
+                                          dilution_settings, robot_settings)
+        for fingerprint, transfer in changed:
+            self._calculated[fingerprint] = tuple(getattr(transfer, value) for value in self.VALUES)
+        self._has_changes = True
+
+
+class TransferSubset(object):
+    """Looks like the TransferBatch, but only has some of its transfers"""
+
+    def __init__(self, transfer_batch, transfers):
+        self.transfer_batch = transfer_batch
+        self.transfers = transfers
+
+    def __getattr__(self, key):
+        return getattr(self.transfer_batch, key)
+
+
 class SingleTransfer(object):
     """
     Encapsulates a single transfer between two positions:
@@ -298,6 +526,13 @@ class SingleTransfer(object):
     SPLIT_ROW = 1
     SPLIT_BATCH = 2
 
+    # There is one instance per pair and robot, so the attributes are kept in slots to save memory. The __dict__
+    # slot is kept so extensions can still set their own attributes on transfers.
+    __slots__ = ("source_conc", "source_vol", "target_conc", "target_vol", "source_location", "target_location",
+                 "pipette_sample_volume", "pipette_buffer_volume", "has_to_evaporate", "scaled_up", "original",
+                 "source_vol_delta", "transfer_batch", "is_primary", "should_update_source_vol",
+                 "should_update_target_vol", "should_update_target_conc", "split_type", "__dict__")
+
     def __init__(self, source_conc, source_vol, target_conc, target_vol, source_location, target_location):
         self.source_conc = source_conc
         self.source_vol = source_vol
@@ -336,6 +571,14 @@ class SingleTransfer(object):
 
         self.split_type = SingleTransfer.SPLIT_NONE
 
+    def __copy__(self):
+        ret = object.__new__(type(self))
+        for attribute in SingleTransfer.__slots__:
+            if attribute != "__dict__":
+                setattr(ret, attribute, getattr(self, attribute))
+        ret.__dict__.update(self.__dict__)
+        return ret
+
     def _container_slot(self, is_source):
         if self.transfer_batch is None or self.source_location is None or self.target_location is None:
             return None
@@ -675,15 +918,27 @@ class TransferBatch(object):
         self.split = False
 
     def get_container_slot(self, container):
-        return self.container_to_container_slot[container]
+        slot = self._container_slot_by_identity.get(id(container))
+        if slot is None:
+            slot = self.container_to_container_slot[container]
+        return slot
 
     def _set_transfers(self, transfers, robot_settings):
         self._transfers_by_output_dict = None
+        self._container_mappings = None
+        self._target_container_slots = None
+        self._positions = None
         self._transfers = transfers
         self._sort_and_name_containers(robot_settings)
         for transfer in transfers:
             transfer.transfer_batch = self
 
+    def replace_transfers(self, transfers, robot_settings):
+        """
+        Replaces the transfers in the batch. The container slots and the transfers grouped by output
+        are updated accordingly, so always use this rather than changing the list in `transfers`.
+        """
+        self._set_transfers(list(transfers), robot_settings)
 
     def _sort_and_name_containers(self, robot_settings):
         """Updates the list of containers and assigns temporary names and positions to them"""
@@ -717,6 +972,10 @@ class TransferBatch(object):
             self.container_to_container_slot[container] = \
                 self._container_to_slot(robot_settings, container, ix, False)
 
+        # The transfers refer to the same container objects, so slots are looked up without hashing the containers
+        self._container_slot_by_identity = {id(slot.container): slot
+                                            for slot in self.container_to_container_slot.values()}
+
     @staticmethod
     def _container_to_slot(robot_settings, container, ix, is_source):
         slot = ContainerSlot(container, ix, None, is_source)
@@ -745,18 +1004,55 @@ class TransferBatch(object):
         transfers = sorted(self.transfers, key=group_key)
         return {k: list(t) for k, t in groupby(transfers, key=group_key)}
 
+    def sorted_transfers(self, robot_settings):
+        """
+        Returns the transfers sorted by the robot's transfer_sort_key.
+
+        With the default sort key, the source slots and wells of the transfers are only looked up once
+        per batch and the transfers are sorted on integer keys.
+        """
+        if robot_settings.transfer_sort_key is not RobotSettings.transfer_sort_key:
+            return sorted(self._transfers, key=robot_settings.transfer_sort_key)
+        if self._positions is None:
+            self._positions = self._source_positions()
+        # Sort on the volume (descending) first, then on the position. The sort is stable, so the result is
+        # the same as when sorting on (slot, well, -volume)
+        volumes = [-transfer.pipette_total_volume for transfer in self._transfers]
+        indexes = sorted(range(len(self._transfers)), key=volumes.__getitem__)
+        indexes.sort(key=self._positions.__getitem__)
+        return [self._transfers[ix] for ix in indexes]
+
+    def _source_positions(self):
+        """
+        Returns the position of each transfer's source, as the slot index and the well index packed
+        into one integer
+        """
+        slot_indexes = list()
+        well_indexes = list()
+        for transfer in self._transfers:
+            slot = self.get_container_slot(transfer.source_location.container)
+            assert slot.index is not None
+            slot_indexes.append(slot.index)
+            well_indexes.append(transfer.source_location.index_down_first)
+        well_count = max(well_indexes) + 1 if well_indexes else 1
+        return array("l", (slot_index * well_count + well_index
+                           for slot_index, well_index in zip(slot_indexes, well_indexes)))
+
     @property
     def container_mappings(self):
-        ret = set()
-        for transfer in self.transfers:
-            ret.add((transfer.source_slot, transfer.target_slot))
-        ret = list(sorted(ret, key=lambda t: t[0].index))
-        return ret
+        if self._container_mappings is None:
+            ret = set()
+            for transfer in self.transfers:
+                ret.add((transfer.source_slot, transfer.target_slot))
+            self._container_mappings = tuple(sorted(ret, key=lambda t: t[0].index))
+        return list(self._container_mappings)
 
     @property
     def target_container_slots(self):
-        return sorted(set(target for source, target in self.container_mappings),
-                      key=lambda cont: cont.index)
+        if self._target_container_slots is None:
+            self._target_container_slots = tuple(sorted(set(target for source, target in self.container_mappings),
+                                                         key=lambda cont: cont.index))
+        return list(self._target_container_slots)
 
     def validate(self, validator, robot_settings, dilution_settings):
         # Run the validator on the object and save the results on the object.
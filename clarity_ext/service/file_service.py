@@ -2,9 +2,10 @@ from __future__ import print_function
 import re
 import os
 import sys
+import csv
 import shutil
 import logging
-from lxml import objectify
+from lxml import etree, objectify
 import collections
 from clarity_ext import utils
 
@@ -39,10 +40,32 @@ class FileService:
             tree = objectify.parse(f)
             return tree.getroot()
 
+    def iterparse_xml(self, f, path):
+        """
+        Parses the file like object as XML and yields the elements that match the path, one at a time,
+        as objects with the same simple access as parse_xml returns.
+
+        Elements are removed from the tree when they have been processed, so the memory used doesn't
+        depend on the size of the file. Because of that, only the yielded element (and not e.g. its
+        parent or siblings) can be accessed, and only until the next element is requested.
+
+        :param path: The tag of the elements, e.g. "Well", or the tags of the element and its closest
+                     ancestors, e.g. "Plate/Well". A leading slash matches from the root, e.g.
+                     "/Run/Plate/Well". Namespaces are ignored.
+        """
+        with f:
+            for element in iterparse_elements(f, path):
+                yield element
+
     def parse_csv(self, f):
         with f:
             return Csv(f)
 
+    def parse_csv_table(self, f, columns=None, types=None, **fmtparams):
+        """Parses the file like object as a CsvTable. See CsvTable.read"""
+        with f:
+            return CsvTable.read(f, columns=columns, types=types, **fmtparams)
+
     def local_shared_file(self, file_name, mode='r', extension="", modify_attached=False):
         """
         Downloads the local shared file and returns an open file-like object.
@@ -109,12 +132,14 @@ class FileService:
 
         return self.file_repo.open_local_file(local_path, mode)
 
+    def shared_file_artifact(self, file_name):
+        """Returns the shared file with the name. Raises SharedFileNotFound if there isn't exactly one"""
+        return self._artifact_by_name(file_name)
+
     def _artifact_by_name(self, file_name):
-        shared_files = self.artifact_service.shared_files()
-        by_name = [shared_file for shared_file in shared_files
-                   if shared_file.name == file_name]
+        by_name = self.artifact_service.shared_files_by_name(file_name)
         if len(by_name) != 1:
-            files = ", ".join(map(lambda x: x.name, shared_files))
+            files = ", ".join(map(lambda x: x.name, self.artifact_service.shared_files()))
             raise SharedFileNotFound("Expected a shared file called '{}', got {}.\nFile: '{}'\nFiles: {}".format(
                 file_name, len(by_name), file_name, files))
         artifact = by_name[0]
@@ -152,8 +177,7 @@ class UploadFileService(object):
         :param file_handle: The name that this should be attached to in Clarity, e.g. "Step Log"
         :param files: A list of tuples, (file_name, file-like-object)
         """
-        artifacts = sorted([shared_file for shared_file in self.artifact_service.shared_files()
-                            if shared_file.name == file_handle], key=lambda f: f.id)
+        artifacts = sorted(self.artifact_service.shared_files_by_name(file_handle), key=lambda f: f.id)
         if len(files) > len(artifacts):
             raise SharedFileNotFound("Trying to upload {} files to '{}', but only {} are supported".format(
                             len(files), file_handle, len(artifacts)))
@@ -166,10 +190,10 @@ class UploadFileService(object):
         """
         :param file_handle: The handle of the file in the Clarity UI
         :param instance_name: The name of this particular file
-        :param content: The content of the file. Should be a string.
+        :param content: The content of the file. Either a string or an object that can write itself to
+                        a file with `write_to(stream)`, e.g. a Csv.
         """
-        artifact = utils.single([shared_file for shared_file in self.artifact_service.shared_files()
-                                 if shared_file.name == file_handle])
+        artifact = utils.single(self.artifact_service.shared_files_by_name(file_handle))
         self._upload_single(artifact, file_handle, instance_name, content, stdout_max_lines)
 
     def _upload_single(self, artifact, file_handle, instance_name, content,
@@ -209,7 +233,8 @@ class UploadFileService(object):
 
     def save_locally(self, content, filename):
         """
-        Saves a file locally before uploading it to the server. Content should be a string.
+        Saves a file locally before uploading it to the server. Content should be a string or an
+        object with a `write_to(stream)` method.
         """
         if not self.os_service.exists(self.upload_dir):
             self.logger.debug(
@@ -227,6 +252,8 @@ class UploadFileService(object):
                     f.write(content)
                 except UnicodeEncodeError:
                     f.write(content.encode("utf-8"))
+            elif hasattr(content, "write_to"):
+                content.write_to(f)
             else:
                 raise NotImplementedError("Type not supported")
         return full_path
@@ -236,11 +263,62 @@ class SharedFileNotFound(Exception):
     pass
 
 
-class Csv:
-    """A simple wrapper for csv files"""
+def iterparse_elements(f, path, chunk_size=64 * 1024):
+    """
+    Yields the elements in the XML file that match the path (see FileService.iterparse_xml), as
+    objectified elements. The file is read and parsed in chunks.
+
+    When an element has been processed, it's cleared and removed from the tree together with the
+    preceding siblings of it and its ancestors.
+    """
+    tags = path.split("/")
+    anchored = tags[0] == ""
+    if anchored:
+        tags = tags[1:]
+    # The tags of the ancestors, closest first
+    ancestor_tags = list(reversed(tags[:-1]))
+
+    def matches(element):
+        if not ancestor_tags and not anchored:
+            return True
+        ancestors = list(element.iterancestors())
+        if anchored and len(ancestors) != len(ancestor_tags):
+            return False
+        return [etree.QName(ancestor).localname for ancestor in ancestors[:len(ancestor_tags)]] == ancestor_tags
+
+    parser = etree.XMLPullParser(events=("end",), tag="{*}" + tags[-1])
+    parser.set_element_class_lookup(objectify.ObjectifyElementClassLookup())
+    while True:
+        data = f.read(chunk_size)
+        if data:
+            parser.feed(data)
+        else:
+            parser.close()
+        for _, element in parser.read_events():
+            if not matches(element):
+                continue
+            yield element
+            element.clear()
+            for processed in [element] + list(element.iterancestors()):
+                parent = processed.getparent()
+                while parent is not None and processed.getprevious() is not None:
+                    parent.remove(processed.getprevious())
+        if not data:
+            break
+
+
+class Csv(object):
+    """
+    A simple wrapper for csv files
+
+    The data lines can be read lazily from a row source (see set_row_source). The lines are then only
+    created when they are accessed, e.g. to inspect or change them. Until then, writing the file reads
+    the values directly from the source.
+    """
     def __init__(self, file_stream=None, delim=",", file_name=None, newline="\n"):
         self.header = list()
-        self.data = list()
+        self._data = list()
+        self._row_source = None
         if file_stream:
             if isinstance(file_stream, basestring):
                 with open(file_stream, "r") as fs:
@@ -264,6 +342,30 @@ class Csv:
         self.key_to_index = {key: ix for ix, key in enumerate(header)}
         self.header = header
 
+    def set_row_source(self, rows):
+        """
+        Reads the data lines from `rows` when they are needed, replacing the current lines.
+
+        :param rows: A function returning an iterator of (values, tag) tuples. It's called once when
+                     the lines are accessed and once each time the file is written before that.
+        """
+        self._data = list()
+        self._row_source = rows
+
+    @property
+    def data(self):
+        """The data lines as CsvLine objects. Lines from a row source are created on first access"""
+        if self._row_source is not None:
+            rows, self._row_source = self._row_source, None
+            for values, tag in rows():
+                self._data.append(CsvLine(values, self, tag))
+        return self._data
+
+    @data.setter
+    def data(self, value):
+        self._row_source = None
+        self._data = value
+
     def append(self, values, tag=None):
         """Appends a data line to the CSV, values is a list"""
         csv_line = CsvLine(values, self, tag)
@@ -272,13 +374,25 @@ class Csv:
     def __iter__(self):
         return iter(self.data)
 
-    def to_string(self, include_header=True):
-        ret = []
+    def _lines(self, include_header):
         if include_header:
-            ret.append(self.delim.join(map(str, self.header)))
-        for line in self.data:
-            ret.append(self.delim.join(map(str, line)))
-        return self.newline.join(ret)
+            yield self.delim.join(map(str, self.header))
+        if self._row_source is not None:
+            rows = (values for values, _ in self._row_source())
+        else:
+            rows = self._data
+        for values in rows:
+            yield self.delim.join(map(str, values))
+
+    def to_string(self, include_header=True):
+        return self.newline.join(self._lines(include_header))
+
+    def write_to(self, stream, include_header=True):
+        """Writes the file to the stream one line at a time"""
+        for ix, line in enumerate(self._lines(include_header)):
+            if ix > 0:
+                stream.write(self.newline)
+            stream.write(line)
 
 
 class CsvLine:
@@ -307,6 +421,95 @@ class CsvLine:
         return repr(self.values)
 
 
+class CsvTable(object):
+    """
+    A csv file, read with the csv module and stored with one list of values per column.
+
+    Compared to Csv, quoted values and dialects are supported and only the selected columns are
+    kept in memory. Rows are created only when they're accessed.
+    """
+
+    def __init__(self, header, columns):
+        """
+        :param header: The names of the columns, in order
+        :param columns: A dictionary from column name to a list of its values
+        """
+        self.header = header
+        self._columns = columns
+
+    @staticmethod
+    def read(file_stream, columns=None, types=None, **fmtparams):
+        """
+        Reads the csv file. The first row is the header.
+
+        :param file_stream: An open file-like object
+        :param columns: The names of the columns to keep. Defaults to all columns
+        :param types: A dictionary from column name to a function that converts a value, e.g. float.
+                      Empty values are converted to None
+        :param fmtparams: Dialect and formatting parameters for csv.reader, e.g. delimiter=";"
+        """
+        types = types or dict()
+        reader = csv.reader(file_stream, **fmtparams)
+        try:
+            file_header = next(reader)
+        except StopIteration:
+            file_header = list()
+        columns = list(columns) if columns is not None else file_header
+        missing = [name for name in columns if name not in file_header]
+        if missing:
+            raise ValueError("Columns not found in the csv file: {}".format(", ".join(missing)))
+        unknown = [name for name in types if name not in columns]
+        if unknown:
+            raise ValueError("Types given for columns that are not read: {}".format(", ".join(unknown)))
+
+        indexes = [file_header.index(name) for name in columns]
+        values = [list() for _ in columns]
+        # The values are added to their columns directly, so the rows are never kept in memory. Short rows are
+        # padded with empty values.
+        appenders = [(column_values.append, ix) for column_values, ix in zip(values, indexes)]
+        if appenders:
+            for row in reader:
+                if not row:
+                    continue
+                length = len(row)
+                for append, ix in appenders:
+                    append(row[ix] if ix < length else "")
+
+        for name, column_values in zip(columns, values):
+            if name in types:
+                convert = types[name]
+                try:
+                    column_values[:] = [convert(value) if value != "" else None for value in column_values]
+                except ValueError as ex:
+                    raise ValueError("Can't convert a value in column '{}': {}".format(name, ex))
+        return CsvTable(columns, dict(zip(columns, values)))
+
+    def __len__(self):
+        return len(self._columns[self.header[0]]) if self.header else 0
+
+    def column(self, name):
+        """Returns the values in the column as a list"""
+        return list(self._columns[name])
+
+    def row(self, ix):
+        """Returns the row as a dictionary from column name to value"""
+        return {name: self._columns[name][ix] for name in self.header}
+
+    def __iter__(self):
+        columns = [self._columns[name] for name in self.header]
+        for values in zip(*columns):
+            yield dict(zip(self.header, values))
+
+    def to_array(self, name, dtype=float):
+        """Returns the values in the column as a numpy array. Missing values are NaN"""
+        numpy = utils.import_numpy("to export a CsvTable to arrays")
+        return numpy.array([float("nan") if value is None else value for value in self._columns[name]], dtype=dtype)
+
+    def to_arrays(self, dtype=float):
+        """Returns a dictionary from column name to a numpy array of its values"""
+        return {name: self.to_array(name, dtype) for name in self.header}
+
+
 class OSService(object):
     """Provides access to OS file methods for testability"""
 
@@ -0,0 +1,140 @@
+import logging
+from multiprocessing.pool import ThreadPool
+from clarity_ext.service.file_service import SharedFileNotFound
+
+
+class PrefetchPlan(object):
+    """
+    Declares which data an extension needs. The data is fetched with batch and parallel
+    requests before the extension executes, so accessing it later requires no more requests.
+
+    The artifacts in the step and the process type are always fetched.
+    """
+
+    def __init__(self, samples=False, projects=False, containers=False, parent_inputs=False,
+                 shared_files=None):
+        """
+        :param samples: Fetch the samples of all artifacts
+        :param projects: Fetch the projects of all samples. Implies samples.
+        :param containers: Fetch the containers of all artifacts, including their container types
+        :param parent_inputs: Fetch the input artifacts of the parent processes, as used by
+                              `ArtifactService.get_parent_input_artifact`
+        :param shared_files: A list of shared file names that should be downloaded
+        """
+        self.samples = samples or projects
+        self.projects = projects
+        self.containers = containers
+        self.parent_inputs = parent_inputs
+        self.shared_files = shared_files or list()
+
+    def __repr__(self):
+        return "PrefetchPlan(samples={}, projects={}, containers={}, parent_inputs={}, shared_files={})".format(
+            self.samples, self.projects, self.containers, self.parent_inputs, self.shared_files)
+
+
+class PrefetchService(object):
+    """
+    Executes a PrefetchPlan. Resources that support it are fetched with batch requests,
+    others (e.g. projects and container types) are fetched in parallel.
+
+    The fetched resources are cached by the underlying REST library, so the domain objects are
+    built without further requests.
+    """
+
+    MAX_WORKERS = 8
+
+    def __init__(self, session, artifact_service, file_service, logger=None):
+        self.session = session
+        self.artifact_service = artifact_service
+        self.file_service = file_service
+        self.logger = logger or logging.getLogger(__name__)
+
+    def execute(self, plan):
+        self.logger.info("Executing {}".format(plan))
+        api = self.session.api
+        process = self.session.current_step.api_resource
+
+        artifacts = self._batch(self._step_artifacts(process))
+        to_get = [process.type]
+        if plan.samples:
+            samples = self._batch(self._unique(sample for artifact in artifacts for sample in artifact.samples))
+            if plan.projects:
+                to_get.extend(self._unique(sample.project for sample in samples if sample.project))
+        if plan.containers:
+            containers = self._batch(self._unique(artifact.location[0] for artifact in artifacts
+                                                  if artifact.location and artifact.location[0]))
+            to_get.extend(self._unique(container.type for container in containers))
+        self._get_parallel(to_get)
+
+        if plan.parent_inputs:
+            self._prefetch_parent_inputs(artifacts)
+
+        if plan.shared_files:
+            self._prefetch_shared_files(plan.shared_files)
+        self.logger.info("Prefetch done, {} resources cached".format(len(api.cache)))
+
+    def _prefetch_parent_inputs(self, artifacts):
+        parent_processes = self._unique(artifact.parent_process for artifact in artifacts
+                                        if artifact.parent_process)
+        self._get_parallel(parent_processes)
+        parent_inputs = self._batch(self._step_artifacts(*parent_processes))
+        self._batch(self._unique(sample for artifact in parent_inputs for sample in artifact.samples))
+        self._get_parallel(self._unique(process.type for process in parent_processes))
+
+    def _prefetch_shared_files(self, names):
+        """
+        Downloads the shared files, so they are available locally when the extension asks for them.
+        Files that are not in the step or have not been uploaded yet are skipped.
+
+        The files are downloaded one at a time, since the file service is not thread safe.
+        """
+        for name in names:
+            try:
+                artifact = self.file_service.shared_file_artifact(name)
+            except SharedFileNotFound as ex:
+                self.logger.warning("Not prefetching the shared file '{}': {}".format(name, ex))
+                continue
+            if len(artifact.files) == 0:
+                self.logger.info("Not prefetching the shared file '{}', it has not been uploaded".format(name))
+                continue
+            self.file_service.local_shared_file(name).close()
+
+    @staticmethod
+    def _step_artifacts(*processes):
+        """Returns the unique artifacts in the input output maps of the processes"""
+        ret = list()
+        for process in processes:
+            for input, output in process.input_output_maps:
+                ret.append(input["uri"])
+                ret.append(output["uri"])
+        return PrefetchService._unique(ret)
+
+    @staticmethod
+    def _unique(resources):
+        ret = list()
+        seen = set()
+        for resource in resources:
+            if resource.uri not in seen:
+                seen.add(resource.uri)
+                ret.append(resource)
+        return ret
+
+    def _batch(self, resources):
+        """Fetches the resources with one batch request. Only resources not already fetched are requested"""
+        resources = list(resources)
+        self.session.api.get_batch(resources)
+        return resources
+
+    def _get_parallel(self, resources):
+        self._in_parallel(lambda resource: resource.get(), [resource for resource in resources
+                                                            if resource.root is None])
+
+    def _in_parallel(self, fn, items):
+        if len(items) <= 1:
+            return map(fn, items)
+        pool = ThreadPool(min(len(items), self.MAX_WORKERS))
+        try:
+            return pool.map(fn, items)
+        finally:
+            pool.close()
+            pool.join()
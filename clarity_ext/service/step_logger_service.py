@@ -1,17 +1,37 @@
+import atexit
 import logging
 import sys
 import time
+import weakref
 from clarity_ext.service.file_service import SharedFileNotFound
 from clarity_ext.utils import lazyprop
 
+# The loggers that haven't been closed. They're flushed when the process exits, so buffered lines are
+# written even if the extension fails. Held weakly so the loggers can still be garbage collected
+_open_loggers = weakref.WeakSet()
+
+
+@atexit.register
+def _flush_open_loggers():
+    for logger in list(_open_loggers):
+        logger.flush()
+
 
 class StepLoggerService:
     """
     Provides support for logging to shared files in a step.
+
+    Lines are buffered and written to the file in one write when `flush_size` characters have been
+    buffered, when the logger is closed (when the context is cleaned up) and when the process exits.
+    Set flush_size to 0 to write each line when it's logged. Lines logged after the logger has been
+    closed are only forwarded to the core logger. Messages are forwarded to the core logger right away, in the
+    order they are logged.
     """
 
+    FLUSH_SIZE = 64 * 1024
+
     def __init__(self, step_logger_name, file_service, raise_if_not_found=False, append=True, extension="log",
-                 write_to_stdout=True):
+                 write_to_stdout=True, flush_size=FLUSH_SIZE):
         self.core_logger = logging.getLogger(__name__)
         self.step_logger_name = step_logger_name
         self.file_service = file_service
@@ -19,6 +39,14 @@ class StepLoggerService:
         self.append = append
         self.extension = extension
         self.write_to_stdout = write_to_stdout
+        self.flush_size = flush_size
+        self._buffer = list()
+        self._buffered_size = 0
+        self._time = (None, None)
+        # Loggers created with get, which are flushed and closed with this one
+        self._loggers = list()
+        self._closed = False
+        _open_loggers.add(self)
 
         # Use Windows line endings for now, since most clients are currently Windows.
         # TODO: This should be configurable.
@@ -36,15 +64,25 @@ class StepLoggerService:
             else:
                 return None
 
+    def _time_str(self):
+        # Only format the time once per second
+        now = int(time.time())
+        if self._time[0] != now:
+            self._time = (now, time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(now)))
+        return self._time[1]
+
     def _log(self, level, msg):
-        time_str = time.strftime("%Y-%m-%d %H:%M:%S")
-        msg = "{} - {}".format(time_str, msg)
-        if self.step_log:
+        msg = "{} - {}".format(self._time_str(), msg)
+        if not self._closed and self.step_log:
             # TODO: Get formatting from the core logging framework
             if level:
-                self.step_log.write("{} - {}".format(logging.getLevelName(level), msg + self.NEW_LINE))
+                line = "{} - {}".format(logging.getLevelName(level), msg + self.NEW_LINE)
             else:
-                self.step_log.write("{}".format(msg + self.NEW_LINE))
+                line = "{}".format(msg + self.NEW_LINE)
+            self._buffer.append(line)
+            self._buffered_size += len(line)
+            if self._buffered_size >= self.flush_size:
+                self.flush()
 
         # Forward to the core logger:
         if level:
@@ -66,7 +104,31 @@ class StepLoggerService:
         # Logs without forwarding to the core logger, and without any formatting
         self._log(None, msg)
 
+    def flush(self):
+        """Writes the buffered lines to the file, in one write"""
+        if self._closed:
+            return
+        if self._buffer:
+            content = "".join(self._buffer)
+            self._buffer = list()
+            self._buffered_size = 0
+            self.step_log.write(content)
+            self.step_log.flush()
+        for logger in self._loggers:
+            logger.flush()
+
+    def close(self):
+        """Writes the buffered lines and stops writing to the file, since it may be uploaded or removed after this"""
+        self.flush()
+        for logger in self._loggers:
+            logger.close()
+        self._closed = True
+        _open_loggers.discard(self)
+
     def get(self, name):
         # This factory method is added for readability in the extensions.
-        return StepLoggerService(name, self.file_service, raise_if_not_found=True, append=False)
+        logger = StepLoggerService(name, self.file_service, raise_if_not_found=True, append=False,
+                                   flush_size=self.flush_size)
+        self._loggers.append(logger)
+        return logger
 
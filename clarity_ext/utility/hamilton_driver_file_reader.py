@@ -1,11 +1,61 @@
+from array import array
+from collections import namedtuple
+
+
 class HamiltonReader(object):
+    """
+    Reads a Hamilton driver or result file, with one tab separated transfer per row. The columns
+    are described by HamiltonColumnReference.
+
+    The file is read one line at a time. Besides the raw values (`matrix`), the rows are parsed into
+    HamiltonRow objects, which are indexed by sample, source well and target well. The volumes are
+    also available as arrays of floats. Rows that can't be parsed, e.g. headers, are None in `rows`
+    and are not indexed.
+    """
 
     def __init__(self, filecontents):
+        """
+        :param filecontents: The content of the file as a string, or an open file
+        """
         self._delimiter = "\t"
-        rows = filter(lambda rw: len(rw) > 0, filecontents.split("\n"))
-        self.matrix = [row.split(self._delimiter) for row in rows]
-        entries = [(rw[0], rw) for rw in self.matrix]
-        self.dict_matrix = dict(entries)
+        lines = filecontents.split("\n") if isinstance(filecontents, basestring) else filecontents
+        column_ref = HamiltonColumnReference()
+        self.matrix = list()
+        self.rows = list()
+        self.sample_volumes = array("d")
+        self.buffer_volumes = array("d")
+        self._rows_by_sample = dict()
+        self._rows_by_source_well = dict()
+        self._rows_by_target_well = dict()
+        self._dict_matrix = None
+        for line in lines:
+            line = line.rstrip("\n")
+            if len(line) == 0:
+                continue
+            values = line.split(self._delimiter)
+            self.matrix.append(values)
+            try:
+                row = HamiltonRow.parse(values, column_ref)
+            except (ValueError, IndexError):
+                row = None
+            self.rows.append(row)
+            if row is None:
+                continue
+            self.sample_volumes.append(row.sample_volume)
+            self.buffer_volumes.append(row.buffer_volume)
+            self._rows_by_sample.setdefault(row.sample, list()).append(row)
+            self._rows_by_source_well.setdefault((row.source_plate, row.source_well), list()).append(row)
+            self._rows_by_target_well.setdefault((row.target_plate, row.target_well), list()).append(row)
+
+    @property
+    def dict_matrix(self):
+        """
+        The raw values by the first column. If there is more than one row for a sample, only the last
+        one is included. Use rows_by_sample to get all of them.
+        """
+        if self._dict_matrix is None:
+            self._dict_matrix = dict((rw[0], rw) for rw in self.matrix)
+        return self._dict_matrix
 
     def number_columns(self):
         return len(self.matrix[0])
@@ -13,6 +63,106 @@ class HamiltonReader(object):
     def number_rows(self):
         return len(self.matrix)
 
+    def rows_by_sample(self, sample):
+        return list(self._rows_by_sample.get(sample, ()))
+
+    def rows_by_source_well(self, plate, well):
+        """Returns the rows that transfer from the well (the well index on the robot) in the plate"""
+        return list(self._rows_by_source_well.get((plate, well), ()))
+
+    def rows_by_target_well(self, plate, well):
+        """Returns the rows that transfer to the well (the well index on the robot) in the plate"""
+        return list(self._rows_by_target_well.get((plate, well), ()))
+
+    def reconcile(self, transfers, robot_settings, tolerance=0.05):
+        """
+        Compares the rows in the file with the transfers that were expected, e.g. the transfers in a
+        TransferBatch of a DilutionSession.
+
+        Transfers and rows are matched on their source and target plate and well. The volumes are summed
+        per source and target, so transfers that are split over several rows are matched too.
+
+        :param transfers: The expected transfers (SingleTransfer objects)
+        :param robot_settings: The settings of the robot that created the file. Transfers it doesn't
+                               include in its driver files are ignored.
+        :param tolerance: The largest difference in volume that is not reported as a mismatch
+        """
+        expected = dict()
+        for transfer in transfers:
+            if not robot_settings.include_transfer_in_output(transfer):
+                continue
+            key = (transfer.source_slot.name, robot_settings.get_index_from_well(transfer.source_location),
+                   transfer.target_slot.name, robot_settings.get_index_from_well(transfer.target_location))
+            volumes = expected.setdefault(key, [0.0, 0.0])
+            volumes[0] += transfer.pipette_sample_volume
+            volumes[1] += transfer.pipette_buffer_volume
+
+        actual = dict()
+        for row in self.rows:
+            if row is None:
+                continue
+            volumes = actual.setdefault((row.source_plate, row.source_well, row.target_plate, row.target_well),
+                                        [0.0, 0.0])
+            volumes[0] += row.sample_volume
+            volumes[1] += row.buffer_volume
+
+        ret = HamiltonReconciliation()
+        for key, expected_volumes in expected.items():
+            actual_volumes = actual.get(key)
+            if actual_volumes is None:
+                ret.missing.append(key)
+            elif any(abs(e - a) > tolerance for e, a in zip(expected_volumes, actual_volumes)):
+                ret.mismatched.append((key, tuple(expected_volumes), tuple(actual_volumes)))
+            else:
+                ret.matched.append(key)
+        ret.unexpected.extend(key for key in actual if key not in expected)
+        for keys in (ret.matched, ret.mismatched, ret.missing, ret.unexpected):
+            keys.sort()
+        return ret
+
+
+class HamiltonRow(namedtuple("HamiltonRow", ["sample", "source_well", "source_plate", "sample_volume",
+                                             "buffer_volume", "target_well", "target_plate"])):
+    """One transfer in a Hamilton file, with the wells as integers and the volumes as floats"""
+    __slots__ = ()
+
+    @staticmethod
+    def parse(values, column_ref):
+        return HamiltonRow(values[column_ref.sample].strip(),
+                           int(values[column_ref.source_well_pos]),
+                           values[column_ref.source_plate_pos].strip(),
+                           float(values[column_ref.volume_sample]),
+                           float(values[column_ref.volume_buffer]),
+                           int(values[column_ref.target_well_pos]),
+                           values[column_ref.target_plate_pos].strip())
+
+
+class HamiltonReconciliation(object):
+    """
+    The result of comparing a Hamilton file with the expected transfers. Transfers are identified by
+    (source plate, source well, target plate, target well).
+
+    matched: The transfers found in the file with the expected volumes
+    mismatched: (transfer, expected volumes, volumes in the file) for transfers with other volumes.
+                Volumes are (sample volume, buffer volume)
+    missing: Expected transfers not found in the file
+    unexpected: Transfers in the file that were not expected
+    """
+
+    def __init__(self):
+        self.matched = list()
+        self.mismatched = list()
+        self.missing = list()
+        self.unexpected = list()
+
+    @property
+    def ok(self):
+        return not (self.mismatched or self.missing or self.unexpected)
+
+    def __repr__(self):
+        return "HamiltonReconciliation(matched={}, mismatched={}, missing={}, unexpected={})".format(
+            len(self.matched), len(self.mismatched), len(self.missing), len(self.unexpected))
+
 
 class HamiltonColumnReference(object):
 
@@ -0,0 +1,218 @@
+"""
+A record/replay cache for HTTP requests, used when testing and validating extensions.
+
+Responses are stored in a compact, append-only file. Each record contains a normalized
+key (method, url and a hash of the body) and the raw bytes of the response. The file is
+read into memory once when the cache is created, so replaying a request is a dictionary lookup.
+
+Only the parts of the request that make up the key are saved. Request headers, and therefore
+the AUTH_HEADER, are never written to the file.
+"""
+import os
+import re
+import json
+import zlib
+import struct
+import hashlib
+import logging
+import threading
+from urllib import urlencode
+from urlparse import urlsplit, urlunsplit, parse_qsl
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+
+class ReplayCache(object):
+    """
+    Records HTTP responses to a file and replays them on later requests with the same key.
+
+    File format: The file starts with MAGIC, followed by records in the order they were recorded.
+    Each record is a RECORD_HEADER (key length, flags, meta length, body length) followed by the
+    key, a json document with the status and headers and the body. If the same key is recorded
+    more than once, the last record wins.
+    """
+
+    MAGIC = b"CLARITY-EXT-REPLAY-1\n"
+    RECORD_HEADER = struct.Struct(">IBII")
+    FLAG_COMPRESSED = 1
+
+    # Only successful responses are recorded
+    ALLOWABLE_CODES = (200, 201, 204)
+
+    # Response headers that are required to replay the response. All others are dropped, since
+    # they might contain session information (e.g. Set-Cookie) or be invalid for the recorded
+    # body (e.g. Content-Encoding)
+    KEPT_HEADERS = ("Content-Type",)
+
+    _installed = None
+
+    def __init__(self, path, logger=None):
+        self.path = path
+        self.logger = logger or logging.getLogger(__name__)
+        self.responses = dict()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb") as fs:
+            content = fs.read()
+        if not content.startswith(self.MAGIC):
+            raise ReplayCacheFormatError("'{}' is not a replay cache file".format(self.path))
+
+        offset = len(self.MAGIC)
+        while offset < len(content):
+            key_len, flags, meta_len, body_len = self.RECORD_HEADER.unpack_from(content, offset)
+            offset += self.RECORD_HEADER.size
+            key = content[offset:offset + key_len].decode("utf-8")
+            offset += key_len
+            meta = content[offset:offset + meta_len]
+            offset += meta_len
+            body = content[offset:offset + body_len]
+            offset += body_len
+            if len(body) != body_len:
+                # The last record was not completely written, e.g. if the process was killed
+                self.logger.warning("Ignoring a truncated record at the end of '{}'".format(self.path))
+                break
+            self.responses[key] = (flags, meta, body)
+        self.logger.debug("Loaded {} responses from '{}'".format(len(self.responses), self.path))
+
+    @staticmethod
+    def create_key(method, url, body=None, content_type=None):
+        """
+        Creates the key for a request. The query parameters are sorted and credentials in
+        the url are removed. The body is represented by its SHA1 hash.
+        """
+        scheme, netloc, path, query, _ = urlsplit(url)
+        netloc = netloc.rsplit("@", 1)[-1].lower()
+        query = urlencode(sorted(parse_qsl(query, keep_blank_values=True)))
+        key = "{} {}".format(method.upper(), urlunsplit((scheme.lower(), netloc, path, query, "")))
+        if body:
+            if isinstance(body, unicode):
+                body = body.encode("utf-8")
+            # Multipart bodies (e.g. file uploads) contain a random boundary:
+            boundary = ReplayCache._multipart_boundary(content_type)
+            if boundary:
+                body = body.replace(boundary, b"boundary")
+            key += " " + hashlib.sha1(body).hexdigest()
+        return key
+
+    @staticmethod
+    def _multipart_boundary(content_type):
+        if content_type:
+            match = re.search(r"boundary=([^;\s]+)", content_type)
+            if match:
+                return match.group(1).encode("utf-8")
+        return None
+
+    def _key_from_request(self, request):
+        return self.create_key(request.method, request.url, request.body,
+                               request.headers.get("Content-Type"))
+
+    def __contains__(self, key):
+        return key in self.responses
+
+    def __len__(self):
+        return len(self.responses)
+
+    def replay(self, request):
+        """Returns the recorded response for the request or None if it hasn't been recorded"""
+        key = self._key_from_request(request)
+        entry = self.responses.get(key)
+        if entry is None:
+            return None
+        flags, meta, body = entry
+        if flags & self.FLAG_COMPRESSED:
+            body = zlib.decompress(body)
+        meta = json.loads(meta)
+
+        response = requests.Response()
+        response.status_code = meta["status"]
+        response.reason = meta["reason"]
+        response.headers = CaseInsensitiveDict(meta["headers"])
+        response.encoding = get_encoding_from_headers(response.headers)
+        response._content = body
+        response._content_consumed = True
+        response.url = request.url
+        response.request = request
+        response.from_cache = True
+        return response
+
+    def record(self, request, response):
+        """
+        Appends the response to the cache file. The body is read, so the response must
+        not be streamed by the caller after this.
+        """
+        if response.status_code not in self.ALLOWABLE_CODES:
+            return False
+        key = self._key_from_request(request)
+        headers = {name: response.headers[name] for name in self.KEPT_HEADERS if name in response.headers}
+        meta = json.dumps({"status": response.status_code, "reason": response.reason, "headers": headers})
+        body = response.content or b""
+        flags = 0
+        compressed = zlib.compress(body)
+        if len(compressed) < len(body):
+            body = compressed
+            flags |= self.FLAG_COMPRESSED
+
+        encoded_key = key.encode("utf-8")
+        record = self.RECORD_HEADER.pack(len(encoded_key), flags, len(meta), len(body)) + \
+            encoded_key + meta + body
+        with self._lock:
+            is_new = not os.path.exists(self.path)
+            with open(self.path, "ab") as fs:
+                if is_new:
+                    fs.write(self.MAGIC)
+                fs.write(record)
+            self.responses[key] = (flags, meta, body)
+        return True
+
+    def send(self, send, adapter, request, **kwargs):
+        """
+        Replays the request if it has been recorded. Otherwise, it's sent with `send` and the
+        response is recorded.
+        """
+        response = self.replay(request)
+        if response is not None:
+            self.hits += 1
+            response.connection = adapter
+            return response
+        self.misses += 1
+        response = send(adapter, request, **kwargs)
+        self.record(request, response)
+        return response
+
+    def install(self):
+        """
+        Routes all requests through this cache, replacing any other installed ReplayCache.
+
+        All sessions in the requests library send through an HTTPAdapter, so patching the adapter
+        ensures that requests sent by the genologics package are cached too.
+        """
+        ReplayCache.uninstall()
+        original_send = HTTPAdapter.send
+
+        def send(adapter, request, **kwargs):
+            return self.send(original_send, adapter, request, **kwargs)
+
+        HTTPAdapter.send = send
+        ReplayCache._installed = (self, original_send)
+        self.logger.info("Using replay cache '{}' ({} responses)".format(self.path, len(self)))
+
+    @staticmethod
+    def uninstall():
+        """Removes the installed ReplayCache, if any"""
+        if ReplayCache._installed is not None:
+            cache, original_send = ReplayCache._installed
+            HTTPAdapter.send = original_send
+            ReplayCache._installed = None
+            cache.logger.info("Replay cache '{}': {} hits, {} misses".format(cache.path, cache.hits, cache.misses))
+
+
+class ReplayCacheFormatError(Exception):
+    pass
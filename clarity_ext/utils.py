@@ -3,6 +3,8 @@ import os
 import shutil
 import hashlib
 import logging
+import threading
+from Queue import Queue
 from contextlib import contextmanager
 import types
 
@@ -56,6 +58,24 @@ def use_requests_cache(cache):
         cache, allowable_methods=('GET', 'POST', 'DELETE', 'PUT'))
 
 
+def stop_requests_cache():
+    """Turns off caching for the requests library, if it has been turned on with use_requests_cache"""
+    requests_cache.uninstall_cache()
+
+
+def import_numpy(required_by):
+    """
+    Imports numpy, which is an optional dependency
+
+    :param required_by: Describes what needs numpy, used in the error message if it's not installed
+    """
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError("numpy is required {}. Install it with `pip install numpy`".format(required_by))
+    return numpy
+
+
 def clean_directory(path, skip=[]):
     """Helper method for cleaning a directory. Skips names in the skip list."""
     to_remove = (os.path.join(path, file_or_dir)
@@ -157,6 +177,74 @@ def add_log_file_handler(path, use_timestamp, filter=None, mode='w'):
     root_logger.removeHandler(file_handler)
 
 
+class QueueHandler(logging.Handler):
+    """
+    Puts log records on a queue, from which a QueueListener passes them to the handlers that do the
+    formatting and the I/O, on another thread.
+
+    The message is merged with its arguments before the record is queued, since the arguments may
+    change after the call (e.g. a transfer that is logged before it's calculated).
+    """
+
+    def __init__(self, queue):
+        logging.Handler.__init__(self)
+        self.queue = queue
+
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def emit(self, record):
+        try:
+            self.queue.put_nowait(self.prepare(record))
+        except Exception:
+            self.handleError(record)
+
+
+class QueueListener(object):
+    """Passes log records from a queue, filled by a QueueHandler, to the handlers on a background thread"""
+
+    _sentinel = None
+
+    def __init__(self, queue, *handlers):
+        self.queue = queue
+        self.handlers = handlers
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._monitor, name="QueueListener")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _monitor(self):
+        while True:
+            record = self.queue.get()
+            if record is self._sentinel:
+                break
+            for handler in self.handlers:
+                if record.levelno >= handler.level:
+                    handler.handle(record)
+
+    def stop(self):
+        """Handles the records already on the queue and stops the thread"""
+        if self._thread is not None:
+            self.queue.put(self._sentinel)
+            self._thread.join()
+            self._thread = None
+
+
+def create_queue_logging(*handlers):
+    """Returns a QueueHandler and a started QueueListener that passes its records to the handlers"""
+    queue = Queue()
+    listener = QueueListener(queue, *handlers)
+    listener.start()
+    return QueueHandler(queue), listener
+
+
 def get_jinja_template_from_package(package, name):
     """Loads a Jinja template from the package"""
     templates_dir = os.path.dirname(package.__file__)
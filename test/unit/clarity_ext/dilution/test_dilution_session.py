@@ -0,0 +1,243 @@
+import os
+import shutil
+import tempfile
+import unittest
+from mock import patch
+from clarity_ext.utility import testing
+from clarity_ext.service.dilution.service import DilutionSession, DilutionSettings, RobotSettings, DilutionValidatorBase
+import copy
+from clarity_ext.service.dilution.handlers import (OneToOneConcentrationCalcHandler, TransferBatchHandlerBase,
+                                                   TransferSplitHandlerBase)
+from clarity_ext.service.dilution.service import SingleTransfer, TransferCalcCache
+
+
+class FakeRobot(RobotSettings):
+    def __init__(self, name, dilution_waste_volume):
+        super(FakeRobot, self).__init__()
+        self.name = name
+        self.file_handle = name
+        self.newline = "\n"
+        self.file_ext = "csv"
+        self.delimiter = ","
+        self.dilution_waste_volume = dilution_waste_volume
+        self.pipette_min_volume = 2.0
+        self.pipette_max_volume = 50
+        self.max_pipette_vol_for_row_split = 500
+        self.header = ["Sample", "SrcWell", "SampleVol", "BufVol", "TgtWell"]
+
+    def get_container_handle_name(self, slot):
+        return "{}{}".format("DNA" if slot.is_source else "END", slot.index + 1)
+
+    def get_index_from_well(self, well):
+        return well.index_down_first
+
+    def get_filename(self, csv, context, ix=0):
+        return "{}_{}.csv".format(self.name, ix)
+
+    def map_transfer_to_row(self, transfer):
+        return [transfer.source_location.artifact.name, transfer.source_location.index_down_first,
+                transfer.pipette_sample_volume, transfer.pipette_buffer_volume,
+                transfer.target_location.index_down_first]
+
+
+class FakeBatchHandler(TransferBatchHandlerBase):
+    def needs_split(self, transfer, dilution_settings, robot_settings):
+        return transfer.pipette_sample_volume < robot_settings.pipette_min_volume
+
+
+class FakeRowSplitHandler(TransferSplitHandlerBase):
+    def needs_row_split(self, transfer, dilution_settings, robot_settings):
+        return transfer.pipette_sample_volume > 10
+
+    def split_single_transfer(self, transfer, robot_settings):
+        ret = list()
+        for ix in range(2):
+            split_transfer = copy.copy(transfer)
+            split_transfer.pipette_sample_volume = transfer.pipette_sample_volume / 2.0
+            split_transfer.pipette_buffer_volume = transfer.pipette_buffer_volume / 2.0
+            split_transfer.is_primary = ix == 0
+            split_transfer.split_type = SingleTransfer.SPLIT_ROW
+            ret.append(split_transfer)
+        return ret
+
+
+class FakeValidator(DilutionValidatorBase):
+    def rules(self, transfer, robot_settings, dilution_settings):
+        if transfer.pipette_sample_volume > 10:
+            yield self.warning("Large sample volume")
+
+    def pre_conditions(self, transfer, robot_settings, dilution_settings):
+        return []
+
+
+class TestDilutionSession(unittest.TestCase):
+
+    @staticmethod
+    def create_pairs():
+        helper = testing.DilutionTestDataHelper(DilutionSettings.CONCENTRATION_REF_NGUL)
+        for ix in range(20):
+            helper.create_dilution_pair([20.0, 100.0, 1000.0][ix % 3], 40.0, [1.0, 10.0][ix % 2], 40.0)
+        return helper.pairs
+
+    @staticmethod
+    def create_session(context):
+        dilution_settings = DilutionSettings(concentration_ref=DilutionSettings.CONCENTRATION_REF_NGUL,
+                                             volume_calc_method=DilutionSettings.VOLUME_CALC_BY_CONC)
+        robots = [FakeRobot(name, waste) for name, waste in [("Hamilton", 1.0), ("Biomek", 2.0), ("Other", 3.0)]]
+        return context.context.dilution_service.create_session(
+            robots, dilution_settings, FakeBatchHandler, None, FakeValidator(), context.context,
+            [OneToOneConcentrationCalcHandler])
+
+    @staticmethod
+    def driver_files(session):
+        return {robot: [(batch.driver_file.file_name, batch.driver_file.to_string())
+                        for batch in session.transfer_batches(robot)]
+                for robot in session.transfer_batches_by_robot}
+
+    def evaluate(self):
+        context = testing.TestExtensionContext()
+        session = self.create_session(context)
+        session.evaluate(self.create_pairs())
+        return self.driver_files(session), [str(result) for result in context.logged_validation_results()]
+
+    def test_transfer_plan_is_shared_by_robots(self):
+        original = DilutionSession.initialize_transfer_from_settings
+        with patch.object(DilutionSession, "initialize_transfer_from_settings", autospec=True,
+                          side_effect=original) as initialize_transfer:
+            driver_files, _ = self.evaluate()
+        self.assertEqual(3, len(driver_files))
+        self.assertEqual(20, initialize_transfer.call_count)
+
+    def test_robots_get_their_own_wells_and_containers(self):
+        context = testing.TestExtensionContext()
+        session = self.create_session(context)
+        pairs = self.create_pairs()
+        session.evaluate(pairs)
+        plan = session.transfer_plan(pairs, session.dilution_settings)
+        locations = [[(t.source_location, t.target_location) for t in batch.transfers]
+                     for batch in (session.transfer_batches(robot)[0] for robot in session.transfer_batches_by_robot)]
+        locations.append([(t.source_location, t.target_location) for t in plan])
+        wells = [well for robot_locations in locations for pair in robot_locations for well in pair]
+        self.assertEqual(len(wells), len(set(id(well) for well in wells)))
+        containers_by_robot = [set(id(well.container) for pair in robot_locations for well in pair)
+                               for robot_locations in locations]
+        for ix, containers in enumerate(containers_by_robot):
+            for other in containers_by_robot[ix + 1:]:
+                self.assertFalse(containers & other)
+        # The plan refers to the original containers
+        self.assertTrue(all(transfer.source_location.container is pair.input_artifact.container
+                            for transfer, pair in zip(plan, pairs)))
+
+    def create_incremental_session(self, calc_cache_dir):
+        session = self.create_session(testing.TestExtensionContext())
+        session.calc_cache_dir = calc_cache_dir
+        return session
+
+    @staticmethod
+    def count_calculated(session, pairs):
+        original = OneToOneConcentrationCalcHandler.handle_transfer
+        with patch.object(OneToOneConcentrationCalcHandler, "handle_transfer", autospec=True,
+                          side_effect=original) as handle_transfer:
+            session.evaluate(pairs, incremental=True)
+        return handle_transfer.call_count
+
+    def test_incremental_evaluation_only_calculates_changed_transfers(self):
+        pairs = self.create_pairs()
+        session = self.create_incremental_session(None)
+        self.assertTrue(self.count_calculated(session, pairs) > 0)
+
+        pairs[0].output_artifact.udf_map["Target conc. (ng/ul)"] = 5.0
+        # Only the changed transfer is calculated again, once in the original batch and once in the final batch
+        # of each of the three robots
+        self.assertEqual(6, self.count_calculated(session, pairs))
+
+        full_session = self.create_session(testing.TestExtensionContext())
+        full_session.evaluate(pairs)
+        self.assertEqual(self.driver_files(full_session), self.driver_files(session))
+
+    def test_incremental_evaluation_reuses_values_saved_in_the_step(self):
+        calc_cache_dir = tempfile.mkdtemp()
+        try:
+            pairs = self.create_pairs()
+            session = self.create_incremental_session(calc_cache_dir)
+            self.assertTrue(self.count_calculated(session, pairs) > 0)
+            self.assertEqual(["dilution_calc_24-1234.pickle"], os.listdir(calc_cache_dir))
+
+            # A new session, as when the extension runs again, doesn't calculate anything that hasn't changed
+            rerun_session = self.create_incremental_session(calc_cache_dir)
+            self.assertEqual(0, self.count_calculated(rerun_session, pairs))
+            self.assertEqual(self.driver_files(session), self.driver_files(rerun_session))
+        finally:
+            shutil.rmtree(calc_cache_dir)
+
+    def test_incremental_evaluation_recalculates_when_the_handlers_have_changed(self):
+        calc_cache_dir = tempfile.mkdtemp()
+        try:
+            pairs = self.create_pairs()
+            session = self.create_incremental_session(calc_cache_dir)
+            calculated = self.count_calculated(session, pairs)
+            # As if the module with the handler had been edited before the extension runs again
+            with patch.dict(TransferCalcCache._source_hashes, {OneToOneConcentrationCalcHandler.__module__: "changed"}):
+                rerun_session = self.create_incremental_session(calc_cache_dir)
+                self.assertEqual(calculated, self.count_calculated(rerun_session, pairs))
+        finally:
+            shutil.rmtree(calc_cache_dir)
+
+    def test_incremental_evaluation_ignores_unreadable_saved_values(self):
+        calc_cache_dir = tempfile.mkdtemp()
+        try:
+            with open(os.path.join(calc_cache_dir, "dilution_calc_24-1234.pickle"), "wb") as fs:
+                fs.write("not a pickle")
+            pairs = self.create_pairs()
+            session = self.create_incremental_session(calc_cache_dir)
+            self.assertTrue(self.count_calculated(session, pairs) > 0)
+            rerun_session = self.create_incremental_session(calc_cache_dir)
+            self.assertEqual(0, self.count_calculated(rerun_session, pairs))
+        finally:
+            shutil.rmtree(calc_cache_dir)
+
+    def test_row_split_replaces_transfers_in_batch(self):
+        context = testing.TestExtensionContext()
+        session = self.create_session(context)
+        robot = session.robot_settings[0]
+        batch = session.create_batch(self.create_pairs(), robot, session.dilution_settings,
+                                     session.transfer_calc_handlers)
+        self.assertEqual(20, len(batch.transfers_by_output))
+        to_split = [t for t in batch.transfers if t.pipette_sample_volume > 10]
+        self.assertTrue(0 < len(to_split) < 20)
+
+        FakeRowSplitHandler(session).handle_batch(batch, session.dilution_settings, robot)
+
+        self.assertEqual(20 + len(to_split), len(batch.transfers))
+        self.assertFalse(any(any(t is split for split in to_split) for t in batch.transfers))
+        self.assertTrue(all(t.transfer_batch is batch for t in batch.transfers))
+        # The grouping by output is not stale after the split
+        for transfer in to_split:
+            self.assertEqual(2, len(batch.transfers_by_output[transfer.target_location.artifact.id]))
+
+    def test_transfer_keeps_custom_attributes_when_copied(self):
+        transfer = SingleTransfer(10, 20, 5, 40, None, None)
+        transfer.custom_comment = "Extra mixing"
+        copied = copy.copy(transfer)
+        self.assertEqual("Extra mixing", copied.custom_comment)
+        self.assertEqual(40, copied.target_vol)
+        copied.custom_comment = "No mixing"
+        self.assertEqual("Extra mixing", transfer.custom_comment)
+
+    def test_sorted_transfers_same_as_sorting_on_transfer_sort_key(self):
+        session = self.create_session(testing.TestExtensionContext())
+        robot = session.robot_settings[0]
+        pairs = self.create_pairs()
+        pairs.extend(self.create_pairs())
+        batch = session.create_batch(pairs, robot, session.dilution_settings, session.transfer_calc_handlers)
+        expected = sorted(batch.transfers, key=lambda t: (t.source_slot.index, t.source_location.index_down_first,
+                                                          -t.pipette_total_volume))
+        actual = batch.sorted_transfers(robot)
+        self.assertEqual(len(expected), len(actual))
+        self.assertTrue(all(a is b for a, b in zip(expected, actual)))
+
+    def test_streamed_driver_files_same_as_created_when_evaluated(self):
+        session = self.create_session(testing.TestExtensionContext())
+        session.stream_driver_files = True
+        session.evaluate(self.create_pairs())
+        self.assertEqual(self.evaluate()[0], self.driver_files(session))
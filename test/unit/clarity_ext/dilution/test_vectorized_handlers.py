@@ -0,0 +1,85 @@
+import random
+import unittest
+from mock import MagicMock
+from clarity_ext.service.dilution.handlers import (OneToOneConcentrationCalcHandler, FixedVolumeCalcHandler,
+                                                   VectorizedOneToOneConcentrationCalcHandler,
+                                                   VectorizedFixedVolumeCalcHandler)
+from clarity_ext.service.dilution.service import SingleTransfer
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+CALCULATED = ["pipette_sample_volume", "pipette_buffer_volume", "has_to_evaporate", "scaled_up",
+              "source_vol_delta"]
+
+
+@unittest.skipIf(numpy is None, "numpy is not installed")
+class TestVectorizedHandlers(unittest.TestCase):
+
+    def setUp(self):
+        self.robot_settings = MagicMock(dilution_waste_volume=1.0, pipette_min_volume=2.0)
+
+    def create_transfer_lists(self, count):
+        """Returns two lists of equal, but separate, transfers"""
+        rnd = random.Random(1)
+        batches = [MagicMock(split=False), MagicMock(split=True)]
+        sources = [MagicMock(), MagicMock()]
+        sources[1].artifact.is_control = True
+        sources[0].artifact.is_control = False
+        ret = ([], [])
+        for _ in range(count):
+            # Values with many decimals, so there are ties when rounding to one decimal
+            values = [rnd.choice([1.0, 3.3, 12.35, 20.0, 100.0, 333.3]), 40.0,
+                      rnd.choice([0.5, 1.0, 2.05, 10.0]), rnd.choice([10.0, 20.45, 40.0, 120.0])]
+            source = sources[1] if rnd.random() < 0.1 else sources[0]
+            batch = rnd.choice(batches)
+            sample_volume = rnd.choice([0, 4.25, 10.05])
+            for transfers in ret:
+                transfer = SingleTransfer(*values, source_location=source, target_location=None)
+                transfer.transfer_batch = batch
+                transfer.pipette_sample_volume = sample_volume
+                transfers.append(transfer)
+        return ret
+
+    def assert_same_results(self, handler, vectorized_handler):
+        transfers, vectorized_transfers = self.create_transfer_lists(500)
+        for transfer in transfers:
+            handler.handle_transfer(transfer, None, self.robot_settings)
+        vectorized_handler.handle_batch(MagicMock(transfers=vectorized_transfers), None, self.robot_settings)
+        for transfer, vectorized_transfer in zip(transfers, vectorized_transfers):
+            for attribute in CALCULATED:
+                self.assertEqual(repr(getattr(transfer, attribute)), repr(getattr(vectorized_transfer, attribute)),
+                                 "{} differs for {}".format(attribute, transfer))
+
+    def test_one_to_one_concentration(self):
+        self.assert_same_results(OneToOneConcentrationCalcHandler(None),
+                                 VectorizedOneToOneConcentrationCalcHandler(None))
+
+    def test_fixed_volume(self):
+        self.assert_same_results(FixedVolumeCalcHandler(None), VectorizedFixedVolumeCalcHandler(None))
+
+    def test_zero_concentration_raises_as_when_calculating_one_at_a_time(self):
+        transfers, _ = self.create_transfer_lists(1)
+        transfers[0].source_conc = 0
+        transfers[0].source_location = MagicMock()
+        transfers[0].source_location.artifact.is_control = False
+        handler = VectorizedOneToOneConcentrationCalcHandler(None)
+        self.assertRaises(ZeroDivisionError, handler.handle_batch, MagicMock(transfers=transfers),
+                          None, self.robot_settings)
+
+    def test_missing_concentration_raises_as_when_calculating_one_at_a_time(self):
+        transfers, vectorized_transfers = self.create_transfer_lists(2)
+        for transfer in transfers + vectorized_transfers:
+            transfer.source_location = MagicMock()
+            transfer.source_location.artifact.is_control = False
+        transfers[1].source_conc = None
+        vectorized_transfers[1].source_conc = None
+        self.assertRaises(TypeError, OneToOneConcentrationCalcHandler(None).handle_transfer,
+                          transfers[1], None, self.robot_settings)
+        handler = VectorizedOneToOneConcentrationCalcHandler(None)
+        self.assertRaises(TypeError, handler.handle_batch, MagicMock(transfers=vectorized_transfers),
+                          None, self.robot_settings)
+        # Nothing is written back to the transfers
+        self.assertEqual(transfers[0].pipette_sample_volume, vectorized_transfers[0].pipette_sample_volume)
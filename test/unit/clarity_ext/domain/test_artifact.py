@@ -21,7 +21,17 @@ class TestArtifact(unittest.TestCase):
             artifact.is_input = False
             artifact.any_patch = "13370"
 
-        self.assertEqual(artifacts[0], artifacts[1])
+        self.assertTrue(artifacts[0].deep_equals(artifacts[1]))
+        # Without ids, two instances are different artifacts
+        self.assertNotEqual(artifacts[0], artifacts[1])
+
+    def test_artifacts_with_same_id_are_equal(self):
+        first = fake_analyte("cont-id1", "art-id1", "sample1", "art-name1", "D:5", True)
+        second = fake_analyte("cont-id1", "art-id1", "sample1", "renamed", "D:5", True)
+        self.assertEqual(first, second)
+        self.assertEqual(hash(first), hash(second))
+        self.assertEqual(1, len({first, second}))
+        self.assertFalse(first.deep_equals(second))
 
     def test_artifact_should_not_equal_non_artifact(self):
         artifact = Artifact()
@@ -41,7 +51,7 @@ class TestArtifact(unittest.TestCase):
             ]
 
         analytes = two_identical_analytes()
-        self.assertEqual(analytes[0], analytes[1])
+        self.assertTrue(analytes[0].deep_equals(analytes[1]))
 
     def test_inequality_including_mutual_references(self):
         """
@@ -58,6 +68,7 @@ class TestArtifact(unittest.TestCase):
 
         analytes = two_identical_analytes()
         self.assertNotEqual(analytes[0], analytes[1])
+        self.assertFalse(analytes[0].deep_equals(analytes[1]))
 
     def test_unit_conversion(self):
         artifact = fake_result_file("id", "name", "container-id", "A:1", True, {"Test": 10})
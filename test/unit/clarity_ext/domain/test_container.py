@@ -0,0 +1,93 @@
+import copy
+import unittest
+from mock import MagicMock
+from clarity_ext.domain import Container, ContainerPosition, Well
+
+
+class TestContainer(unittest.TestCase):
+
+    def setUp(self):
+        self.artifact = MagicMock(name="artifact")
+        self.other = MagicMock(name="other")
+
+    def test_built_in_geometries(self):
+        for container_type, count in [(Container.CONTAINER_TYPE_96_WELLS_PLATE, 96),
+                                      (Container.CONTAINER_TYPE_384_WELLS_PLATE, 384),
+                                      (Container.CONTAINER_TYPE_1536_WELLS_PLATE, 1536),
+                                      (Container.CONTAINER_TYPE_TUBE, 1),
+                                      (Container.CONTAINER_TYPE_24_TUBE_RACK, 24),
+                                      (Container.CONTAINER_TYPE_48_TUBE_RACK, 48),
+                                      (Container.CONTAINER_TYPE_96_TUBE_RACK, 96)]:
+            container = Container(container_type=container_type)
+            self.assertEqual(count, len(container.wells))
+            self.assertEqual(count, len(container.list_wells()))
+
+    def test_wells_have_the_read_only_dict_methods(self):
+        container = Container(container_type=Container.CONTAINER_TYPE_96_WELLS_PLATE)
+        container["B:2"] = self.artifact
+        wells = container.wells
+        self.assertTrue(wells.get((2, 2)).artifact is self.artifact)
+        self.assertEqual(None, wells.get((9, 1)))
+        self.assertEqual(None, wells.get("not a position"))
+        self.assertTrue(wells.has_key((8, 12)))
+        self.assertFalse(wells.has_key((8, 13)))
+        self.assertEqual(96, len(list(wells.iteritems())))
+        self.assertEqual(wells.keys(), list(wells.iterkeys()))
+        self.assertEqual([self.artifact], [well.artifact for well in wells.itervalues() if well.artifact])
+
+    def test_rows_after_z_have_two_letters(self):
+        container = Container(container_type=Container.CONTAINER_TYPE_1536_WELLS_PLATE)
+        self.assertEqual("AF", list(container.rows)[-1])
+        container["AF:48"] = self.artifact
+        self.assertTrue(container[(32, 48)].artifact is self.artifact)
+        self.assertEqual("AF:48", repr(container[(32, 48)].position))
+
+    def test_wells_are_created_on_access(self):
+        container = Container(container_type=Container.CONTAINER_TYPE_384_WELLS_PLATE)
+        container["P:24"] = self.artifact
+        self.assertEqual(1, len(container._wells))
+        self.assertTrue(container[(16, 24)] is container.wells[(16, 24)])
+        self.assertEqual([self.artifact], [well.artifact for well in container.occupied])
+        self.assertTrue(self.artifact.well is container[(16, 24)])
+
+    def test_traversal_order(self):
+        container = Container(container_type=Container.CONTAINER_TYPE_384_WELLS_PLATE)
+        down = [repr(well.position) for well in container.enumerate_wells(Container.DOWN_FIRST)]
+        right = [repr(well.position) for well in container.enumerate_wells(Container.RIGHT_FIRST)]
+        self.assertEqual(["A:1", "B:1"], down[:2])
+        self.assertEqual(["A:1", "A:2"], right[:2])
+        self.assertEqual("P:24", down[-1])
+
+    def test_position_outside_of_container(self):
+        container = Container(container_type=Container.CONTAINER_TYPE_96_WELLS_PLATE)
+        self.assertRaises(KeyError, container.set_well, "I:1", "artifact")
+        self.assertFalse((9, 1) in container)
+        self.assertTrue((8, 12) in container)
+
+    def test_copy_has_own_storage(self):
+        original = Container(container_type=Container.CONTAINER_TYPE_96_WELLS_PLATE)
+        original["A:1"] = self.artifact
+        copied = copy.copy(original)
+        copied["A:1"] = self.other
+        copied.wells[(1, 2)].artifact = self.artifact
+        self.assertTrue(original["A:1"].artifact is self.artifact)
+        self.assertEqual(None, original["A:2"].artifact)
+        self.assertTrue(copied["A:1"].artifact is self.other)
+
+    def test_standalone_well_keeps_its_artifact(self):
+        container = Container(container_type=Container.CONTAINER_TYPE_96_WELLS_PLATE)
+        well = Well(ContainerPosition.create("A:1"), container, "artifact")
+        self.assertEqual("artifact", well.artifact)
+        self.assertEqual(None, container["A:1"].artifact)
+
+    def test_wells_are_equal_by_position(self):
+        container = Container(container_id="cont-id1", container_type=Container.CONTAINER_TYPE_96_WELLS_PLATE)
+        copied = copy.copy(container)
+        self.assertEqual(container, copied)
+        self.assertEqual(container["A:1"], copied["A:1"])
+        self.assertEqual(hash(container["A:1"]), hash(copied["A:1"]))
+        self.assertNotEqual(container["A:1"], container["A:2"])
+
+
+if __name__ == "__main__":
+    unittest.main()
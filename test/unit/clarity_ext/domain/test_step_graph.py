@@ -0,0 +1,39 @@
+import unittest
+from test.unit.clarity_ext import helpers
+from clarity_ext.domain import Analyte, ResultFile
+from clarity_ext.domain.step_graph import StepGraph
+
+
+class TestStepGraph(unittest.TestCase):
+
+    def setUp(self):
+        self.pairs = helpers.two_containers_artifact_set()
+        self.graph = StepGraph(self.pairs)
+
+    def test_pairs_are_kept_in_order(self):
+        self.assertEqual(self.pairs, self.graph.pairs)
+
+    def test_lookup_by_id(self):
+        self.assertTrue(self.graph.input_by_id("art-id2") is self.pairs[1][0])
+        self.assertTrue(self.graph.output_by_id("art-id2") is self.pairs[1][1])
+        self.assertRaises(KeyError, self.graph.output_by_id, "unknown")
+
+    def test_lookup_by_container_and_sample(self):
+        self.assertEqual(["art-id2", "art-id3", "art-id4"],
+                         [artifact.id for artifact in self.graph.artifacts_in_container("cont-id2")])
+        self.assertEqual([self.pairs[0][0], self.pairs[0][1]], self.graph.artifacts_by_sample("sample1"))
+
+    def test_containers_are_unique(self):
+        self.assertEqual(["cont-id1", "cont-id2"], [c.id for c in self.graph.input_containers])
+        self.assertEqual(["cont-id3", "cont-id4"], [c.id for c in self.graph.output_containers])
+
+    def test_lookup_by_type(self):
+        self.assertEqual(4, len(self.graph.outputs_of_type(Analyte)))
+        self.assertEqual([], self.graph.outputs_of_type(ResultFile))
+        self.assertEqual(4, len(self.graph.pairs_of_type(Analyte)))
+
+    def test_returned_lists_do_not_change_the_graph(self):
+        self.graph.outputs.pop()
+        self.graph.outputs_of_type(Analyte).pop()
+        self.assertEqual(4, len(self.graph.outputs))
+        self.assertEqual(4, len(self.graph.outputs_of_type(Analyte)))
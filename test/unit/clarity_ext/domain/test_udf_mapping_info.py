@@ -1,7 +1,9 @@
+import copy
 import unittest
+import cPickle as pickle
 from clarity_ext.domain.udf import UdfMapping
 from clarity_ext.domain import ResultFile, Analyte, SharedResultFile, Process
-from clarity_ext.domain.udf import UdfMappingNotUniqueException
+from clarity_ext.domain.udf import UdfMappingNotUniqueException, DirtyRegistry, _UdfAccessor
 
 
 class TestUdfMappingInfo(unittest.TestCase):
@@ -88,10 +90,10 @@ class TestUdfMappingInfo(unittest.TestCase):
         # that the equality test actually takes this into account
         result_file1 = ResultFile(None, False, "abc", udf_map=self._get_unique_udf_mapping())
         result_file2 = ResultFile(None, False, "abc", udf_map=self._get_unique_udf_mapping())
-        self.assertEqual(result_file1, result_file2, "Objects should equal before changing them")
+        self.assertTrue(result_file1.deep_equals(result_file2), "Objects should equal before changing them")
 
         result_file2.udf_total *= 2
-        self.assertNotEqual(result_file1, result_file2)
+        self.assertFalse(result_file1.deep_equals(result_file2))
 
     def test_can_change_udfs_by_original(self):
         """
@@ -104,6 +106,81 @@ class TestUdfMappingInfo(unittest.TestCase):
         result_file1.udf_map["% Total"].value *= 2
         result_file1.udf_total == original * 2
 
+    def test_mappings_with_same_udfs_share_schema(self):
+        first = self._get_unique_udf_mapping()
+        second = self._get_unique_udf_mapping()
+        self.assertTrue(first.schema is second.schema)
+        second["udf_total"] = 30
+        self.assertEqual(10, first["udf_total"].value)
+
+        # Adding a UDF gives the mapping another schema, without changing the shared one
+        second.add("Volume", 20)
+        self.assertFalse(first.schema is second.schema)
+        self.assertFalse("udf_volume" in first)
+        self.assertEqual(30, second["udf_total"].value)
+        self.assertEqual(20, second["udf_volume"].value)
+
+    def test_schema_is_shared_after_pickling(self):
+        mapping = self._get_unique_udf_mapping()
+        self.assertTrue(pickle.loads(pickle.dumps(mapping, 2)).schema is mapping.schema)
+
+    def test_only_written_values_are_examined(self):
+        mapping = self._get_unique_udf_mapping()
+        self.assertEqual(dict(), mapping._written)
+        mapping["udf_total"] = 20
+        mapping["Conc."] = 0.5
+        self.assertEqual(["% Total"], [udf_info.key for udf_info in mapping.enumerate_updated()])
+
+        mapping["% Total"].set_clean()
+        self.assertFalse(mapping.is_dirty())
+        self.assertEqual(["Conc."], list(mapping._written))
+
+    def test_changed_objects_are_registered(self):
+        registry = DirtyRegistry()
+        changed = ResultFile(None, False, "art-1", udf_map=self._get_unique_udf_mapping())
+        unchanged = ResultFile(None, False, "art-2", udf_map=self._get_unique_udf_mapping())
+        for result_file in [changed, unchanged]:
+            result_file.udf_map.track(result_file, registry)
+
+        changed.udf_total = 20
+        self.assertEqual([changed], registry.enumerate_dirty())
+        changed.udf_total = 10
+        self.assertEqual([], registry.enumerate_dirty())
+
+    def test_udfs_are_read_through_accessors(self):
+        analyte = Analyte(None, True, "art-1", udf_map=self._get_unique_udf_mapping())
+        self.assertTrue(type(analyte) is Analyte)
+        self.assertTrue(isinstance(Analyte.udf_total, _UdfAccessor))
+        self.assertEqual(10, analyte.udf_total)
+        analyte.udf_total = 20
+        self.assertEqual(20, analyte.udf_total)
+
+        # UDFs added after the accessors were added are still available
+        analyte.udf_map.add("Volume", 5)
+        self.assertEqual(5, analyte.udf_volume)
+        self.assertEqual(20, analyte.udf_total)
+
+    def test_accessors_only_read_the_udfs_of_the_object(self):
+        with_conc = Analyte(None, True, "art-1", udf_map=self._get_unique_udf_mapping())
+        without_conc = Analyte(None, True, "art-2", udf_map=UdfMapping({"% Total": 30}))
+        non_unique = Analyte(None, True, "art-3", udf_map=self._get_non_unique_udf_mapping())
+        self.assertEqual(0.5, with_conc.udf_conc)
+        self.assertEqual(30, without_conc.udf_total)
+        self.assertRaises(AttributeError, getattr, without_conc, "udf_conc")
+        self.assertRaises(UdfMappingNotUniqueException, getattr, non_unique, "udf_total")
+
+    def test_objects_with_accessors_can_be_copied(self):
+        analyte = Analyte(None, True, "art-1", udf_map=self._get_unique_udf_mapping())
+        for copied in [copy.copy(analyte), pickle.loads(pickle.dumps(analyte, 2))]:
+            self.assertTrue(type(copied) is Analyte)
+            self.assertEqual(analyte, copied)
+            self.assertEqual(10, copied.udf_total)
+
+    def test_differing_fields_of_objects_with_different_udfs(self):
+        first = Analyte(None, True, "art-1", name="analyte", udf_map=self._get_unique_udf_mapping())
+        second = Analyte(None, True, "art-1", name="analyte", udf_map=UdfMapping({"Volume": 5}))
+        self.assertEqual(["udf_map"], first.differing_fields(second))
+
     @staticmethod
     def _get_non_unique_udf_mapping():
         original = {"% Total": 10,
@@ -0,0 +1,74 @@
+import unittest
+from test.unit.clarity_ext import helpers
+from clarity_ext.domain.udf_table import UdfTable
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class TestUdfTable(unittest.TestCase):
+
+    def setUp(self):
+        self.artifacts = [
+            helpers.fake_result_file("art-id1", "art-name1", "cont-id1", "A:1", False,
+                                     udfs={"Concentration": 10.0, "Volume": 20.0}),
+            helpers.fake_result_file("art-id2", "art-name2", "cont-id1", "B:1", False,
+                                     udfs={"Concentration": 30.0, "Volume": 40.0}),
+            helpers.fake_result_file("art-id3", "art-name3", "cont-id2", "A:2", False,
+                                     udfs={"Concentration": 50.0, "Volume": 60.0}),
+        ]
+        self.table = UdfTable(self.artifacts, ["Concentration", "udf_volume", "Missing"])
+
+    def test_columns(self):
+        self.assertEqual(len(self.artifacts), len(self.table))
+        self.assertEqual([artifact.id for artifact in self.artifacts], self.table.ids)
+        self.assertEqual([artifact.container.id for artifact in self.artifacts], self.table.container_ids)
+        self.assertEqual([artifact.well.index_down_first for artifact in self.artifacts], self.table.well_indexes)
+        self.assertEqual([1, 2, 9], self.table.well_indexes)
+        self.assertEqual([10.0, 30.0, 50.0], self.table.column("Concentration"))
+        self.assertEqual([20.0, 40.0, 60.0], self.table.column("udf_volume"))
+        self.assertEqual([None] * len(self.artifacts), self.table.column("Missing"))
+
+    def test_write_only_updates_changed_values(self):
+        values = self.table.column("Concentration")
+        values[0] *= 2
+        self.assertEqual(1, self.table.write("Concentration", values))
+        self.assertEqual(values[0], self.artifacts[0].udf_concentration)
+        self.assertEqual(["Concentration"], [udf_info.key for udf_info in self.artifacts[0].udf_map.enumerate_updated()])
+        self.assertFalse(any(artifact.is_dirty() for artifact in self.artifacts[1:]))
+
+    def test_write_compares_with_the_current_values_of_the_artifacts(self):
+        values = self.table.column("Concentration")
+        self.artifacts[0].udf_concentration = 99.0
+        self.assertEqual(1, self.table.write("Concentration", values))
+        self.assertEqual(10.0, self.artifacts[0].udf_concentration)
+        self.assertEqual(values, self.table.column("Concentration"))
+
+    def test_write_requires_one_value_per_artifact(self):
+        self.assertRaises(ValueError, self.table.write, "Concentration", [1])
+
+    def test_write_to_udf_missing_on_an_artifact_updates_nothing(self):
+        artifacts = self.artifacts + [helpers.fake_result_file("art-id4", "art-name4", "cont-id2", "B:2", False,
+                                                               udfs={"Volume": 80.0})]
+        table = UdfTable(artifacts, ["Concentration"])
+        self.assertRaises(AttributeError, table.write, "Concentration", [1.0, 2.0, 3.0, 4.0])
+        self.assertFalse(any(artifact.is_dirty() for artifact in artifacts))
+        self.assertEqual([10.0, 30.0, 50.0, None], table.column("Concentration"))
+
+        # Values that don't change anything are not written, so None can be written to the artifact without it
+        self.assertEqual(3, table.write("Concentration", [1.0, 2.0, 3.0, None]))
+        self.assertEqual([1.0, 2.0, 3.0, None], table.column("Concentration"))
+
+    @unittest.skipIf(numpy is None, "numpy is not installed")
+    def test_vectorized_calculation(self):
+        arrays = self.table.to_arrays()
+        self.assertTrue(numpy.isnan(arrays["Missing"]).all())
+        self.table.write("Concentration", arrays["Concentration"] / 2)
+        self.assertEqual(self.table.column("Concentration")[0], self.artifacts[0].udf_concentration)
+        self.assertTrue(type(self.artifacts[0].udf_concentration) is float)
+
+        structured = self.table.to_structured_array()
+        self.assertEqual(self.table.ids, list(structured["id"]))
+        self.assertEqual(self.table.column("Concentration"), list(structured["Concentration"]))
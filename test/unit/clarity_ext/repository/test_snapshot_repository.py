@@ -0,0 +1,75 @@
+import os
+import shutil
+import tempfile
+import unittest
+from mock import MagicMock
+from genologics.entities import Artifact as ArtifactResource, File as FileResource
+from xml.etree import ElementTree
+from clarity_ext.domain import Container, Analyte
+from clarity_ext.domain.container import ContainerPosition
+from clarity_ext.domain.shared_result_file import SharedResultFile
+from clarity_ext.domain.udf import UdfMapping
+from clarity_ext.repository.snapshot_repository import StepSnapshot, SnapshotLims, SnapshotError, \
+    SnapshotStepRepository, SnapshotFileRepository
+
+BASEURI = "https://lims.example.com"
+
+
+class TestStepSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "step.snapshot")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_artifacts_are_restored_with_resources(self):
+        snapshot = self._capture()
+        snapshot.save(self.path)
+        loaded = StepSnapshot.load(self.path)
+
+        api = loaded.create_api()
+        repo = SnapshotStepRepository(loaded, MagicMock(api=api), None)
+        analyte, shared_file = [output for _, output in repo.all_artifacts()]
+        self.assertEqual("analyte1", analyte.name)
+        self.assertEqual(10, analyte.udf_map["Conc. Current (ng/ul)"].value)
+        self.assertEqual("A:1", repr(analyte.well.position))
+        self.assertTrue(analyte.well.container.wells[ContainerPosition(1, 1)].artifact is analyte)
+
+        # The REST resource is restored from the snapshot and shared with other objects
+        self.assertTrue(analyte.api_resource is api.cache[analyte.api_resource.uri])
+        self.assertEqual("analyte1", analyte.api_resource.name)
+
+        file_repo = SnapshotFileRepository(loaded, None)
+        self.assertEqual(b"content", file_repo.get_remote_file_content(shared_file.files[0].id))
+
+    def test_requests_raise(self):
+        snapshot = self._capture()
+        api = snapshot.create_api()
+        self.assertRaises(SnapshotError, api.get, BASEURI + "/api/v2/artifacts/2-2")
+        self.assertRaises(SnapshotError, api.put_batch, [api.cache[BASEURI + "/api/v2/artifacts/2-1"]])
+
+    def test_invalid_file_raises(self):
+        with open(self.path, "wb") as fs:
+            fs.write(b"not a snapshot")
+        self.assertRaises(SnapshotError, StepSnapshot.load, self.path)
+
+    def _capture(self):
+        live_api = SnapshotLims(BASEURI)
+        resource = ArtifactResource(live_api, id="2-1")
+        resource.root = ElementTree.fromstring('<artifact><name>analyte1</name></artifact>')
+        container = Container(container_type=Container.CONTAINER_TYPE_96_WELLS_PLATE, container_id="27-1")
+        analyte = Analyte(api_resource=resource, is_input=False, id="2-1", name="analyte1",
+                          udf_map=UdfMapping({"Conc. Current (ng/ul)": 10}))
+        container.set_well("A:1", analyte)
+
+        file_resource = FileResource(live_api, uri=BASEURI + "/api/v2/files/40-1")
+        shared_file = SharedResultFile(api_resource=ArtifactResource(live_api, id="92-1"), id="92-1",
+                                       name="Step log", files=[file_resource])
+
+        session = MagicMock(api=live_api, current_step_id="24-1")
+        step_repo = MagicMock()
+        step_repo.all_artifacts.return_value = [(None, analyte), (None, shared_file)]
+        file_repo = MagicMock()
+        file_repo.get_remote_file_content.return_value = b"content"
+        return StepSnapshot.capture(session, step_repo, file_repo)
@@ -65,3 +65,7 @@ class TestArtifactService(unittest.TestCase):
         clarity_svc = ClarityService(MagicMock(), MagicMock(), MagicMock())
         clarity_svc.update([outp])
         clarity_svc.step_repository.update_artifacts.assert_called_once()
+
+    def test_output_file_by_id_raises_value_error_for_unknown_id(self):
+        svc = helpers.mock_two_containers_artifact_service()
+        self.assertRaises(ValueError, svc.output_file_by_id, "unknown-id")
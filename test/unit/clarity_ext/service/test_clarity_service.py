@@ -0,0 +1,78 @@
+import threading
+import unittest
+import requests
+from mock import MagicMock
+from test.unit.clarity_ext import helpers
+from clarity_ext.service import ClarityService
+from clarity_ext.domain.udf import UdfMapping
+
+
+class TestClarityService(unittest.TestCase):
+
+    def setUp(self):
+        self.artifacts = [output for _, output in helpers.two_containers_artifact_set()]
+        self.svc = ClarityService(MagicMock(), MagicMock(), MagicMock(), chunk_size=3)
+        self.svc.RETRY_DELAY = 0
+
+    def test_only_changed_artifacts_are_updated_in_chunks(self):
+        for artifact in self.artifacts:
+            artifact.udf_target_conc_ngul = 50
+        self.artifacts[0].name = "renamed"
+        self.svc.update(self.artifacts + [helpers.two_containers_artifact_set()[0][1]])
+
+        chunks = [call[0][0] for call in self.svc.step_repository.update_artifacts.call_args_list]
+        self.assertEqual([1, 3], sorted(len(chunk) for chunk in chunks))
+        self.assertEqual("renamed", self.artifacts[0].api_resource.name)
+
+    def test_chunks_are_sent_from_the_calling_thread_by_default(self):
+        threads = list()
+        self.svc.step_repository.update_artifacts.side_effect = lambda _: threads.append(threading.current_thread())
+        for artifact in self.artifacts:
+            artifact.udf_target_conc_ngul = 50
+        self.svc.update(self.artifacts)
+        self.assertEqual([threading.current_thread()] * 2, threads)
+
+    def test_committed_changes_are_not_sent_again(self):
+        self.artifacts[0].udf_target_conc_ngul = 50
+        self.svc.update(self.artifacts)
+        self.svc.update(self.artifacts)
+        self.svc.step_repository.update_artifacts.assert_called_once()
+
+    def test_transient_errors_are_retried(self):
+        self.artifacts[0].udf_target_conc_ngul = 50
+        self.svc.step_repository.update_artifacts.side_effect = [requests.exceptions.ConnectionError(), None]
+        self.svc.update(self.artifacts)
+        self.assertEqual(2, self.svc.step_repository.update_artifacts.call_count)
+
+    def test_failed_chunk_is_reverted(self):
+        artifact = self.artifacts[0]
+        artifact.api_resource.name = "original"
+        artifact.name = "renamed"
+        self.svc.step_repository.update_artifacts.side_effect = ValueError()
+        self.assertRaises(ValueError, self.svc.update, [artifact])
+        self.assertEqual("original", artifact.api_resource.name)
+        self.assertNotEqual(artifact.name, artifact.original_name)
+        self.assertEqual(1, self.svc.step_repository.update_artifacts.call_count)
+
+    def test_samples_and_containers_are_updated_in_batches(self):
+        container = self.artifacts[0].container
+        container.api_resource = MagicMock()
+        container.name = "renamed"
+        sample = self.artifacts[0].samples[0]
+        sample.udf_map = UdfMapping({"Sample UDF": 1})
+        sample.udf_sample_udf = 2
+        self.svc.clarity_mapper.get_resource.return_value = MagicMock()
+
+        self.svc.update([container, sample])
+
+        updated = [call[0][0] for call in self.svc.clarity_repository.update_batch.call_args_list]
+        self.assertEqual([[self.svc.clarity_mapper.get_resource.return_value], [container.api_resource]],
+                         updated)
+        self.assertEqual("renamed", container.api_resource.name)
+
+    def test_ignored_commits_are_logged(self):
+        self.artifacts[0].udf_target_conc_ngul = 50
+        self.svc.logger = MagicMock()
+        self.svc.update(self.artifacts, ignore_commit=True)
+        self.svc.step_repository.update_artifacts.assert_not_called()
+        self.assertIn("Target conc. (ng/ul)=50", self.svc.logger.info.call_args[0][0])
@@ -2,7 +2,14 @@ import unittest
 from mock import MagicMock
 from clarity_ext.domain.artifact import Artifact
 import os
-from clarity_ext.service.file_service import UploadFileService
+from io import BytesIO
+from StringIO import StringIO
+from clarity_ext.service.file_service import UploadFileService, Csv, CsvTable, FileService, iterparse_elements
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 
 class TestUploadFileService(unittest.TestCase):
@@ -11,7 +18,7 @@ class TestUploadFileService(unittest.TestCase):
         artifact_service = MagicMock()
         shared_files = [fake_artifact(
             "art1", "Handle Name 1"), fake_artifact("art2", "Handle Name 2")]
-        artifact_service.shared_files = MagicMock(return_value=shared_files)
+        artifact_service.shared_files_by_name = lambda name: [f for f in shared_files if f.name == name]
         os_service = MagicMock()
         upload_file_service = UploadFileService(
             os_service=os_service, artifact_service=artifact_service)
@@ -19,6 +26,115 @@ class TestUploadFileService(unittest.TestCase):
         os_service.attach_file_for_epp.assert_called_with(".{sep}file2.txt".format(sep=os.sep),
                                                           shared_files[1])
 
+    def test_upload_csv_writes_it_to_the_file(self):
+        os_service = MagicMock()
+        written = StringIO()
+        os_service.open_file.return_value.__enter__.return_value = written
+        upload_file_service = UploadFileService(os_service=os_service, artifact_service=MagicMock())
+        csv = Csv(delim=";")
+        csv.set_header(["a", "b"])
+        csv.set_row_source(lambda: iter([([1, 2], None), ([3, 4], None)]))
+        upload_file_service.save_locally(csv, "file.csv")
+        self.assertEqual("a;b\n1;2\n3;4", written.getvalue())
+
+
+class TestCsv(unittest.TestCase):
+
+    def test_lines_are_created_from_row_source_when_accessed(self):
+        sources = list()
+
+        def rows():
+            sources.append(1)
+            return iter([([1, 2], "first"), ([3, 4], "second")])
+
+        csv = Csv()
+        csv.set_header(["a", "b"])
+        csv.set_row_source(rows)
+        self.assertEqual("a,b\n1,2\n3,4", csv.to_string())
+        self.assertEqual(1, len(sources))
+
+        csv.data[1]["b"] = 5
+        csv.append([6, 7])
+        self.assertEqual(["first", "second", None], [line.tag for line in csv])
+        self.assertEqual("1,2\n3,5\n6,7", csv.to_string(include_header=False))
+        self.assertEqual(2, len(sources))
+
+
+class TestCsvTable(unittest.TestCase):
+
+    CONTENT = ('Well;Sample;"Conc; ng/ul";Volume\r\n'
+               'A1;"Sample, 1";1.5;10\r\n'
+               'B1;Sample 2;;20\r\n')
+
+    def read(self, **kwargs):
+        return CsvTable.read(StringIO(self.CONTENT), delimiter=";", **kwargs)
+
+    def test_quoted_values(self):
+        table = self.read()
+        self.assertEqual(["Well", "Sample", "Conc; ng/ul", "Volume"], table.header)
+        self.assertEqual(2, len(table))
+        self.assertEqual(["Sample, 1", "Sample 2"], table.column("Sample"))
+
+    def test_selected_columns_with_types(self):
+        table = self.read(columns=["Volume", "Conc; ng/ul"], types={"Conc; ng/ul": float, "Volume": int})
+        self.assertEqual(["Volume", "Conc; ng/ul"], table.header)
+        self.assertEqual([{"Volume": 10, "Conc; ng/ul": 1.5}, {"Volume": 20, "Conc; ng/ul": None}], list(table))
+        self.assertEqual({"Volume": 20, "Conc; ng/ul": None}, table.row(1))
+
+    def test_short_rows_are_padded_and_empty_rows_skipped(self):
+        table = CsvTable.read(StringIO("Well;Sample;Volume\r\nA1;Sample 1\r\n\r\nB1;Sample 2;20\r\n"), delimiter=";")
+        self.assertEqual(["", "20"], table.column("Volume"))
+        self.assertEqual(["A1", "B1"], table.column("Well"))
+
+    def test_missing_column_raises(self):
+        self.assertRaises(ValueError, self.read, columns=["Well", "Position"])
+
+    def test_invalid_value_raises(self):
+        self.assertRaises(ValueError, self.read, types={"Sample": float})
+
+    @unittest.skipIf(numpy is None, "numpy is not installed")
+    def test_to_array(self):
+        table = self.read(types={"Conc; ng/ul": float})
+        array = table.to_array("Conc; ng/ul")
+        self.assertEqual(1.5, array[0])
+        self.assertTrue(numpy.isnan(array[1]))
+
+
+class TestIterparseXml(unittest.TestCase):
+
+    CONTENT = ('<?xml version="1.0"?>'
+               '<Run xmlns="http://example.com/run">'
+               '<Plate id="p1"><Well pos="A1"><Value>1.5</Value></Well><Well pos="B1"><Value>2</Value></Well></Plate>'
+               '<Summary><Well pos="A1"/></Summary>'
+               '</Run>')
+
+    def elements(self, path):
+        return [(element.get("pos"), element.findtext("{*}Value"))
+                for element in iterparse_elements(StringIO(self.CONTENT), path)]
+
+    def test_by_tag(self):
+        self.assertEqual([("A1", "1.5"), ("B1", "2"), ("A1", None)], self.elements("Well"))
+
+    def test_by_path(self):
+        self.assertEqual([("A1", "1.5"), ("B1", "2")], self.elements("Plate/Well"))
+        self.assertEqual([("A1", None)], self.elements("/Run/Summary/Well"))
+        self.assertEqual([], self.elements("/Plate/Well"))
+
+    def test_processed_elements_are_removed(self):
+        content = "<Run><Plate>{}</Plate></Run>".format("<Well><Value>1</Value></Well>" * 100)
+        previous = list()
+        for element in iterparse_elements(StringIO(content), "Well"):
+            self.assertTrue(all(len(p.getchildren()) == 0 for p in previous))
+            # Only the last processed well is still in the tree
+            self.assertTrue(len(list(element.itersiblings(preceding=True))) <= 1)
+            previous.append(element)
+        self.assertEqual(100, len(previous))
+
+    def test_file_service_yields_objectified_elements(self):
+        file_service = FileService(MagicMock(), MagicMock(), False, MagicMock())
+        values = [well.Value for well in file_service.iterparse_xml(BytesIO(self.CONTENT), "Plate/Well")]
+        self.assertEqual([1.5, 2], values)
+
 
 def fake_artifact(artifact_id, name):
     artifact = Artifact()
@@ -0,0 +1,59 @@
+import unittest
+from mock import MagicMock
+from clarity_ext.service.prefetch_service import PrefetchService, PrefetchPlan
+from clarity_ext.service.file_service import SharedFileNotFound
+
+
+class TestPrefetchService(unittest.TestCase):
+
+    def test_resources_are_fetched_in_batches(self):
+        project = fake_resource("project")
+        samples = [fake_resource("sample1", project=project), fake_resource("sample2", project=project)]
+        container = fake_resource("container", type=fake_resource("container_type"))
+        inputs = [fake_resource("input{}".format(i), samples=[sample], location=(container, "A:1"))
+                  for i, sample in enumerate(samples)]
+        outputs = [fake_resource("output{}".format(i), samples=[sample], location=(container, "B:1"))
+                   for i, sample in enumerate(samples)]
+        process = fake_resource("process", type=fake_resource("process_type"))
+        process.input_output_maps = [({"uri": i}, {"uri": o}) for i, o in zip(inputs, outputs)]
+        session = MagicMock()
+        session.current_step.api_resource = process
+
+        svc = PrefetchService(session, MagicMock(), MagicMock())
+        svc.execute(PrefetchPlan(projects=True, containers=True))
+
+        batches = [call[0][0] for call in session.api.get_batch.call_args_list]
+        self.assertEqual([inputs[0], outputs[0], inputs[1], outputs[1]], batches[0])
+        self.assertEqual(samples, batches[1])
+        self.assertEqual([container], batches[2])
+        for resource in [project, container.type, process.type]:
+            resource.get.assert_called_once_with()
+
+    def prefetch_shared_files(self, shared_files, artifacts):
+        process = fake_resource("process", type=fake_resource("process_type"))
+        process.input_output_maps = []
+        file_service = MagicMock()
+
+        def shared_file_artifact(name):
+            if name not in artifacts:
+                raise SharedFileNotFound(name)
+            return artifacts[name]
+        file_service.shared_file_artifact.side_effect = shared_file_artifact
+        svc = PrefetchService(MagicMock(), MagicMock(), file_service)
+        svc.session.current_step.api_resource = process
+        svc.execute(PrefetchPlan(shared_files=shared_files))
+        return [call[0][0] for call in file_service.local_shared_file.call_args_list]
+
+    def test_shared_files_are_downloaded(self):
+        artifacts = {"Step log": MagicMock(files=["file1"]), "Result file": MagicMock(files=["file2"])}
+        self.assertEqual(["Step log", "Result file"], self.prefetch_shared_files(["Step log", "Result file"], artifacts))
+
+    def test_empty_and_missing_shared_files_are_skipped(self):
+        # The step log has a placeholder, but nothing has been uploaded to it yet
+        artifacts = {"Step log": MagicMock(files=[]), "Result file": MagicMock(files=["file2"])}
+        downloaded = self.prefetch_shared_files(["Step log", "Not in step", "Result file"], artifacts)
+        self.assertEqual(["Result file"], downloaded)
+
+
+def fake_resource(uri, **kwargs):
+    return MagicMock(uri=uri, root=None, **kwargs)
@@ -0,0 +1,73 @@
+import logging
+import unittest
+from mock import MagicMock, patch
+from clarity_ext.service import step_logger_service
+from clarity_ext.service.step_logger_service import StepLoggerService
+
+
+class TestStepLoggerService(unittest.TestCase):
+
+    def create_logger(self, **kwargs):
+        file_service = MagicMock()
+        step_log = file_service.local_shared_file.return_value
+        logger = StepLoggerService("Step log", file_service, write_to_stdout=False, **kwargs)
+        return logger, step_log
+
+    def test_lines_are_written_in_one_write_when_flushed(self):
+        logger, step_log = self.create_logger()
+        with patch("time.time", return_value=0):
+            for ix in range(100):
+                logger.log("message {}".format(ix))
+            logger.warning("warning")
+        step_log.write.assert_not_called()
+
+        logger.flush()
+        self.assertEqual(1, step_log.write.call_count)
+        lines = step_log.write.call_args[0][0].split("\r\n")
+        self.assertEqual(102, len(lines))
+        self.assertTrue(lines[0].endswith(" - message 0"))
+        self.assertTrue(lines[100].startswith("WARNING - "))
+
+    def test_lines_are_written_when_flush_size_is_reached(self):
+        logger, step_log = self.create_logger(flush_size=100)
+        for ix in range(10):
+            logger.log("message {}".format(ix))
+        self.assertTrue(0 < step_log.write.call_count < 10)
+        logger.flush()
+        written = "".join(call[0][0] for call in step_log.write.call_args_list)
+        self.assertEqual(["message {}".format(ix) for ix in range(10)],
+                         [line.split(" - ")[-1] for line in written.split("\r\n")[:-1]])
+
+    def test_messages_are_forwarded_to_core_logger_right_away(self):
+        logger, step_log = self.create_logger()
+        logger.core_logger = MagicMock()
+        logger.error("error")
+        logger.core_logger.log.assert_called_once()
+        self.assertEqual(logging.ERROR, logger.core_logger.log.call_args[0][0])
+
+    def test_flush_flushes_loggers_created_with_get(self):
+        logger, step_log = self.create_logger()
+        other = logger.get("Other log")
+        other.info("info")
+        logger.flush()
+        step_log.write.assert_called_once()
+
+    def test_closed_logger_is_not_flushed_at_exit(self):
+        logger, step_log = self.create_logger()
+        other = logger.get("Other log")
+        logger.info("info")
+        logger.close()
+        self.assertEqual(1, step_log.write.call_count)
+        self.assertNotIn(logger, step_logger_service._open_loggers)
+        self.assertNotIn(other, step_logger_service._open_loggers)
+
+        logger.info("after cleanup")
+        other.info("after cleanup")
+        step_logger_service._flush_open_loggers()
+        self.assertEqual(1, step_log.write.call_count)
+
+    def test_open_loggers_are_flushed_at_exit(self):
+        logger, step_log = self.create_logger()
+        logger.info("info")
+        step_logger_service._flush_open_loggers()
+        step_log.write.assert_called_once()
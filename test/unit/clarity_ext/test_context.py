@@ -1,5 +1,6 @@
+import copy
 import unittest
-from test.unit.clarity_ext.helpers import mock_context
+from test.unit.clarity_ext.helpers import mock_context, fake_analyte
 
 
 class TestContext(unittest.TestCase):
@@ -22,5 +23,46 @@ class TestContext(unittest.TestCase):
         self.assertRaises(ValueError, input_should_raise)
         self.assertRaises(ValueError, output_should_raise)
 
+    def test_commit_keeps_instances_of_the_same_object(self):
+        context = mock_context()
+        first = fake_analyte(artifact_id="art1", analyte_name="a1", well_key="A:1", container_id="cont1",
+                             udfs={"Conc": 1})
+        second = fake_analyte(artifact_id="art1", analyte_name="a1", well_key="A:1", container_id="cont1",
+                              udfs={"Conc": 1})
+        first.udf_map["Conc"] = 2
+        context.update(first)
+        context.update(second)
+        context.update(first)
+        context.commit()
+        committed = context.clarity_service.update.call_args[0][0]
+        self.assertEqual(2, len(committed))
+        self.assertTrue(any(obj is first for obj in committed))
+        self.assertTrue(any(obj is second for obj in committed))
+
+    def test_commit_throws_when_the_same_object_is_changed_twice(self):
+        context = mock_context()
+        first = fake_analyte(artifact_id="art1", analyte_name="a1", well_key="A:1", container_id="cont1",
+                             udfs={"Conc": 1})
+        second = fake_analyte(artifact_id="art1", analyte_name="a1", well_key="A:1", container_id="cont1",
+                              udfs={"Conc": 1})
+        first.udf_map["Conc"] = 2
+        second.udf_map["Conc"] = 3
+        context.update(first)
+        context.update(second)
+        self.assertRaises(ValueError, context.commit)
+        context.clarity_service.update.assert_not_called()
+
+    def test_commit_allows_copies_that_share_the_changed_udfs(self):
+        context = mock_context()
+        artifact = fake_analyte(artifact_id="art1", analyte_name="a1", well_key="A:1", container_id="cont1",
+                                udfs={"Conc": 1})
+        copied = copy.copy(artifact)
+        copied.udf_map["Conc"] = 2
+        context.update(artifact)
+        context.update(copied)
+        context.commit()
+        committed = context.clarity_service.update.call_args[0][0]
+        self.assertEqual(2, len(committed))
+
     def _mock_context(self):
         return mock_context(artifact_service=mock_two_containers_artifact_service())
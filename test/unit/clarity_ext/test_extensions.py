@@ -0,0 +1,36 @@
+import os
+import shutil
+import tempfile
+import unittest
+from mock import MagicMock, patch
+from clarity_ext.extensions import ExtensionService, GeneralExtension
+from clarity_ext.utility.replay_cache import ReplayCache
+
+
+class FailingExtension(GeneralExtension):
+    def execute(self):
+        raise ValueError("Failed")
+
+    def integration_tests(self):
+        return []
+
+
+class TestExtensionService(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.old_dir = os.getcwd()
+
+    def tearDown(self):
+        os.chdir(self.old_dir)
+        ReplayCache.uninstall()
+        shutil.rmtree(self.directory)
+
+    def test_working_directory_and_cache_are_restored_when_the_extension_fails(self):
+        service = ExtensionService(lambda msg: None)
+        service.use_cache = True
+        with patch.object(service, "_get_extension", return_value=FailingExtension), \
+                patch("clarity_ext.extensions.ExtensionContext.create", return_value=MagicMock()):
+            with self.assertRaises(ValueError):
+                service._run(self.directory, "24-1234", "some.module", False, False, test_mode=True)
+        self.assertEqual(self.old_dir, os.getcwd())
+        self.assertIsNone(ReplayCache._installed)
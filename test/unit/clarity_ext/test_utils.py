@@ -1,6 +1,8 @@
+import logging
+import threading
 import unittest
 from mock import Mock
-from clarity_ext.utils import lazyprop
+from clarity_ext.utils import lazyprop, create_queue_logging
 
 
 class UsesLazyProp:
@@ -27,3 +29,26 @@ class TestUtils(unittest.TestCase):
         self.assertEqual(val1, 100)
         self.assertEqual(val1, val2)
         mock.assert_called_once()
+
+
+class TestQueueLogging(unittest.TestCase):
+
+    def test_records_are_handled_on_listener_with_arguments_merged_when_logged(self):
+        records = list()
+
+        class ListHandler(logging.Handler):
+            def emit(self, record):
+                records.append((record.getMessage(), threading.current_thread().name))
+
+        queue_handler, listener = create_queue_logging(ListHandler())
+        logger = logging.getLogger("test_queue_logging")
+        logger.propagate = False
+        logger.addHandler(queue_handler)
+        try:
+            values = ["before"]
+            logger.warning("Values: %s", values)
+            values[0] = "after"
+            listener.stop()
+        finally:
+            logger.removeHandler(queue_handler)
+        self.assertEqual([("Values: ['before']", "QueueListener")], records)
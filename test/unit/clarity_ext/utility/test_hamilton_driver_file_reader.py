@@ -4,7 +4,11 @@
 import unittest
 import os
 import inspect
-from clarity_ext.utility.hamilton_driver_file_reader import HamiltonReader, HamiltonColumnReference
+from clarity_ext.utility.hamilton_driver_file_reader import HamiltonReader, HamiltonColumnReference, HamiltonRow
+from clarity_ext import utils
+from clarity_ext.utility import testing
+from clarity_ext.service.dilution.service import DilutionSettings, RobotSettings
+from clarity_ext.service.dilution.handlers import OneToOneConcentrationCalcHandler
 
 # TODO: Move the resource file closer to the corresponding test
 DRIVER_FILE_RELATIVE_PATH = os.path.join(os.path.dirname(__file__),
@@ -114,5 +118,90 @@ class HamiltonDriverFileTests(unittest.TestCase):
         self.assertEqual(contents, "END1",
                          "Target plate pos reference not right")
 
+    def test_read_from_file(self):
+        with open(DRIVER_FILE_RELATIVE_PATH, 'r') as driverfile:
+            file_reader = HamiltonReader(driverfile)
+        self.assertEqual(self.file_reader.matrix, file_reader.matrix)
+
+    def test_parsed_rows(self):
+        self.assertEqual(HamiltonRow("SX614_T11.v1", 67, "DNA1", 4.3, 4.5, 16, "END1"),
+                         utils.single(self.file_reader.rows_by_sample("SX614_T11.v1")))
+        self.assertEqual(29, len(self.file_reader.sample_volumes))
+        self.assertEqual(4.0, self.file_reader.sample_volumes[0])
+        self.assertEqual(["SX614_T11.v1"], [row.sample for row in self.file_reader.rows_by_target_well("END1", 16)])
+        self.assertEqual(["SX614_T11.v1"], [row.sample for row in self.file_reader.rows_by_source_well("DNA1", 67)])
+
+    def test_duplicate_samples_are_all_indexed(self):
+        file_reader = HamiltonReader("S1\t1\tDNA1\t2.0\t3.0\t1\tEND1\nS1\t1\tDNA1\t2.0\t3.0\t2\tEND1\n")
+        self.assertEqual([1, 2], [row.target_well for row in file_reader.rows_by_sample("S1")])
+
+
+class HamiltonRobot(RobotSettings):
+    def __init__(self):
+        super(HamiltonRobot, self).__init__()
+        self.name = "Hamilton"
+        self.file_handle = "Hamilton"
+        self.newline = "\n"
+        self.file_ext = "txt"
+        self.delimiter = "\t"
+        self.dilution_waste_volume = 1.0
+        self.pipette_min_volume = 2.0
+        self.pipette_max_volume = 50
+        self.max_pipette_vol_for_row_split = 500
+        self.header = ["Sample", "SrcWell", "SrcPlate", "SampleVol", "BufVol", "TgtWell", "TgtPlate"]
+
+    def get_container_handle_name(self, slot):
+        return "{}{}".format("DNA" if slot.is_source else "END", slot.index + 1)
+
+    def get_index_from_well(self, well):
+        return well.index_down_first
+
+    def get_filename(self, csv, context, ix=0):
+        return "{}_{}.txt".format(self.name, ix)
+
+    def map_transfer_to_row(self, transfer):
+        return [transfer.source_location.artifact.name, self.get_index_from_well(transfer.source_location),
+                transfer.source_slot.name, transfer.pipette_sample_volume, transfer.pipette_buffer_volume,
+                self.get_index_from_well(transfer.target_location), transfer.target_slot.name]
+
+
+class HamiltonReconcileTests(unittest.TestCase):
+
+    def setUp(self):
+        helper = testing.DilutionTestDataHelper(DilutionSettings.CONCENTRATION_REF_NGUL)
+        for ix in range(10):
+            helper.create_dilution_pair([20.0, 100.0][ix % 2], 40.0, 10.0, 40.0)
+        context = testing.TestExtensionContext()
+        self.robot = HamiltonRobot()
+        dilution_settings = DilutionSettings(concentration_ref=DilutionSettings.CONCENTRATION_REF_NGUL,
+                                             volume_calc_method=DilutionSettings.VOLUME_CALC_BY_CONC)
+        session = context.context.dilution_service.create_session(
+            [self.robot], dilution_settings, None, None, None, context.context, [OneToOneConcentrationCalcHandler])
+        session.evaluate(helper.pairs)
+        self.batch = utils.single(session.transfer_batches(self.robot.name))
+
+    def test_driver_file_matches_transfers(self):
+        file_reader = HamiltonReader(self.batch.driver_file.to_string())
+        reconciliation = file_reader.reconcile(self.batch.transfers, self.robot)
+        self.assertTrue(reconciliation.ok)
+        self.assertEqual(10, len(reconciliation.matched))
+
+    def test_differences_are_reported(self):
+        lines = self.batch.driver_file.to_string().split("\n")
+        values = lines[1].split("\t")
+        values[3] = str(float(values[3]) + 1)
+        lines[1] = "\t".join(values)
+        # A transfer the robot did but wasn't expected, and one it didn't do
+        lines[2] = lines[2].replace("END1", "END2")
+
+        reconciliation = HamiltonReader("\n".join(lines)).reconcile(self.batch.transfers, self.robot)
+        self.assertFalse(reconciliation.ok)
+        self.assertEqual(8, len(reconciliation.matched))
+        key, expected, actual = utils.single(reconciliation.mismatched)
+        self.assertEqual(expected[0] + 1, actual[0])
+        self.assertEqual(1, len(reconciliation.missing))
+        self.assertEqual("END2", utils.single(reconciliation.unexpected)[2])
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,87 @@
+import os
+import shutil
+import tempfile
+import unittest
+import requests
+from requests.adapters import HTTPAdapter
+from clarity_ext.utility.replay_cache import ReplayCache, ReplayCacheFormatError
+
+
+class TestReplayCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "cache.replay")
+
+    def tearDown(self):
+        ReplayCache.uninstall()
+        shutil.rmtree(self.directory)
+
+    def test_key_is_normalized(self):
+        key1 = ReplayCache.create_key("get", "https://user:pw@Host/api/v2/artifacts?b=2&a=1")
+        key2 = ReplayCache.create_key("GET", "https://host/api/v2/artifacts?a=1&b=2")
+        self.assertEqual(key1, key2)
+        self.assertNotIn("pw", key1)
+
+    def test_key_ignores_multipart_boundary(self):
+        key1 = ReplayCache.create_key("POST", "https://host/api/v2/glsstorage", b"--abc\r\ndata\r\n--abc--",
+                                      "multipart/form-data; boundary=abc")
+        key2 = ReplayCache.create_key("POST", "https://host/api/v2/glsstorage", b"--def\r\ndata\r\n--def--",
+                                      "multipart/form-data; boundary=def")
+        self.assertEqual(key1, key2)
+
+    def test_recorded_response_is_replayed_after_reload(self):
+        request = self._request("GET", "https://host/api/v2/artifacts/2-1")
+        cache = ReplayCache(self.path)
+        cache.send(self._fake_send(b"<artifact/>" * 100), HTTPAdapter(), request)
+
+        reloaded = ReplayCache(self.path)
+        response = reloaded.send(self._failing_send, HTTPAdapter(), request)
+        self.assertEqual(b"<artifact/>" * 100, response.content)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual("application/xml", response.headers["Content-Type"])
+        self.assertEqual((1, 0), (reloaded.hits, reloaded.misses))
+
+    def test_request_headers_are_not_saved(self):
+        request = self._request("GET", "https://host/api/v2/artifacts/2-1",
+                                headers={"Authorization": "Basic c2VjcmV0"})
+        ReplayCache(self.path).send(self._fake_send(b"<artifact/>"), HTTPAdapter(), request)
+        with open(self.path, "rb") as fs:
+            self.assertNotIn(b"c2VjcmV0", fs.read())
+
+    def test_failed_responses_are_not_recorded(self):
+        request = self._request("GET", "https://host/api/v2/artifacts/2-1")
+        cache = ReplayCache(self.path)
+        cache.send(self._fake_send(b"", status_code=404), HTTPAdapter(), request)
+        self.assertEqual(0, len(cache))
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_invalid_file_raises(self):
+        with open(self.path, "wb") as fs:
+            fs.write(b"SQLite format 3")
+        self.assertRaises(ReplayCacheFormatError, ReplayCache, self.path)
+
+    def test_install_patches_and_restores_adapter(self):
+        original_send = HTTPAdapter.send
+        ReplayCache(self.path).install()
+        self.assertNotEqual(original_send, HTTPAdapter.send)
+        ReplayCache.uninstall()
+        self.assertEqual(original_send, HTTPAdapter.send)
+
+    @staticmethod
+    def _request(method, url, headers=None):
+        return requests.Request(method, url, headers=headers).prepare()
+
+    @staticmethod
+    def _fake_send(content, status_code=200):
+        def send(adapter, request, **kwargs):
+            response = requests.Response()
+            response.status_code = status_code
+            response.reason = "OK"
+            response.headers["Content-Type"] = "application/xml"
+            response._content = content
+            return response
+        return send
+
+    @staticmethod
+    def _failing_send(adapter, request, **kwargs):
+        raise AssertionError("The request should have been replayed")